@@ -0,0 +1,285 @@
+"""Transaction archival into monthly SQLite files, with daily rollups.
+
+Transactions older than ARCHIVE_AFTER_DAYS are moved out of the live
+database into one file per calendar month (transactions_2024-01.db in
+ARCHIVE_DIR), so the transactions table - and with it item pages, the
+database info page and every backup - carries only recent history.  What
+leaves is summed up first in ``transaction_rollups``, one row per item, day
+and action, so daily activity never needs an archive opened.
+``archive_partitions`` lists the monthly files with their row counts and
+when each last changed.
+
+Every batch is copied into its partition and committed there before the
+same rows are rolled up and deleted in the live database.  A crash in
+between leaves rows in both places, never in neither, and the copy is
+INSERT OR IGNORE, so the next run simply finishes the job.  Partitions are
+attached on demand, one at a time, by the queries that reach old history.
+
+    python archive.py run [--db PATH] [--dir DIR] [--days N]
+    python archive.py list
+"""
+import argparse
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+COLUMNS = ['id', 'item_id', 'action', 'quantity', 'timestamp', 'location', 'notes']
+BATCH_ROWS = 5000
+ALIAS = 'archive'
+
+PARTITION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.transactions (
+        id INTEGER PRIMARY KEY,
+        item_id TEXT,
+        action TEXT,
+        quantity INTEGER,
+        timestamp TIMESTAMP,
+        location TEXT,
+        notes TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_item_time ON transactions (item_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_timestamp ON transactions (timestamp)',
+]
+
+
+def install(conn):
+    """Create the rollup and partition catalog tables"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_rollups (
+            item_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            action TEXT NOT NULL,
+            transactions INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (item_id, day, action)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_partitions (
+            month TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+
+
+def partition_file(month):
+    return f'transactions_{month}.db'
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _next_month(month):
+    year, number = map(int, month.split('-'))
+    return f'{year + number // 12:04d}-{number % 12 + 1:02d}'
+
+
+@contextmanager
+def attached(conn, archive_dir, month, create=False):
+    """Attach one month's partition as ``archive``; yields False (and attaches
+    nothing) if its file is missing and ``create`` is not set"""
+    path = os.path.join(archive_dir, partition_file(month))
+    if not create and not os.path.exists(path):
+        yield False
+        return
+
+    # A connection abandoned mid-query (e.g. a dropped export) may still have one attached
+    if any(row[1] == ALIAS for row in conn.execute('PRAGMA database_list')):
+        conn.execute(f'DETACH DATABASE {ALIAS}')
+    conn.execute(f'ATTACH DATABASE ? AS {ALIAS}', (path,))
+    try:
+        if create:
+            for statement in PARTITION_SCHEMA:
+                conn.execute(statement.format(schema=ALIAS))
+        yield True
+    finally:
+        try:
+            conn.execute(f'DETACH DATABASE {ALIAS}')
+        except sqlite3.OperationalError:
+            pass  # a statement is still open on it; the next attach cleans up
+
+
+def archive_transactions(db_path, archive_dir, older_than_days, now=None, batch_rows=BATCH_ROWS):
+    """Move transactions older than ``older_than_days`` into monthly partitions.
+
+    Returns {month: rows moved}.  Safe to run while the app is serving and
+    from several processes at once: each batch holds the write lock only
+    for its own rollup and delete.
+    """
+    now = now or datetime.now(timezone.utc)
+    # Timestamps are stored by CURRENT_TIMESTAMP, i.e. in UTC
+    cutoff = (now - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    os.makedirs(archive_dir, exist_ok=True)
+
+    moved = {}
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)  # BEGIN/COMMIT issued by hand
+    try:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+        while True:
+            oldest = conn.execute('SELECT MIN(timestamp) FROM main.transactions WHERE timestamp < ?',
+                                  (cutoff,)).fetchone()[0]
+            if oldest is None:
+                break
+            month = str(oldest)[:7]
+            if not re.fullmatch(r'\d{4}-\d{2}', month):
+                break  # the oldest rows have a timestamp we cannot place; leave them
+            start, end = f'{month}-01 00:00:00', min(f'{_next_month(month)}-01 00:00:00', cutoff)
+
+            with attached(conn, archive_dir, month, create=True):
+                while True:
+                    count = _move_batch(conn, start, end, month, batch_rows)
+                    if not count:
+                        break
+                    moved[month] = moved.get(month, 0) + count
+            if month not in moved:
+                break
+    finally:
+        conn.close()
+    return moved
+
+
+def _move_batch(conn, start, end, month, batch_rows):
+    columns = ', '.join(COLUMNS)
+
+    # 1. Copy into the partition and make it durable there first
+    conn.execute('BEGIN')
+    try:
+        conn.execute('DELETE FROM temp.archive_batch')
+        conn.execute('''
+            INSERT INTO temp.archive_batch (id)
+            SELECT id FROM main.transactions WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp LIMIT ?
+        ''', (start, end, batch_rows))
+        conn.execute(f'''
+            INSERT OR IGNORE INTO {ALIAS}.transactions ({columns})
+            SELECT {columns} FROM main.transactions WHERE id IN (SELECT id FROM temp.archive_batch)
+        ''')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+    # 2. Roll up and delete only rows the partition now holds
+    moving = f'''id IN (SELECT id FROM temp.archive_batch)
+                 AND id IN (SELECT id FROM {ALIAS}.transactions)'''
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'''
+            INSERT INTO main.transaction_rollups (item_id, day, action, transactions, quantity)
+            SELECT COALESCE(item_id, ''), substr(timestamp, 1, 10), COALESCE(action, ''),
+                   COUNT(*), COALESCE(SUM(quantity), 0)
+            FROM main.transactions WHERE {moving}
+            GROUP BY 1, 2, 3
+            ON CONFLICT (item_id, day, action) DO UPDATE SET
+                transactions = transactions + excluded.transactions,
+                quantity = quantity + excluded.quantity
+        ''')
+        count = conn.execute(f'DELETE FROM main.transactions WHERE {moving}').rowcount
+        if count:
+            conn.execute('''
+                INSERT INTO main.archive_partitions (month, rows, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (month) DO UPDATE SET rows = rows + excluded.rows, updated_at = excluded.updated_at
+            ''', (month, count, _now()))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return count
+
+
+def partitions(conn):
+    """[(month, rows, updated_at)], oldest month first"""
+    return conn.execute('SELECT month, rows, updated_at FROM archive_partitions ORDER BY month').fetchall()
+
+
+def totals(conn):
+    """Archived transaction and partition counts for the database info page"""
+    count, rows = conn.execute('SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM archive_partitions').fetchone()
+    return {'archived_transactions': rows, 'archive_partitions': count}
+
+
+def item_months(conn, item_id, before=None, since=None, until=None):
+    """Months, newest first, whose partition holds history for ``item_id``
+    within the bounds (timestamps); found from the rollups, no file opened"""
+    sql = 'SELECT day FROM transaction_rollups WHERE item_id = ?'
+    params = [item_id]
+    if before:
+        sql += ' AND day <= ?'
+        params.append(str(before)[:10])
+    if until:
+        sql += ' AND day <= ?'
+        params.append(str(until)[:10])
+    if since:
+        sql += ' AND day >= ?'
+        params.append(str(since)[:10])
+    # Walk the primary key backwards rather than sort a DISTINCT
+    months = []
+    for (day,) in conn.execute(sql + ' ORDER BY day DESC', params):
+        if not months or months[-1] != day[:7]:
+            months.append(day[:7])
+    return months
+
+
+def each_partition(conn, archive_dir, months=None):
+    """Attach each partition in turn (oldest first, or in the order of
+    ``months``) and yield its month while it is attached as ``archive``.
+
+    Finish with the current partition's cursors before asking for the next.
+    """
+    if months is None:
+        months = [month for month, _, _ in partitions(conn)]
+    for month in months:
+        with attached(conn, archive_dir, month) as present:
+            if present:
+                yield month
+
+
+def daily_activity(conn, item_id, since=None, until=None):
+    """Per day and action: (day, action, transactions, quantity) for one item,
+    oldest first, from the rollups for archived days and the live table for
+    the rest"""
+    bounds = ''
+    params = []
+    if since:
+        bounds += ' AND day >= ?'
+        params.append(since)
+    if until:
+        bounds += ' AND day <= ?'
+        params.append(until)
+    return conn.execute(f'''
+        SELECT day, action, SUM(transactions), SUM(quantity) FROM (
+            SELECT day, action, transactions, quantity FROM transaction_rollups WHERE item_id = ?
+            UNION ALL
+            SELECT substr(timestamp, 1, 10) AS day, COALESCE(action, ''), 1, COALESCE(quantity, 0)
+            FROM transactions WHERE item_id = ?
+        ) WHERE 1=1{bounds}
+        GROUP BY day, action ORDER BY day, action
+    ''', [item_id, item_id] + params).fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old inventory transactions')
+    parser.add_argument('command', choices=['run', 'list'])
+    parser.add_argument('--db', default=os.environ.get('DATABASE_PATH', 'inventory.db'))
+    parser.add_argument('--dir', default=os.environ.get('ARCHIVE_DIR', 'archive'))
+    parser.add_argument('--days', type=int, default=int(os.environ.get('ARCHIVE_AFTER_DAYS', 365)),
+                        help='archive transactions older than this many days')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        moved = archive_transactions(args.db, args.dir, args.days)
+        for month, count in sorted(moved.items()):
+            print(f'{month}: {count} transactions archived')
+        if not moved:
+            print(f'No transactions older than {args.days} days')
+    else:
+        conn = sqlite3.connect(args.db)
+        for month, rows, updated_at in partitions(conn):
+            print(f'{month}  {rows:>10} rows  updated {updated_at}  {partition_file(month)}')
+        conn.close()
@@ -0,0 +1,431 @@
+"""Automated backups: periodic full snapshots plus small incremental ones.
+
+A full backup is a consistent copy made with the online backup API
+(backups.snapshot).  In between, an incremental backup is a small SQLite file
+holding only the items and transactions rows written since the previous
+backup, found through the trigger-maintained ``change_log`` table, together
+with the keys of rows deleted since then.  The triggers are installed by
+the first full backup, so a database that never takes automated backups
+pays nothing for them and keeps no log.  A full backup and the
+incrementals taken after it form a chain; replaying a chain in order
+rebuilds the database as it was at any backup in it.  Each entry records
+the database's restore epoch (data_version), and the first backup after a
+restore is always full: a restored change_log says nothing about the chain.
+
+catalog.json in the backup directory lists every backup in order.  The
+retention policy keeps the latest backup of each of the last N hours, days
+and weeks, plus every backup its chain needs to be replayed.
+
+    python backup_scheduler.py run [--dir DIR] [--db PATH]
+    python backup_scheduler.py once [--full]
+    python backup_scheduler.py list
+    python backup_scheduler.py restore TARGET [--until 2024-05-01T12:00:00]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import backups
+import data_version
+import migrations
+import search_index
+import stats
+import stock_history
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no cross-process locking
+    fcntl = None
+
+CATALOG_FILE = 'catalog.json'
+LOCK_FILE = '.lock'
+
+# Tables replayed by incrementals -> their primary key column
+TRACKED_TABLES = {'items': 'id', 'transactions': 'id'}
+
+# Rewritten only by archival (archive.py); an incremental taken after an
+# archive run carries them whole
+ARCHIVE_TABLES = ('transaction_rollups', 'archive_partitions')
+
+DEFAULT_RETENTION = {'hourly': 24, 'daily': 7, 'weekly': 4}
+RETENTION_BUCKETS = {'hourly': '%Y%m%d%H', 'daily': '%Y%m%d', 'weekly': '%G%V'}
+
+
+def load_catalog(backup_dir):
+    try:
+        with open(os.path.join(backup_dir, CATALOG_FILE)) as f:
+            return json.load(f)['backups']
+    except FileNotFoundError:
+        return []
+
+
+def _save_catalog(backup_dir, entries):
+    fd, tmp_path = tempfile.mkstemp(dir=backup_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'backups': entries}, f, indent=2)
+    os.replace(tmp_path, os.path.join(backup_dir, CATALOG_FILE))
+
+
+class _DirectoryLock:
+    """Exclusive lock on the backup directory, shared across processes"""
+
+    def __init__(self, backup_dir):
+        self.path = os.path.join(backup_dir, LOCK_FILE)
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def _timestamp(now):
+    return now.strftime('%Y%m%d_%H%M%S_%f')
+
+
+# Highest change_log.seq ever handed out; unlike MAX(seq) it survives trimming
+LAST_SEQ = "SELECT COALESCE((SELECT seq FROM {schema}sqlite_sequence WHERE name = 'change_log'), 0)"
+# Replaced by every restore (data_version.new_epoch); a chain never spans two epochs
+EPOCH = "SELECT version FROM {schema}data_versions WHERE name = 'epoch'"
+
+
+CHANGE_LOG_TRIGGERS = {
+    f'{table}_change_log_{event.lower()}': f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()}
+    AFTER {event} ON {table} BEGIN
+        INSERT INTO change_log (table_name, row_key) VALUES ('{table}', {row}.id);
+    END
+    '''
+    for table in TRACKED_TABLES
+    for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old'))
+}
+CHANGE_LOG_INSTALLED = ("SELECT COUNT(*) FROM {schema}sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+                        % ', '.join(f"'{name}'" for name in CHANGE_LOG_TRIGGERS))
+
+
+def log_changes(db_path):
+    """Start recording written rows in change_log (a no-op once it is)"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        for trigger in CHANGE_LOG_TRIGGERS.values():
+            conn.execute(trigger)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _trim_change_log(db_path, seq):
+    """Forget changes already captured by a backup"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute('DELETE FROM change_log WHERE seq <= ?', (seq,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def take_full(db_path, backup_dir, pages_per_step=1024, now=None):
+    """Copy the whole database into the chain and return its catalog entry"""
+    now = now or datetime.now()
+    # Before the copy: every write after it must reach change_log for the next incremental
+    log_changes(db_path)
+    snapshot_path = backups.snapshot(db_path, pages_per_step)
+    try:
+        conn = sqlite3.connect(snapshot_path)
+        try:
+            seq = conn.execute(LAST_SEQ.format(schema='')).fetchone()[0]
+            epoch = conn.execute(EPOCH.format(schema='')).fetchone()[0]
+        finally:
+            conn.close()
+        name = f'full_{_timestamp(now)}.db'
+        shutil.move(snapshot_path, os.path.join(backup_dir, name))
+    except Exception:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        raise
+
+    entry = {'file': name, 'kind': 'full', 'base': name,
+             'created': now.isoformat(timespec='seconds'), 'seq': seq, 'epoch': epoch}
+    _save_catalog(backup_dir, load_catalog(backup_dir) + [entry])
+    _trim_change_log(db_path, seq)
+    return entry
+
+
+def take_incremental(db_path, backup_dir, now=None):
+    """Save the rows changed since the last backup.
+
+    Returns the new catalog entry, or None when nothing has changed.  Falls
+    back to a full backup when there is no chain to extend yet.
+    """
+    now = now or datetime.now()
+    entries = load_catalog(backup_dir)
+    if not entries:
+        return take_full(db_path, backup_dir, now=now)
+    previous = entries[-1]
+
+    name = f'incr_{_timestamp(now)}.db'
+    tmp_path = os.path.join(backup_dir, name + '.tmp')
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute('ATTACH DATABASE ? AS incr', (tmp_path,))
+        # One read transaction: the rows copied match the change_log range exactly
+        conn.execute('BEGIN')
+        seq = conn.execute(LAST_SEQ.format(schema='main.')).fetchone()[0]
+        epoch = conn.execute(EPOCH.format(schema='main.')).fetchone()[0]
+        # A restore replaces change_log and sqlite_sequence without logging
+        # anything, so its seq can line up with the chain by coincidence; the
+        # epoch it always renews cannot (entries from before epochs were
+        # recorded have none, and start one new chain)
+        restored = epoch != previous.get('epoch') or seq < previous['seq']
+        # Writes went unlogged while the triggers were missing (a database
+        # from before logging was on demand, or one restored from such a backup)
+        restored = restored or conn.execute(
+            CHANGE_LOG_INSTALLED.format(schema='main.')).fetchone()[0] < len(CHANGE_LOG_TRIGGERS)
+        if restored or seq == previous['seq']:
+            conn.execute('ROLLBACK')
+        else:
+            changed = '''SELECT row_key FROM main.change_log
+                         WHERE table_name = ? AND seq > ? AND seq <= ?'''
+            span = (previous['seq'], seq)
+            conn.execute('CREATE TABLE incr.deleted (table_name TEXT, row_key)')
+            for table, key in TRACKED_TABLES.items():
+                conn.execute(f'CREATE TABLE incr.{table} AS SELECT * FROM main.{table} '
+                             f'WHERE {key} IN ({changed})', (table,) + span)
+                conn.execute(f'''
+                    INSERT INTO incr.deleted (table_name, row_key)
+                    SELECT DISTINCT ?, row_key FROM ({changed}) AS c
+                    WHERE NOT EXISTS (SELECT 1 FROM main.{table} t WHERE t.{key} = c.row_key)
+                ''', (table, table) + span)
+            conn.execute('CREATE TABLE incr.id_counter AS SELECT * FROM main.id_counter')
+            archived = conn.execute('SELECT MAX(updated_at) FROM main.archive_partitions').fetchone()[0]
+            if archived and archived >= previous['created'].replace('T', ' '):
+                for table in ARCHIVE_TABLES:
+                    conn.execute(f'CREATE TABLE incr.{table} AS SELECT * FROM main.{table}')
+            conn.execute('COMMIT')
+        conn.execute('DETACH DATABASE incr')
+    except Exception:
+        conn.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    conn.close()
+    if restored or seq == previous['seq']:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if restored:
+            # The database was replaced and its log no longer lines up with
+            # the chain, so start a new one
+            return take_full(db_path, backup_dir, now=now)
+        return None  # nothing changed since the last backup
+    os.replace(tmp_path, os.path.join(backup_dir, name))
+
+    entry = {'file': name, 'kind': 'incremental', 'base': previous['base'],
+             'created': now.isoformat(timespec='seconds'), 'seq': seq, 'epoch': epoch}
+    _save_catalog(backup_dir, entries + [entry])
+    _trim_change_log(db_path, seq)
+    return entry
+
+
+def _chain(entries, point):
+    """Catalog entries to replay, in order, to reach ``point``"""
+    members = [entry for entry in entries if entry['base'] == point['base']]
+    return members[:members.index(point) + 1]
+
+
+def apply_retention(backup_dir, hourly=24, daily=7, weekly=4):
+    """Delete backups no longer needed; returns the removed file names.
+
+    Keeps the newest backup of each of the last ``hourly`` hours, ``daily``
+    days and ``weekly`` ISO weeks, the latest backup overall, and every
+    earlier link those backups need to be replayed.
+    """
+    entries = load_catalog(backup_dir)
+    if not entries:
+        return []
+
+    points = {entries[-1]['file']}
+    for policy, count in (('hourly', hourly), ('daily', daily), ('weekly', weekly)):
+        newest = {}
+        for entry in entries:
+            bucket = datetime.fromisoformat(entry['created']).strftime(RETENTION_BUCKETS[policy])
+            newest[bucket] = entry['file']  # catalog is oldest first
+        for bucket in sorted(newest, reverse=True)[:count]:
+            points.add(newest[bucket])
+
+    keep = set()
+    for entry in entries:
+        if entry['file'] in points:
+            keep.update(link['file'] for link in _chain(entries, entry))
+
+    removed = [entry['file'] for entry in entries if entry['file'] not in keep]
+    _save_catalog(backup_dir, [entry for entry in entries if entry['file'] in keep])
+    for name in removed:
+        try:
+            os.remove(os.path.join(backup_dir, name))
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def restore_chain(backup_dir, target_path, until=None):
+    """Rebuild the database as of the last backup taken at or before ``until``
+    (an ISO timestamp; default: the latest backup) into ``target_path``.
+
+    Returns the catalog entry that was restored.
+    """
+    entries = load_catalog(backup_dir)
+    candidates = [entry for entry in entries
+                  if until is None or datetime.fromisoformat(entry['created']) <= datetime.fromisoformat(until)]
+    if not candidates:
+        raise ValueError('No backup found at or before the requested time')
+    point = candidates[-1]
+    chain = _chain(entries, point)
+
+    work_path = target_path + '.restoring'
+    shutil.copyfile(os.path.join(backup_dir, chain[0]['file']), work_path)
+    conn = sqlite3.connect(work_path, isolation_level=None)
+    try:
+        migrations.migrate(conn)  # the chain may predate the running schema
+        for link in chain[1:]:
+            conn.execute('ATTACH DATABASE ? AS incr', (os.path.join(backup_dir, link['file']),))
+            conn.execute('BEGIN')
+            for table, key in TRACKED_TABLES.items():
+                columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA incr.table_info({table})'))
+                conn.execute(f'INSERT OR REPLACE INTO main.{table} ({columns}) '
+                             f'SELECT {columns} FROM incr.{table}')
+                conn.execute(f'DELETE FROM main.{table} WHERE {key} IN '
+                             '(SELECT row_key FROM incr.deleted WHERE table_name = ?)', (table,))
+            conn.execute('DELETE FROM main.id_counter')
+            conn.execute('INSERT INTO main.id_counter SELECT * FROM incr.id_counter')
+            for table in ARCHIVE_TABLES:
+                if conn.execute("SELECT 1 FROM incr.sqlite_master WHERE type = 'table' AND name = ?",
+                                (table,)).fetchone():
+                    conn.execute(f'DELETE FROM main.{table}')
+                    conn.execute(f'INSERT INTO main.{table} SELECT * FROM incr.{table}')
+            conn.execute('COMMIT')
+            conn.execute('DETACH DATABASE incr')
+
+        # The replay itself was logged; a restored database starts a fresh history
+        conn.execute('DELETE FROM change_log')
+        # REPLACE skips the delete triggers that keep these in step
+        if search_index.is_installed(conn):
+            search_index.rebuild(conn)
+        stats.recompute(conn)
+        data_version.new_epoch(conn)
+        # Checkpoints come from the full backup; items deleted since must leave them too
+        stock_history.forget_deleted(conn)
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise sqlite3.DatabaseError(f'Restored database failed integrity check: {result}')
+    except Exception:
+        conn.close()
+        os.remove(work_path)
+        raise
+    conn.close()
+    os.replace(work_path, target_path)
+    return point
+
+
+class BackupScheduler:
+    """Takes a backup every ``interval`` seconds on a daemon thread.
+
+    The first backup of a chain (and one every ``full_every`` seconds after
+    that) is full; the rest are incremental.  Safe to start in every
+    gunicorn worker: runs are serialized by a lock file and skipped while
+    the latest backup is still younger than ``interval``.
+    """
+
+    def __init__(self, db_path, backup_dir, interval=3600, full_every=86400,
+                 retention=None, pages_per_step=1024):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.full_every = full_every
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.pages_per_step = pages_per_step
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, force_full=False, force=False):
+        """Take one backup if one is due; returns its catalog entry or None"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        with _DirectoryLock(self.backup_dir):
+            now = datetime.now()
+            entries = load_catalog(self.backup_dir)
+            if entries and not (force or force_full):
+                age = (now - datetime.fromisoformat(entries[-1]['created'])).total_seconds()
+                if age < self.interval:
+                    return None
+
+            fulls = [entry for entry in entries if entry['kind'] == 'full']
+            full_due = not fulls or (
+                now - datetime.fromisoformat(fulls[-1]['created'])).total_seconds() >= self.full_every
+            if force_full or full_due:
+                entry = take_full(self.db_path, self.backup_dir, self.pages_per_step, now=now)
+            else:
+                entry = take_incremental(self.db_path, self.backup_dir, now=now)
+            apply_retention(self.backup_dir, **self.retention)
+            return entry
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Automated backup failed: {e}")
+            self._stop.wait(min(self.interval, 60))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Automated inventory backups')
+    parser.add_argument('command', choices=['run', 'once', 'list', 'restore'])
+    parser.add_argument('target', nargs='?', help='restore: path of the database to create')
+    parser.add_argument('--db', default=os.environ.get('DATABASE_PATH', 'inventory.db'))
+    parser.add_argument('--dir', default=os.environ.get('BACKUP_DIR', 'automated_backups'))
+    parser.add_argument('--interval', type=int, default=int(os.environ.get('BACKUP_INTERVAL_MINUTES', 60)),
+                        help='minutes between backups')
+    parser.add_argument('--full-every', type=int, default=int(os.environ.get('BACKUP_FULL_EVERY_HOURS', 24)),
+                        help='hours between full backups')
+    parser.add_argument('--full', action='store_true', help='once: take a full backup')
+    parser.add_argument('--until', help='restore: ISO timestamp to restore to (default: latest)')
+    args = parser.parse_args()
+
+    scheduler = BackupScheduler(args.db, args.dir, interval=args.interval * 60,
+                                full_every=args.full_every * 3600)
+    if args.command == 'run':
+        scheduler.start()
+        while True:
+            time.sleep(3600)
+    elif args.command == 'once':
+        entry = scheduler.run_once(force_full=args.full, force=True)
+        print(f'Created {entry["file"]}' if entry else 'No changes since the last backup')
+    elif args.command == 'list':
+        for entry in load_catalog(args.dir):
+            print(f'{entry["created"]}  {entry["kind"]:<11}  seq {entry["seq"]:<8}  {entry["file"]}')
+    else:
+        if not args.target:
+            parser.error('restore needs a target path')
+        if os.path.exists(args.target):
+            parser.error(f'{args.target} already exists; restore into a new file')
+        entry = restore_chain(args.dir, args.target, until=args.until)
+        print(f'Restored {args.target} as of {entry["created"]} ({entry["file"]})')
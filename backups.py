@@ -0,0 +1,415 @@
+"""Consistent online backups streamed as a ZIP archive, and live restores.
+
+The live database is copied with SQLite's online backup API while holding a
+single read transaction on the source, so the copy is one consistent snapshot
+and (in WAL mode) writers carry on undisturbed.  The archive is generated on
+the fly into the HTTP response: nothing is written to a shared directory and
+the only file on disk is this request's private snapshot, removed once the
+download finishes.
+
+Restores never replace the file under running workers.  A backed-up
+inventory.db is checked, migrated to the current schema and then copied into
+the live database by the backup API in one step, which every open
+connection in every worker simply sees as a new version of the data.  The
+CSV path reloads the tables with executemany inside one write transaction
+and commits only if PRAGMA integrity_check passes.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime
+
+import archive
+import data_version
+import exporter
+import migrations
+import stats
+import stock_history
+
+COPY_BLOCK_SIZE = 1024 * 1024
+CSV_BATCH_ROWS = 1000
+INTEGER_COLUMNS = {'items': {'quantity'}, 'transactions': {'id', 'quantity'}}
+
+
+def snapshot(db_path, pages_per_step=1024):
+    """Copy ``db_path`` into a private temp file and return its path"""
+    fd, snapshot_path = tempfile.mkstemp(prefix='inventory_snapshot_', suffix='.db')
+    os.close(fd)
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        # Pin one read snapshot for every step so concurrent writes in other
+        # connections neither restart nor tear the copy
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=pages_per_step)
+        source.rollback()
+        # A standalone file is easier to restore than one that needs its -wal
+        target.execute('PRAGMA journal_mode = DELETE')
+    except Exception:
+        target.close()
+        os.remove(snapshot_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    return snapshot_path
+
+
+def discard(snapshot_path):
+    """Remove a snapshot; safe to call again once it is gone"""
+    try:
+        os.remove(snapshot_path)
+    except FileNotFoundError:
+        pass
+
+
+class ChunkBuffer:
+    """Write-only sink for ZipFile; the generator drains it between writes"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b''.join(chunks)
+
+
+def _csv_blocks(conn, sql):
+    """Yield a table as CSV-encoded byte blocks (header first)"""
+    cursor = conn.execute(sql)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([column[0] for column in cursor.description])
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        writer.writerows(rows)
+        yield output.getvalue().encode('utf-8')
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue().encode('utf-8')
+
+
+def stream_backup(snapshot_path, archive_dir=None, archives_since=None):
+    """Yield a ZIP archive of the snapshot, its CSV exports, a README and a
+    manifest.json of SHA-256 checksums.  Deletes the snapshot when done; a
+    generator that is never started (a HEAD request, a client gone before
+    the first chunk) cannot, so also discard() it when the response closes.
+
+    With ``archive_dir`` the transaction archive partitions are added under
+    archive/, except those unchanged since ``archives_since`` (the created
+    time of an earlier backup that already holds them); the manifest lists
+    every partition and whether it is included.
+    """
+    buffer = ChunkBuffer()
+    manifest = {}
+    partitions = {}
+
+    def add(zf, name, blocks):
+        digest = hashlib.sha256()
+        size = 0
+        with zf.open(name, 'w', force_zip64=True) as entry:
+            for block in blocks:
+                entry.write(block)
+                digest.update(block)
+                size += len(block)
+                data = buffer.drain()
+                if data:
+                    yield data
+        manifest[name] = {'sha256': digest.hexdigest(), 'bytes': size}
+
+    try:
+        conn = sqlite3.connect(snapshot_path)
+        try:
+            total_items = conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            total_transactions = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+            schema_version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+                with open(snapshot_path, 'rb') as f:
+                    yield from add(zf, 'inventory.db', iter(lambda: f.read(COPY_BLOCK_SIZE), b''))
+
+                yield from add(zf, 'items_backup.csv',
+                               _csv_blocks(conn, 'SELECT * FROM items ORDER BY date_added'))
+                yield from add(zf, 'transactions_backup.csv',
+                               _csv_blocks(conn, 'SELECT * FROM transactions ORDER BY timestamp'))
+
+                for month, rows, updated_at in (archive.partitions(conn) if archive_dir else []):
+                    path = os.path.join(archive_dir, archive.partition_file(month))
+                    included = os.path.exists(path) and not (archives_since and updated_at <= archives_since)
+                    partitions[month] = {'rows': rows, 'updated_at': updated_at, 'included': included}
+                    if included:
+                        partition_path = snapshot(path)
+                        try:
+                            with open(partition_path, 'rb') as f:
+                                yield from add(zf, f'archive/{archive.partition_file(month)}',
+                                               iter(lambda: f.read(COPY_BLOCK_SIZE), b''))
+                        finally:
+                            os.remove(partition_path)
+
+                created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                readme = f"""INVENTORY DATABASE BACKUP
+Created: {created}
+
+FILES INCLUDED:
+- inventory.db: SQLite database file (can be used to restore full database)
+- items_backup.csv: All inventory items in CSV format
+- transactions_backup.csv: Transaction history not yet archived, in CSV format
+- archive/: Monthly archives of older transactions (unchanged months may be left out)
+- manifest.json: SHA-256 checksum and size of every file above
+
+RESTORE INSTRUCTIONS:
+1. Replace your current inventory.db with the backed up inventory.db file
+2. Or use the CSV files to import data into a new database
+
+BACKUP STATISTICS:
+- Total Items: {total_items}
+- Total Transactions: {total_transactions}
+"""
+                yield from add(zf, 'README.txt', [readme.encode('utf-8')])
+
+                zf.writestr('manifest.json', json.dumps({
+                    'created': created,
+                    'schema_version': schema_version,
+                    'total_items': total_items,
+                    'total_transactions': total_transactions,
+                    'files': manifest,
+                    'archive_partitions': partitions,
+                }, indent=2))
+            yield buffer.drain()
+        finally:
+            conn.close()
+    finally:
+        discard(snapshot_path)
+
+
+class RestoreError(ValueError):
+    """The backup cannot be restored; the live database is left untouched"""
+
+
+def _read_manifest(zf):
+    try:
+        return json.loads(zf.read('manifest.json')).get('files', {})
+    except KeyError:
+        return {}  # backups made before manifests existed
+
+
+def _check_digest(manifest, name, digest):
+    expected = manifest.get(name, {}).get('sha256')
+    if expected and expected != digest.hexdigest():
+        raise RestoreError(f'{name} does not match the checksum in manifest.json')
+
+
+def _integrity_problem(conn):
+    result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    return None if result == 'ok' else result
+
+
+def restore_snapshot(db_path, zf):
+    """Copy the archive's inventory.db into the live database"""
+    manifest = _read_manifest(zf)
+    fd, candidate_path = tempfile.mkstemp(prefix='inventory_restore_', suffix='.db')
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as out, zf.open('inventory.db') as src:
+            for block in iter(lambda: src.read(COPY_BLOCK_SIZE), b''):
+                digest.update(block)
+                out.write(block)
+        _check_digest(manifest, 'inventory.db', digest)
+
+        candidate = sqlite3.connect(candidate_path)
+        try:
+            problem = _integrity_problem(candidate)
+            if problem:
+                raise RestoreError(f'Backup failed integrity check: {problem}')
+            if candidate.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'items'").fetchone() is None:
+                raise RestoreError('Backup does not contain an inventory database')
+            # Bring an older backup up to the schema the running code expects
+            migrations.migrate(candidate)
+            candidate.execute('PRAGMA journal_mode = WAL')
+
+            live = sqlite3.connect(db_path, timeout=30)
+            try:
+                # pages=-1 copies everything in one step under one write lock, so
+                # no reader ever sees a half-restored database
+                candidate.backup(live, pages=-1)
+                problem = live.execute('PRAGMA quick_check').fetchone()[0]
+                if problem != 'ok':
+                    raise sqlite3.DatabaseError(f'Restored database failed quick check: {problem}')
+                data_version.new_epoch(live)
+                live.commit()
+                return stats.get_stats(live)
+            finally:
+                live.close()
+        finally:
+            candidate.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(candidate_path + suffix):
+                os.remove(candidate_path + suffix)
+
+
+def _load_csv(conn, zf, manifest, name, table, allowed_columns):
+    """Stream one CSV member into ``table``; returns the number of rows"""
+    digest = hashlib.sha256()
+
+    def lines(member):
+        # UTF-8 never puts a newline byte inside a character, so each line
+        # decodes on its own; quoted multi-line fields are rejoined by csv
+        for line in member:
+            digest.update(line)
+            yield line.decode('utf-8')
+
+    count = 0
+    with zf.open(name) as member:
+        reader = csv.reader(lines(member))
+        header = next(reader, [])
+        if table == 'items' and 'id' not in header:
+            raise RestoreError(f'{name} has no id column')
+        columns = [(index, column) for index, column in enumerate(header) if column in allowed_columns]
+        integers = INTEGER_COLUMNS[table]
+
+        sql = (f'INSERT INTO {table} ({", ".join(column for _, column in columns)}) '
+               f'VALUES ({", ".join("?" for _ in columns)})')
+        batch = []
+        for row in reader:
+            if not row:
+                continue
+            values = []
+            for index, column in columns:
+                value = row[index] if index < len(row) else ''
+                if column in integers:
+                    value = int(value) if value.strip() else None
+                values.append(value)
+            batch.append(values)
+            if len(batch) >= CSV_BATCH_ROWS:
+                conn.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(sql, batch)
+            count += len(batch)
+    _check_digest(manifest, name, digest)
+    return count
+
+
+def restore_csv(db_path, zf):
+    """Replace items and transactions with the archive's CSV exports"""
+    manifest = _read_manifest(zf)
+    names = set(zf.namelist())
+    if 'items_backup.csv' not in names:
+        raise RestoreError('No items_backup.csv found in backup')
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM transactions')
+            conn.execute('DELETE FROM items')
+            items = _load_csv(conn, zf, manifest, 'items_backup.csv', 'items', exporter.ITEM_COLUMNS)
+            transactions = 0
+            if 'transactions_backup.csv' in names:
+                transactions = _load_csv(conn, zf, manifest, 'transactions_backup.csv', 'transactions',
+                                         exporter.TRANSACTION_COLUMNS)
+
+            # Continue numbering after the highest restored P-number
+            conn.execute('''
+                UPDATE id_counter SET counter = (
+                    SELECT COALESCE(MAX(CAST(SUBSTR(id, 2) AS INTEGER)), 0)
+                    FROM items WHERE id GLOB 'P[0-9]*'
+                )
+            ''')
+            stats.recompute(conn)
+            data_version.new_epoch(conn)
+            stock_history.clear(conn)  # checkpoints of the replaced log; the next build starts over
+
+            problem = _integrity_problem(conn)
+            if problem:
+                raise RestoreError(f'Restored data failed integrity check: {problem}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    except RestoreError:
+        raise
+    except (ValueError, csv.Error) as e:  # bad numbers, bad UTF-8, malformed CSV
+        raise RestoreError(f'Could not read backup CSV: {e}')
+    finally:
+        conn.close()
+    return {'total_items': items, 'total_transactions': transactions}
+
+
+def save_current(db_path, pages_per_step=1024):
+    """Keep a snapshot of the live database next to it before a restore;
+    returns the file name"""
+    name = f'inventory_backup_before_restore_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
+    destination = os.path.join(os.path.dirname(os.path.abspath(db_path)), name)
+    shutil.move(snapshot(db_path, pages_per_step), destination)
+    return name
+
+
+def restore_partitions(zf, archive_dir):
+    """Write the backup's archive/ partitions into ``archive_dir``; months
+    the backup left out keep the files already there.  Returns how many"""
+    manifest = _read_manifest(zf)
+    members = [name for name in zf.namelist()
+               if re.fullmatch(r'archive/transactions_\d{4}-\d{2}\.db', name)]
+    os.makedirs(archive_dir, exist_ok=True)
+    for name in members:
+        fd, tmp_path = tempfile.mkstemp(dir=archive_dir, suffix='.tmp')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as out, zf.open(name) as src:
+                for block in iter(lambda: src.read(COPY_BLOCK_SIZE), b''):
+                    digest.update(block)
+                    out.write(block)
+            _check_digest(manifest, name, digest)
+            os.replace(tmp_path, os.path.join(archive_dir, os.path.basename(name)))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return len(members)
+
+
+def restore_archive(db_path, archive, source='database', archive_dir=None):
+    """Restore a backup ZIP (path or file object) into the live database.
+
+    ``source`` is "database" to use the archive's inventory.db or "csv" to
+    reload from items_backup.csv / transactions_backup.csv.  With
+    ``archive_dir`` the backup's transaction archive partitions are restored
+    too.  Returns the restored totals.  Raises RestoreError if the archive
+    is unusable, in which case nothing has been changed.
+    """
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise RestoreError('Backup is not a valid ZIP file')
+    with zf:
+        if source == 'csv':
+            totals = restore_csv(db_path, zf)
+        elif 'inventory.db' not in zf.namelist():
+            raise RestoreError('No database file found in backup')
+        else:
+            totals = restore_snapshot(db_path, zf)
+        if archive_dir:
+            totals['archive_partitions'] = restore_partitions(zf, archive_dir)
+        return totals
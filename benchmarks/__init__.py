@@ -0,0 +1 @@
+"""Benchmarks for the inventory tracker (run with ``python -m benchmarks.<name>``)."""
@@ -0,0 +1,61 @@
+"""Compare two benchmark runs route by route.
+
+    python -m benchmarks.compare before.json after.json [--metric p95_ms]
+
+Prints each route's value in both runs and the change in percent; for
+latencies a negative change is an improvement, for throughput_rps a
+positive one.  Routes present in only one run are listed as such.
+"""
+import argparse
+import json
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'throughput_rps')
+
+
+def load(path):
+    with open(path) as f:
+        run = json.load(f)
+    return run, {r['route']: r for r in run['results']}
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--metric', choices=METRICS, default='p95_ms')
+    parser.add_argument('--json', action='store_true', help='print the comparison as JSON')
+    args = parser.parse_args(argv)
+
+    before_run, before = load(args.before)
+    after_run, after = load(args.after)
+    if before_run.get('config', {}).get('items') != after_run.get('config', {}).get('items'):
+        print('warning: the runs used different inventory sizes')
+
+    rows = []
+    for route in list(before) + [route for route in after if route not in before]:
+        old = before.get(route, {}).get(args.metric)
+        new = after.get(route, {}).get(args.metric)
+        rows.append({'route': route, 'before': old, 'after': new, 'change_pct': change(old, new)})
+
+    if args.json:
+        print(json.dumps({'metric': args.metric,
+                          'before': before_run.get('environment', {}).get('git_commit'),
+                          'after': after_run.get('environment', {}).get('git_commit'),
+                          'routes': rows}, indent=2))
+        return
+
+    print(f'{"route":<40} {"before":>10} {"after":>10} {"change":>8}   ({args.metric})')
+    for row in rows:
+        pct = f'{row["change_pct"]:+.1f}%' if row['change_pct'] is not None else '-'
+        print(f'{row["route"]:<40} {row["before"] if row["before"] is not None else "-":>10} '
+              f'{row["after"] if row["after"] is not None else "-":>10} {pct:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Concurrent HTTP load against a running server (or a gunicorn it starts).
+
+    python -m benchmarks.http_load --gunicorn 4 --items 100000 --duration 30
+    python -m benchmarks.http_load --url http://127.0.0.1:8000 --db inventory.db
+    python -m benchmarks.http_load --uvicorn 2 --routes api_item check_in_out --concurrency 100
+
+``--processes`` client processes each run ``--concurrency`` threads with a
+keep-alive connection, sending a random mix of the selected scenarios for
+``--duration`` seconds.  The sample of item IDs to request is read from
+``--db``, which must be the database the server uses; with ``--gunicorn N``
+a database is seeded (unless ``--db`` exists) and served by N gunicorn
+workers for the run; ``--uvicorn N`` serves it with the async scanner API
+(scanner_asgi, scanner routes only) instead.  Results are per route and
+overall, as JSON.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks import report, scenarios, seed
+
+
+def encode(body):
+    """(bytes, content type) for a scenario body"""
+    if body is None:
+        return None, None
+    if scenarios.is_upload(body):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for field, (filename, content) in body.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                         f'filename="{filename}"\r\nContent-Type: text/csv\r\n\r\n'.encode() + content + b'\r\n')
+        return b''.join(parts) + f'--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+    if isinstance(body, dict) and all(isinstance(value, str) for value in body.values()):
+        return urlencode(body).encode(), 'application/x-www-form-urlencoded'
+    return json.dumps(body).encode(), 'application/json'
+
+
+def _client_thread(base, selected, sample, deadline, rng, latencies, statuses, lock):
+    host = urlsplit(base)
+    conn = http.client.HTTPConnection(host.hostname, host.port or 80, timeout=60)
+    local_latencies = defaultdict(list)
+    local_statuses = defaultdict(Counter)
+    while time.monotonic() < deadline:
+        name, _, build = rng.choice(selected)
+        method, url, body = build(rng, sample)
+        data, content_type = encode(body)
+        headers = {'Content-Type': content_type} if content_type else {}
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, url, body=data, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            status = 'error'
+        local_latencies[name].append(time.perf_counter() - t0)
+        local_statuses[name][status] += 1
+    conn.close()
+
+    with lock:
+        for name, values in local_latencies.items():
+            latencies[name].extend(values)
+            statuses[name].update(local_statuses[name])
+
+
+def client_process(base, names, sample, duration, concurrency, process_seed):
+    """One load-generating process; returns ({route: latencies}, {route: statuses})"""
+    selected = scenarios.select(names)
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_client_thread, args=(base, selected, sample, deadline,
+                                                      random.Random(process_seed * 1000 + n),
+                                                      latencies, statuses, lock))
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(latencies), {name: dict(counts) for name, counts in statuses.items()}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, db_path, work_dir):
+    """Run a server ``command`` (given ``{port}``) for the database; returns (process, url)"""
+    if shutil.which(command[0]) is None:
+        raise SystemExit(f'{command[0]} is not installed (pip install {command[0]})')
+    port = _free_port()
+    env = dict(os.environ, DATABASE_PATH=db_path, QR_CACHE_DIR=os.path.join(work_dir, 'qr_cache'),
+               BACKUP_DIR=os.path.join(work_dir, 'backups'), BACKUP_SCHEDULER='0')
+    process = subprocess.Popen([arg.format(port=port) for arg in command], cwd=report.REPO, env=env)
+    url = f'http://127.0.0.1:{port}'
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'{command[0]} exited during startup')
+        try:
+            # Any answer will do (both servers have this route)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/item/P0000001')
+            conn.getresponse().read()
+            conn.close()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'{command[0]} did not start within 60s')
+
+
+def start_gunicorn(db_path, workers, work_dir):
+    """Serve inventory_app with gunicorn on a free port; returns (process, url)"""
+    return start_server(['gunicorn', '--workers', str(workers), '--bind', '127.0.0.1:{port}',
+                         '--log-level', 'warning', 'inventory_app:create_app()'], db_path, work_dir)
+
+
+def start_uvicorn(db_path, workers, work_dir):
+    """Serve scanner_asgi with uvicorn on a free port; returns (process, url)"""
+    return start_server(['uvicorn', '--workers', str(workers), '--port', '{port}', '--log-level', 'warning',
+                         '--no-access-log', 'scanner_asgi:app'], db_path, work_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='server to load, e.g. http://127.0.0.1:8000')
+    target.add_argument('--gunicorn', type=int, metavar='WORKERS', help='start gunicorn with this many workers')
+    target.add_argument('--uvicorn', type=int, metavar='WORKERS',
+                        help='start the async scanner API under uvicorn with this many workers')
+    parser.add_argument('--db', help='database the server uses (seeded if missing with --gunicorn/--uvicorn)')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=4, help='connections per process')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--kinds', nargs='+', choices=scenarios.KINDS, default=['read'])
+    parser.add_argument('--routes', nargs='+', help='only these scenarios (any kind)')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.url and not (args.db and os.path.exists(args.db)):
+        parser.error('--url needs --db pointing at the database the server uses')
+    names = [name for name, _, _ in scenarios.select(args.routes, args.kinds)]
+
+    work_dir = tempfile.mkdtemp(prefix='inventory_load_')
+    server = None
+    try:
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(work_dir, 'bench.db')
+        if not os.path.exists(db_path):
+            print(f'seeding {args.items} items / {args.transactions} transactions...', file=sys.stderr)
+            seed.seed(db_path, args.items, args.transactions, args.seed)
+        sample = seed.sample(db_path, random_seed=args.seed)
+
+        url = args.url
+        if args.gunicorn:
+            server, url = start_gunicorn(db_path, args.gunicorn, work_dir)
+        elif args.uvicorn:
+            server, url = start_uvicorn(db_path, args.uvicorn, work_dir)
+
+        print(f'loading {url} for {args.duration}s with {args.processes}x{args.concurrency} connections',
+              file=sys.stderr)
+        start = time.perf_counter()
+        with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+            outcomes = pool.starmap(client_process, [
+                (url, names, sample, args.duration, args.concurrency, args.seed + n)
+                for n in range(args.processes)
+            ])
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    for process_latencies, process_statuses in outcomes:
+        for name, values in process_latencies.items():
+            latencies[name].extend(values)
+            statuses[name].update(process_statuses[name])
+
+    results = [dict(route=name, **report.summarize(latencies[name], elapsed, statuses[name]))
+               for name in names if name in latencies]
+    results.append(dict(route='all', **report.summarize(
+        [value for values in latencies.values() for value in values], elapsed,
+        sum(statuses.values(), Counter()))))
+
+    report.print_table(results)
+    report.write({
+        'benchmark': 'http_load',
+        'environment': report.environment(),
+        'config': {'items': sample['items'], 'transactions': sample['transactions'], 'seed': args.seed,
+                   'url': args.url, 'gunicorn_workers': args.gunicorn,
+                   'uvicorn_workers': args.uvicorn, 'processes': args.processes,
+                   'concurrency': args.concurrency, 'duration': args.duration},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Compare QR pre-render throughput at different process pool sizes.
+
+    python -m benchmarks.qr_render --rows 5000 --workers 1 2 4 8
+
+Each run renders a fresh set of item IDs into an empty temporary cache
+directory and reports rows/sec; ``--json`` prints machine-readable results.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qr_codes import QRCache  # noqa: E402
+
+
+def run(rows, workers, chunk_size, fmt):
+    cache_dir = tempfile.mkdtemp(prefix='qr_bench_')
+    try:
+        cache = QRCache(cache_dir)
+        item_ids = [f'P{n:07d}' for n in range(1, rows + 1)]
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            # Start the workers before timing so spawn cost is not counted
+            list(executor.map(abs, range(workers)))
+
+            start = time.perf_counter()
+            rendered = sum(f.result() for f in cache.prerender(item_ids, fmt, executor, chunk_size))
+            elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        'workers': workers,
+        'rows': rendered,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rendered / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=250)
+    parser.add_argument('--format', choices=['png', 'svg'], default='png')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = [run(args.rows, w, args.chunk_size, args.format) for w in args.workers]
+
+    if args.json:
+        print(json.dumps({'benchmark': 'qr_render', 'cpu_count': os.cpu_count(),
+                          'results': results}, indent=2))
+    else:
+        print(f'{"workers":>8} {"rows":>8} {"seconds":>9} {"rows/sec":>10}')
+        for r in results:
+            print(f'{r["workers"]:>8} {r["rows"]:>8} {r["seconds"]:>9} {r["rows_per_sec"]:>10}')
+
+
+if __name__ == '__main__':
+    main()
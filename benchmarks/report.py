@@ -0,0 +1,76 @@
+"""Latency summaries and run metadata shared by the benchmarks."""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, seconds, statuses=None):
+    """Throughput and latency percentiles (ms) for one route"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    result = {
+        'requests': count,
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(count / seconds, 1) if seconds else None,
+    }
+    for p in (50, 95, 99):
+        value = percentile(latencies, p)
+        result[f'p{p}_ms'] = round(value * 1000, 3) if value is not None else None
+    result['mean_ms'] = round(sum(latencies) / count * 1000, 3) if count else None
+    result['max_ms'] = round(latencies[-1] * 1000, 3) if count else None
+    if statuses is not None:
+        result['statuses'] = {str(code): n for code, n in sorted(statuses.items())}
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """What the numbers were measured on, so runs can be compared fairly"""
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write(result, path=None):
+    """Write a run as JSON to ``path`` (or stdout)"""
+    text = json.dumps(result, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def print_table(results):
+    print(f'{"route":<40} {"reqs":>6} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}  statuses',
+          file=sys.stderr)
+    for r in results:
+        statuses = ' '.join(f'{code}:{n}' for code, n in r.get('statuses', {}).items())
+        print(f'{r["route"]:<40} {r["requests"]:>6} {r["throughput_rps"] or 0:>9} {r["p50_ms"] or 0:>9} '
+              f'{r["p95_ms"] or 0:>9} {r["p99_ms"] or 0:>9}  {statuses}', file=sys.stderr)
@@ -0,0 +1,138 @@
+"""Benchmark every route in-process through the Flask test client.
+
+    python -m benchmarks.routes --items 100000 --transactions 1000000 --requests 200
+    python -m benchmarks.routes --db bench.db --kinds read write --output run.json
+
+Seeds a synthetic inventory into a temporary database (or reuses ``--db``),
+then sends each scenario from benchmarks.scenarios ``--requests`` times
+after ``--warmup`` untimed requests and reports throughput and p50/p95/p99
+latency per route as JSON.  ``--revalidate`` also times the conditional
+GET path (If-None-Match answered with 304).  Compare two runs with
+``python -m benchmarks.compare``.
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from io import BytesIO
+
+from benchmarks import report, scenarios, seed
+
+
+def load_app(db_path, work_dir):
+    """Build inventory_app for a benchmark database"""
+    sys.path.insert(0, report.REPO)
+    import inventory_app
+    app = inventory_app.create_app({
+        'DATABASE': db_path,
+        'QR_CACHE_DIR': os.path.join(work_dir, 'qr_cache'),
+        'BACKUP_DIR': os.path.join(work_dir, 'backups'),
+        'QR_RENDER_WORKERS': 0,
+        'BACKUP_SCHEDULER': False,
+    })
+    # Failures are counted per status code; tracebacks would drown the report
+    app.logger.setLevel(logging.CRITICAL)
+    return app
+
+
+def send(client, method, url, body, headers=None):
+    if body is None:
+        return client.open(url, method=method, headers=headers)
+    if scenarios.is_upload(body):
+        files = {field: (BytesIO(content), filename) for field, (filename, content) in body.items()}
+        return client.open(url, method=method, data=files, content_type='multipart/form-data')
+    if isinstance(body, dict) and all(isinstance(value, str) for value in body.values()):
+        return client.open(url, method=method, data=body)
+    return client.open(url, method=method, json=body)
+
+
+def run_scenario(app, scenario, sample, requests, warmup, rng, revalidate=False):
+    name, _, build = scenario
+    # A fresh client per route, so flashes left by one route do not leak into the next
+    client = app.test_client()
+    for _ in range(warmup):
+        send(client, *build(rng, sample)).close()
+
+    latencies = []
+    statuses = Counter()
+    etags = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        method, url, body = build(rng, sample)
+        t0 = time.perf_counter()
+        response = send(client, method, url, body)
+        response.get_data()  # drain streamed bodies inside the timing
+        latencies.append(time.perf_counter() - t0)
+        statuses[response.status_code] += 1
+        if revalidate and response.headers.get('ETag'):
+            etags.append((url, response.headers['ETag']))
+        response.close()
+    results = [dict(route=name, **report.summarize(latencies, time.perf_counter() - start, statuses))]
+
+    if etags:
+        latencies = []
+        statuses = Counter()
+        start = time.perf_counter()
+        for url, etag in etags:
+            t0 = time.perf_counter()
+            response = client.get(url, headers={'If-None-Match': etag})
+            response.get_data()
+            latencies.append(time.perf_counter() - t0)
+            statuses[response.status_code] += 1
+            response.close()
+        results.append(dict(route=f'{name} (revalidate)',
+                            **report.summarize(latencies, time.perf_counter() - start, statuses)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='seeded database to reuse (created if missing)')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--kinds', nargs='+', choices=scenarios.KINDS, default=['read', 'write'])
+    parser.add_argument('--routes', nargs='+', help='only these scenarios (any kind)')
+    parser.add_argument('--revalidate', action='store_true', help='also time 304 responses')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    selected = scenarios.select(args.routes, args.kinds)
+    work_dir = tempfile.mkdtemp(prefix='inventory_bench_')
+    try:
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(work_dir, 'bench.db')
+        seed_seconds = None
+        if not os.path.exists(db_path):
+            print(f'seeding {args.items} items / {args.transactions} transactions...', file=sys.stderr)
+            seed_seconds = round(seed.seed(db_path, args.items, args.transactions, args.seed), 1)
+
+        sample = seed.sample(db_path, random_seed=args.seed)
+        app = load_app(db_path, work_dir)
+        rng = random.Random(args.seed)
+        results = []
+        for scenario in selected:
+            print(f'  {scenario[0]}', file=sys.stderr)
+            results.extend(run_scenario(app, scenario, sample, args.requests, args.warmup, rng, args.revalidate))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report.print_table(results)
+    report.write({
+        'benchmark': 'routes',
+        'environment': report.environment(),
+        'config': {'items': sample['items'], 'transactions': sample['transactions'], 'seed': args.seed,
+                   'requests': args.requests, 'warmup': args.warmup, 'seed_seconds': seed_seconds,
+                   'db': args.db},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Requests the benchmarks send, one scenario per route.
+
+Each scenario is (name, kind, build) where ``build(rng, sample)`` returns
+(method, url, body) and body is None, a dict of form fields, a dict of
+files for a multipart upload (``{'file': (filename, bytes)}``) or a list/
+dict sent as JSON.  ``sample`` comes from seed.sample().
+
+Kinds: ``read`` routes are safe to hammer; ``write`` routes change stock
+but not the set of items much; ``heavy`` routes (exports, backups, uploads)
+are slow per request and only run when asked for.  Routes that destroy
+data (delete_item, restore_database, /database_info/recompute) are left out.
+"""
+from urllib.parse import urlencode
+
+LABEL_SHEET = 24
+
+
+def _id(rng, sample):
+    return rng.choice(sample['ids'])
+
+
+def _word(rng, sample):
+    return rng.choice(sample['words'])
+
+
+def _get(path, **params):
+    return 'GET', path + ('?' + urlencode(params) if params else ''), None
+
+
+def _label_range(rng, sample):
+    first = rng.randint(1, max(1, sample['total_items'] - LABEL_SHEET))
+    return f'P{first:07d}-P{first + LABEL_SHEET - 1:07d}'
+
+
+def _csv_upload(rng, sample, rows=100):
+    lines = ['name,description,category,location,quantity']
+    lines.extend(f'bench {_word(rng, sample)} {n},,Tools,{rng.choice(sample["locations"])},1' for n in range(rows))
+    return {'file': ('bench.csv', ('\n'.join(lines) + '\n').encode())}
+
+
+SCENARIOS = [
+    ('index', 'read', lambda rng, s: _get('/')),
+    ('api_items', 'read', lambda rng, s: _get('/api/items')),
+    ('api_items_by_location', 'read', lambda rng, s: _get('/api/items', location=rng.choice(s['locations']))),
+    ('api_item', 'read', lambda rng, s: _get(f'/api/item/{_id(rng, s)}')),
+    ('item_detail', 'read', lambda rng, s: _get(f'/item/{_id(rng, s)}')),
+    ('api_item_transactions', 'read', lambda rng, s: _get(f'/api/item/{_id(rng, s)}/transactions')),
+    ('search', 'read', lambda rng, s: _get('/search', q=_word(rng, s))),
+    ('api_search', 'read', lambda rng, s: _get('/api/search', q=_word(rng, s))),
+    ('api_search_id', 'read', lambda rng, s: _get('/api/search', q=_id(rng, s))),
+    ('api_search_filtered', 'read', lambda rng, s: _get('/api/search', q=_word(rng, s),
+                                                         location=rng.choice(s['locations']))),
+    ('qr_png', 'read', lambda rng, s: _get(f'/qr/{_id(rng, s)}.png')),
+    ('qr_svg', 'read', lambda rng, s: _get(f'/qr/{_id(rng, s)}.svg')),
+    ('print_item', 'read', lambda rng, s: _get(f'/print/qr_with_info/{_id(rng, s)}')),
+    ('print_labels_html', 'read', lambda rng, s: _get('/print/labels', range=_label_range(rng, s))),
+    ('scan_page', 'read', lambda rng, s: _get('/scan')),
+    ('add_item_form', 'read', lambda rng, s: _get('/add_item')),
+    ('bulk_upload_form', 'read', lambda rng, s: _get('/bulk_upload')),
+    ('download_template', 'read', lambda rng, s: _get('/download_template')),
+    ('database_info', 'read', lambda rng, s: _get('/database_info')),
+    ('api_stats', 'read', lambda rng, s: _get('/api/stats')),
+    ('check_in_out', 'write', lambda rng, s: (
+        'POST', f'/check_in_out/{_id(rng, s)}',
+        {'action': rng.choice(['check_in', 'check_out']), 'quantity': str(rng.randint(1, 3))})),
+    ('scan_batch', 'write', lambda rng, s: (
+        'POST', '/api/scan_batch',
+        {'events': [{'item_id': _id(rng, s), 'action': rng.choice(['check_in', 'check_out'])}
+                    for _ in range(20)]})),
+    ('add_item', 'write', lambda rng, s: (
+        'POST', '/add_item', {'name': f'bench {_word(rng, s)}', 'category': 'Tools',
+                              'location': rng.choice(s['locations']), 'quantity': '1'})),
+    ('export_inventory', 'heavy', lambda rng, s: _get('/export_inventory')),
+    ('export_with_transactions', 'heavy', lambda rng, s: _get('/export_inventory', include='transactions')),
+    ('print_labels_pdf', 'heavy', lambda rng, s: _get('/print/labels', range=_label_range(rng, s), format='pdf')),
+    ('backup_database', 'heavy', lambda rng, s: _get('/backup_database')),
+    ('bulk_upload', 'heavy', lambda rng, s: ('POST', '/bulk_upload', _csv_upload(rng, s))),
+]
+
+KINDS = ('read', 'write', 'heavy')
+
+
+def select(names=None, kinds=('read',)):
+    """Scenarios picked by name (any kind) or else by kind"""
+    if names:
+        unknown = set(names) - {name for name, _, _ in SCENARIOS}
+        if unknown:
+            raise SystemExit(f'unknown route(s): {", ".join(sorted(unknown))}')
+        return [s for s in SCENARIOS if s[0] in names]
+    return [s for s in SCENARIOS if s[1] in kinds]
+
+
+def is_upload(body):
+    return isinstance(body, dict) and any(isinstance(value, tuple) for value in body.values())
@@ -0,0 +1,157 @@
+"""Seed a synthetic inventory database for benchmarks.
+
+    python -m benchmarks.seed bench.db --items 100000 --transactions 1000000
+
+Rows come from a fixed random seed, so the same arguments always build the
+same data.  The schema is created by migrations.migrate; triggers are
+dropped while rows are bulk-loaded and re-created afterwards, with the
+search index and statistics rebuilt once at the end instead of per row.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import search_index  # noqa: E402
+import stats  # noqa: E402
+from database import connect, format_item_id  # noqa: E402
+
+BATCH_ROWS = 10000
+START = datetime(2024, 1, 1)
+SPAN_SECONDS = 365 * 24 * 3600
+
+ADJECTIVES = ['red', 'steel', 'compact', 'heavy', 'cordless', 'spare', 'metric', 'wide',
+              'mini', 'brass', 'plastic', 'long', 'coated', 'flexible', 'digital', 'angled']
+NOUNS = ['drill', 'hammer', 'wrench', 'cable', 'bracket', 'screw', 'valve', 'sensor',
+         'ladder', 'clamp', 'battery', 'filter', 'hose', 'switch', 'bearing', 'saw']
+CATEGORIES = ['Tools', 'Electrical', 'Plumbing', 'Fasteners', 'Safety', 'Garden',
+              'Paint', 'Hardware', 'Lighting', 'Storage', 'Automotive', 'Office']
+ACTIONS = ['check_in', 'check_out']
+
+
+def locations(count=200):
+    return [f'Shelf {chr(65 + n % 26)}{n // 26 + 1}' for n in range(count)]
+
+
+def _timestamp(seconds):
+    return (START + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _items(rng, count, places):
+    for number in range(1, count + 1):
+        noun = rng.choice(NOUNS)
+        yield (
+            format_item_id(number),
+            f'{rng.choice(ADJECTIVES)} {noun} {number}',
+            f'{rng.choice(ADJECTIVES)} {noun} for {rng.choice(NOUNS)} work',
+            rng.choice(CATEGORIES),
+            rng.choice(places),
+            rng.randint(0, 500),
+            _timestamp(rng.randrange(SPAN_SECONDS)),
+        )
+
+
+def _transactions(rng, count, item_count, places):
+    # Timestamps increase with the id, as they would in a live database
+    step = SPAN_SECONDS / max(count, 1)
+    for n in range(count):
+        yield (
+            format_item_id(rng.randint(1, item_count)),
+            rng.choice(ACTIONS),
+            rng.randint(1, 5),
+            _timestamp(int(n * step)),
+            rng.choice(places),
+            '',
+        )
+
+
+def _batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(db_path, items=10000, transactions=100000, random_seed=0):
+    """Create ``db_path`` holding ``items`` items and ``transactions``
+    transactions; returns the seconds it took"""
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+
+    start = time.perf_counter()
+    rng = random.Random(random_seed)
+    places = locations()
+    conn = connect(db_path)
+    try:
+        migrations.migrate(conn)
+        conn.execute('PRAGMA synchronous = OFF')
+
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+        for name, _ in triggers:
+            conn.execute(f'DROP TRIGGER {name}')
+
+        for batch in _batched(_items(rng, items, places)):
+            conn.executemany('''
+                INSERT INTO items (id, name, description, category, location, quantity, date_added, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?7, ?7)
+            ''', batch)
+        conn.execute('UPDATE id_counter SET counter = ?', (items,))
+
+        if items:
+            for batch in _batched(_transactions(rng, transactions, items, places)):
+                conn.executemany('''
+                    INSERT INTO transactions (item_id, action, quantity, timestamp, location, notes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+
+        for _, sql in triggers:
+            conn.execute(sql)
+        if search_index.is_installed(conn):
+            search_index.rebuild(conn)
+        stats.recompute(conn)
+        conn.commit()
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def sample(db_path, count=1000, random_seed=0):
+    """Item IDs, locations and search words to build benchmark requests from"""
+    conn = connect(db_path)
+    try:
+        total = conn.execute('SELECT counter FROM id_counter').fetchone()[0]
+        counts = stats.get_stats(conn)
+        places = [row[0] for row in conn.execute('SELECT DISTINCT location FROM items LIMIT 500')]
+    finally:
+        conn.close()
+
+    rng = random.Random(random_seed)
+    ids = [format_item_id(rng.randint(1, total)) for _ in range(count)] if total else []
+    return {'ids': ids, 'total_items': total, 'items': counts['total_items'],
+            'transactions': counts['total_transactions'], 'locations': places, 'words': NOUNS + ADJECTIVES}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    seconds = seed(args.path, args.items, args.transactions, args.seed)
+    print(f'seeded {args.items} items and {args.transactions} transactions in {seconds:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Time a cold worker: import, create_app() and the first requests.
+
+    python -m benchmarks.startup --trials 20
+    python -m benchmarks.startup --db bench.db --output startup.json
+
+Each trial is a fresh interpreter (as a gunicorn worker is after a deploy
+or restart) that imports inventory_app, builds the app against a brand
+new database and, in a second interpreter, against the seeded one, then
+sends its first /api/items request and first QR render.  Phases are
+reported like routes, so ``python -m benchmarks.compare`` works on the
+output; ``eager_modules`` counts trials in which the imaging stack was
+already loaded before the first QR render.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks import report, seed
+
+HEAVY_MODULES = ('qrcode', 'PIL')
+
+# Runs in the child interpreter; prints one JSON object of phase timings
+CHILD = '''
+import json, sys, time
+timings = {}
+t0 = time.perf_counter()
+import inventory_app
+timings['import'] = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+app = inventory_app.create_app()
+timings['create_app'] = time.perf_counter() - t0
+eager = [name for name in %(heavy)r if name in sys.modules]
+
+if %(requests)r:
+    client = app.test_client()
+    t0 = time.perf_counter()
+    status = client.get('/api/items?limit=50').status_code
+    timings['first /api/items'] = time.perf_counter() - t0
+    assert status == 200, status
+    t0 = time.perf_counter()
+    status = client.get('/qr/%(item_id)s.png').status_code
+    timings['first /qr/<id>.png'] = time.perf_counter() - t0
+    assert status == 200, status
+print(json.dumps({'timings': timings, 'eager': eager}))
+'''
+
+
+def run_child(db_path, work_dir, item_id=None):
+    """One cold start in a new interpreter; returns (timings, eager modules)"""
+    qr_dir = tempfile.mkdtemp(prefix='qr_', dir=work_dir)  # no renders cached from earlier trials
+    env = dict(os.environ, DATABASE_PATH=db_path, QR_CACHE_DIR=qr_dir,
+               BACKUP_DIR=os.path.join(work_dir, 'backups'), QR_RENDER_WORKERS='0', BACKUP_SCHEDULER='0')
+    code = CHILD % {'heavy': HEAVY_MODULES, 'requests': item_id is not None, 'item_id': item_id}
+    result = subprocess.run([sys.executable, '-c', code], cwd=report.REPO, env=env,
+                            capture_output=True, text=True, timeout=120)
+    shutil.rmtree(qr_dir, ignore_errors=True)
+    if result.returncode != 0:
+        raise SystemExit(f'startup trial failed:\n{result.stderr}')
+    outcome = json.loads(result.stdout.strip().splitlines()[-1])
+    return outcome['timings'], outcome['eager']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='seeded database to start against (created if missing)')
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='inventory_startup_')
+    latencies = defaultdict(list)
+    eager = defaultdict(int)
+    try:
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(work_dir, 'bench.db')
+        if not os.path.exists(db_path):
+            print(f'seeding {args.items} items / {args.transactions} transactions...', file=sys.stderr)
+            seed.seed(db_path, args.items, args.transactions, args.seed)
+        sample = seed.sample(db_path, random_seed=args.seed)
+
+        start = time.perf_counter()
+        for trial in range(args.trials):
+            # A new database pays for creating the schema; an existing one only for checking it
+            timings, _ = run_child(os.path.join(work_dir, f'new_{trial}.db'), work_dir)
+            latencies['import'].append(timings['import'])
+            latencies['create_app (new db)'].append(timings['create_app'])
+
+            timings, loaded = run_child(db_path, work_dir, sample['ids'][trial % len(sample['ids'])])
+            latencies['import'].append(timings['import'])
+            latencies['create_app (existing db)'].append(timings['create_app'])
+            latencies['first /api/items'].append(timings['first /api/items'])
+            latencies['first /qr/<id>.png'].append(timings['first /qr/<id>.png'])
+            for name in loaded:
+                eager[name] += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = [dict(route=phase, **report.summarize(values, elapsed)) for phase, values in latencies.items()]
+    report.print_table(results)
+    report.write({
+        'benchmark': 'startup',
+        'environment': report.environment(),
+        'config': {'items': sample['items'], 'transactions': sample['transactions'], 'seed': args.seed,
+                   'trials': args.trials},
+        'eager_modules': {name: eager[name] for name in HEAVY_MODULES},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
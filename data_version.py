@@ -0,0 +1,55 @@
+"""Trigger-maintained data versions for HTTP validators.
+
+data_versions holds one counter per table, bumped by every row written to
+it, and item_versions one counter per item, bumped whenever the item or its
+history changes.  A page's ETag is built from the counters it depends on,
+so If-None-Match can be answered from these two small tables without
+reading items or transactions.
+
+The ``epoch`` row is replaced with a random value whenever the database is
+restored: counters may go back in time with the restored data, and a new
+epoch keeps ETags issued before the restore from matching again.
+"""
+import secrets
+
+TABLES = ('items', 'transactions')
+
+TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS versions_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+        INSERT INTO item_versions (item_id, version)
+            SELECT {row}.{item_column}, 1 WHERE {row}.{item_column} IS NOT NULL
+            ON CONFLICT (item_id) DO UPDATE SET version = version + 1;
+    END
+    '''
+    for table, item_column in (('items', 'id'), ('transactions', 'item_id'))
+    for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old'))
+]
+
+
+def install(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    conn.execute('CREATE TABLE IF NOT EXISTS item_versions (item_id TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    conn.executemany('INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)',
+                     [(table,) for table in TABLES])
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+    new_epoch(conn)
+
+
+def new_epoch(conn):
+    """Invalidate every validator handed out so far (call after a restore)"""
+    conn.execute("INSERT OR REPLACE INTO data_versions (name, version) VALUES ('epoch', ?)",
+                 (secrets.randbits(48),))
+
+
+def table_versions(conn):
+    """{'epoch': ..., 'items': ..., 'transactions': ...}"""
+    return dict(conn.execute('SELECT name, version FROM data_versions').fetchall())
+
+
+def item_version(conn, item_id):
+    """Version of one item and its history (0 if it has never existed)"""
+    row = conn.execute('SELECT version FROM item_versions WHERE item_id = ?', (item_id,)).fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,190 @@
+"""SQLite connection layer shared by every route.
+
+Each worker process keeps a small pool of connections that are opened once,
+switched to WAL journaling and tuned with the pragmas below.  Routes check a
+connection out for the lifetime of the Flask app context with ``get_db()`` and
+it is handed back to the pool automatically on teardown.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, g
+
+# Defaults applied to every new connection (override with app.config['SQLITE_PRAGMAS'])
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',        # readers no longer block the writer
+    'synchronous': 'NORMAL',      # safe with WAL, one fsync per checkpoint
+    'cache_size': -16000,         # negative = KiB, so ~16MB page cache
+    'mmap_size': 268435456,       # map up to 256MB of the file
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,         # wait up to 5s for a lock instead of failing
+}
+
+
+def connect(path, pragmas=None, check_same_thread=True, factory=sqlite3.Connection):
+    """Open a connection to ``path`` with the tuned pragmas applied"""
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread, factory=factory)
+    settings = dict(DEFAULT_PRAGMAS)
+    settings.update(pragmas or {})
+    for name, value in settings.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+class ConnectionPool:
+    """Bounded, per-process pool of tuned SQLite connections.
+
+    Connections are created lazily up to ``size`` and reused LIFO so the hot
+    ones keep a warm page cache.  The pool notices when it has been inherited
+    across a fork (gunicorn --preload) and starts over instead of sharing
+    file handles with the parent.
+    """
+
+    def __init__(self, path, size=5, timeout=30.0, pragmas=None, factory=sqlite3.Connection):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Never close the parent's handles from the child
+                    self._reset()
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool has room"""
+        self._check_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return connect(self.path, self.pragmas, check_same_thread=False, factory=self.factory)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f'Timed out waiting for a database connection ({self.size} in use)')
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction"""
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones close on release)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+@contextmanager
+def immediate_transaction(conn):
+    """Run the block in BEGIN IMMEDIATE ... COMMIT, rolling back on error.
+
+    Taking the write lock up front means a read-modify-write inside the block
+    cannot interleave with another writer, and a busy database is waited on
+    (busy_timeout) at BEGIN rather than failing half way through.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def format_item_id(number):
+    """Format a counter value as P + 7 digits with leading zeros (P0000001)"""
+    return f"P{number:07d}"
+
+
+class ItemIdAllocator:
+    """Hand out sequential item IDs reserved in the caller's transaction.
+
+    reserve(n) bumps id_counter by n in a single UPDATE, which takes SQLite's
+    write lock, so no other connection or gunicorn worker can be handed the same
+    numbers. Nothing is committed here: the IDs belong to the caller's
+    transaction and are given back automatically if that transaction rolls back.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def reserve(self, count):
+        """Atomically reserve ``count`` contiguous IDs and return them"""
+        # The UPDATE holds the write lock, so the SELECT sees our own increment
+        self.cursor.execute('UPDATE id_counter SET counter = counter + ?', (count,))
+        self.cursor.execute('SELECT counter FROM id_counter')
+        last = self.cursor.fetchone()[0]
+        return [format_item_id(n) for n in range(last - count + 1, last + 1)]
+
+
+def get_db():
+    """Connection checked out for the current app context"""
+    if 'db' not in g:
+        g.db = current_app.extensions['sqlite_pool'].acquire()
+    return g.db
+
+
+def _release_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['sqlite_pool'].release(conn)
+
+
+def init_app(app):
+    """Attach a connection pool for ``app.config['DATABASE']`` to the app"""
+    app.config.setdefault('DATABASE', 'inventory.db')
+    app.config.setdefault('DATABASE_POOL_SIZE', 5)
+    app.config.setdefault('DATABASE_POOL_TIMEOUT', 30.0)
+    app.config.setdefault('SQLITE_PRAGMAS', {})
+    app.config.setdefault('SQLITE_FACTORY', sqlite3.Connection)  # e.g. metrics.InstrumentedConnection
+
+    app.extensions['sqlite_pool'] = ConnectionPool(
+        app.config['DATABASE'],
+        size=app.config['DATABASE_POOL_SIZE'],
+        timeout=app.config['DATABASE_POOL_TIMEOUT'],
+        pragmas=app.config['SQLITE_PRAGMAS'],
+        factory=app.config['SQLITE_FACTORY'],
+    )
+    app.teardown_appcontext(_release_db)
@@ -0,0 +1,122 @@
+"""Streaming inventory export.
+
+Rows are written out as the cursor yields them, a few hundred at a time, so
+memory stays flat and the first byte leaves before the query has finished.
+"""
+import csv
+import io
+import json
+import zlib
+
+import archive
+
+ITEM_COLUMNS = ['id', 'name', 'description', 'category', 'location', 'quantity', 'date_added', 'last_updated']
+TRANSACTION_COLUMNS = ['id', 'item_id', 'action', 'quantity', 'timestamp', 'location', 'notes']
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+ROWS_PER_CHUNK = 500
+
+
+def _item_filters(location='', category='', updated_since=None):
+    sql = ' WHERE 1=1'
+    params = []
+    if location:
+        sql += ' AND location = ?'
+        params.append(location)
+    if category:
+        sql += ' AND category = ?'
+        params.append(category)
+    if updated_since:
+        sql += ' AND last_updated >= ?'
+        params.append(updated_since)
+    return sql, params
+
+
+def _query_items(conn, filters):
+    where, params = _item_filters(**filters)
+    return conn.execute(f'SELECT {", ".join(ITEM_COLUMNS)} FROM items{where} ORDER BY name', params)
+
+
+def _query_transactions(conn, filters, table='main.transactions'):
+    sql = f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM {table} WHERE 1=1'
+    params = []
+    if filters.get('location') or filters.get('category'):
+        where, item_params = _item_filters(filters.get('location'), filters.get('category'))
+        sql += f' AND item_id IN (SELECT id FROM items{where})'
+        params.extend(item_params)
+    if filters.get('updated_since'):
+        sql += ' AND timestamp >= ?'
+        params.append(filters['updated_since'])
+    return conn.execute(sql + ' ORDER BY id', params)
+
+
+def _all_transactions(conn, filters, archive_dir=None):
+    """Archived transactions, month by month, then the live table"""
+    if archive_dir:
+        for _ in archive.each_partition(conn, archive_dir):
+            yield from _query_transactions(conn, filters, 'archive.transactions')
+    yield from _query_transactions(conn, filters)
+
+
+def _chunked(rows, render):
+    """Render rows in batches so each yield carries a useful amount of data"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ROWS_PER_CHUNK:
+            yield render(batch)
+            batch = []
+    if batch:
+        yield render(batch)
+
+
+def _csv_rows(header, rows):
+    def render(batch):
+        output = io.StringIO()
+        csv.writer(output).writerows(batch)
+        return output.getvalue()
+
+    output = io.StringIO()
+    csv.writer(output).writerow(header)
+    yield output.getvalue()
+    yield from _chunked(rows, render)
+
+
+def _ndjson_rows(record_type, columns, rows):
+    def render(batch):
+        return ''.join(json.dumps(dict(zip(columns, row), type=record_type)) + '\n' for row in batch)
+
+    yield from _chunked(rows, render)
+
+
+def iter_export(conn, fmt='csv', include_transactions=False, archive_dir=None, **filters):
+    """Yield the export as text chunks.
+
+    CSV: the items table, then (optionally) a blank line and the transactions
+    table with its own header.  NDJSON: one object per line, tagged with a
+    ``type`` of "item" or "transaction".  With ``archive_dir`` the archived
+    transactions come first.
+    """
+    if fmt == 'ndjson':
+        yield from _ndjson_rows('item', ITEM_COLUMNS, _query_items(conn, filters))
+        if include_transactions:
+            yield from _ndjson_rows('transaction', TRANSACTION_COLUMNS, _all_transactions(conn, filters, archive_dir))
+    else:
+        yield from _csv_rows(ITEM_COLUMNS, _query_items(conn, filters))
+        if include_transactions:
+            yield '\r\n'
+            yield from _csv_rows(TRANSACTION_COLUMNS, _all_transactions(conn, filters, archive_dir))
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip-compress a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
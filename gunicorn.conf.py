@@ -0,0 +1,15 @@
+"""gunicorn settings, from the environment Railway provides.
+
+    gunicorn -c gunicorn.conf.py 'inventory_app:create_app()'
+
+With GUNICORN_PRELOAD=1 the app (imports, schema check) is built once in
+the master and forked; database connections, the write-behind thread and
+the QR render pool are opened lazily per worker, so nothing is shared
+across the fork.  An in-process backup scheduler then runs in the master
+only, instead of once per worker.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
@@ -0,0 +1,70 @@
+"""Conditional GET for read routes.
+
+@conditional(versions) computes the route's ETag from data versions before
+the view runs; a matching If-None-Match gets an empty 304 without the view
+(or its queries) ever being called.  Full responses carry the ETag and the
+route's Cache-Control policy.
+"""
+import functools
+import hashlib
+import os
+
+from flask import current_app, make_response, request, session
+
+from database import get_db
+
+# Cache-Control per kind of route.  HTML shows per-session flash messages, so
+# only the browser may keep it; JSON and exports may be revalidated by a proxy.
+POLICIES = {
+    'page': 'private, no-cache',
+    'api': 'public, no-cache',
+    'export': 'public, no-cache',
+}
+
+
+def release_tag(*paths):
+    """Short fingerprint of the code and templates, shared by all workers of a
+    release, so a deploy never serves a cached page rendered by old code"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files.append(path)
+
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(f'{name}:{os.path.getmtime(name)}'.encode())
+    return digest.hexdigest()[:8]
+
+
+def make_etag(parts):
+    return '-'.join(str(part) for part in (current_app.config['ETAG_SALT'], *parts))
+
+
+def conditional(versions, policy='page'):
+    """Decorate a GET view with ETag/304 handling.
+
+    ``versions(conn, **view_args)`` returns the values the response depends
+    on (data versions, plus anything else that changes its bytes).  Only
+    200 responses are tagged.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message makes this one response unique
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            etag = make_etag(versions(get_db(), **kwargs))
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = POLICIES[policy]
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,211 @@
+"""Streaming CSV import that runs as a background job.
+
+The upload is decoded incrementally and parsed one row at a time, so memory use
+does not grow with file size.  Valid rows are inserted with executemany in
+fixed-size chunks, one commit per chunk, and progress is written to the
+import_jobs table so any gunicorn worker can answer the status endpoint.
+"""
+import csv
+import io
+import os
+import threading
+import time
+import uuid
+
+from database import ItemIdAllocator
+from stock import MAX_QUANTITY
+
+REQUIRED_COLUMNS = ['name']
+MAX_STORED_ERRORS = 1000  # per job; error_count keeps counting past this
+
+
+class RowError(ValueError):
+    """A row that cannot be imported (the message is shown to the user)"""
+
+
+def read_header(stream, encoding='utf-8-sig'):
+    """Read just the header row of an uploaded CSV and rewind the stream"""
+    text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    try:
+        header = next(csv.reader(text), [])
+    finally:
+        text.detach()
+    stream.seek(0)
+    return [col.strip() for col in header]
+
+
+def iter_rows(path, encoding='utf-8-sig'):
+    """Yield ``(row_num, row_dict)`` lazily, decoding the file as it is read"""
+    with open(path, 'r', encoding=encoding, newline='') as f:
+        reader = csv.DictReader(f)
+        for row_num, row in enumerate(reader, start=2):  # Start at 2 (header is row 1)
+            yield row_num, row
+
+
+def parse_row(row):
+    """Validate one CSV row and return (name, description, category, location, quantity)"""
+    # Required field
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise RowError('Name is required')
+
+    # Optional fields
+    description = (row.get('description') or '').strip()
+    category = (row.get('category') or '').strip()
+    location = (row.get('location') or '').strip()
+
+    # Handle quantity
+    quantity_str = (row.get('quantity') or '1').strip()
+    try:
+        quantity = int(quantity_str) if quantity_str else 1
+        if quantity < 1:
+            quantity = 1
+    except ValueError:
+        quantity = 1
+    if quantity > MAX_QUANTITY:
+        # Would overflow SQLite's integers and fail the whole chunk's insert
+        raise RowError(f'Quantity must be at most {MAX_QUANTITY}')
+
+    return name, description, category, location, quantity
+
+
+def create_job(conn, filename):
+    """Register a queued import job and return its id"""
+    job_id = uuid.uuid4().hex
+    conn.execute('''
+        INSERT INTO import_jobs (id, filename, status, created_at)
+        VALUES (?, ?, 'queued', ?)
+    ''', (job_id, filename, time.time()))
+    conn.commit()
+    return job_id
+
+
+def get_job(conn, job_id, error_limit=100):
+    """Job progress as a dict, or None if the job does not exist"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, filename, status, rows_processed, items_added, error_count,
+               created_at, started_at, finished_at, message
+        FROM import_jobs WHERE id = ?
+    ''', (job_id,))
+    job = cursor.fetchone()
+    if not job:
+        return None
+
+    started_at, finished_at = job[7], job[8]
+    elapsed = ((finished_at or time.time()) - started_at) if started_at else 0.0
+
+    cursor.execute('''
+        SELECT row_num, message FROM import_errors
+        WHERE job_id = ? ORDER BY row_num LIMIT ?
+    ''', (job_id, error_limit))
+    errors = [{'row': row[0], 'message': row[1]} for row in cursor.fetchall()]
+
+    return {
+        'id': job[0],
+        'filename': job[1],
+        'status': job[2],
+        'rows_processed': job[3],
+        'items_added': job[4],
+        'error_count': job[5],
+        'elapsed_seconds': round(elapsed, 2),
+        'rows_per_sec': round(job[3] / elapsed, 1) if elapsed else 0.0,
+        'message': job[9],
+        'errors': errors,
+    }
+
+
+class CSVImport:
+    """Import one saved CSV file into items/transactions in chunks.
+
+    ``on_items_added`` is called with the new item IDs after each chunk is
+    committed (used to warm the QR cache).
+    """
+
+    def __init__(self, pool, job_id, path, chunk_size=1000, on_items_added=None):
+        self.pool = pool
+        self.job_id = job_id
+        self.path = path
+        self.chunk_size = chunk_size
+        self.on_items_added = on_items_added
+        self.rows_processed = 0
+        self.items_added = 0
+        self.error_count = 0
+        self.current_row = 1
+
+    def start(self):
+        """Run the import on a daemon thread"""
+        thread = threading.Thread(target=self.run, name=f'csv-import-{self.job_id[:8]}', daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        conn = self.pool.acquire()
+        try:
+            conn.execute("UPDATE import_jobs SET status = 'running', started_at = ? WHERE id = ?",
+                         (time.time(), self.job_id))
+            conn.commit()
+
+            items, errors, rows_in_chunk = [], [], 0
+            for row_num, row in iter_rows(self.path):
+                self.current_row = row_num
+                try:
+                    items.append(parse_row(row))
+                except RowError as e:
+                    errors.append((row_num, str(e)))
+                rows_in_chunk += 1
+
+                if rows_in_chunk >= self.chunk_size:
+                    self._flush(conn, items, errors, rows_in_chunk)
+                    items, errors, rows_in_chunk = [], [], 0
+
+            self._flush(conn, items, errors, rows_in_chunk)
+            self._finish(conn, 'done', f'Successfully added {self.items_added} items')
+        except Exception as e:
+            conn.rollback()
+            self._finish(conn, 'failed', f'Stopped at row {self.current_row}: {str(e)}')
+        finally:
+            self.pool.release(conn)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _flush(self, conn, items, errors, rows_in_chunk):
+        """Insert one chunk and record progress in a single transaction"""
+        cursor = conn.cursor()
+        new_ids = ItemIdAllocator(cursor).reserve(len(items)) if items else []
+
+        cursor.executemany('''
+            INSERT INTO items (id, name, description, category, location, quantity)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(item_id,) + item for item_id, item in zip(new_ids, items)])
+
+        cursor.executemany('''
+            INSERT INTO transactions (item_id, action, quantity, location, notes)
+            VALUES (?, 'added', ?, ?, 'Bulk upload from CSV')
+        ''', [(item_id, item[4], item[3]) for item_id, item in zip(new_ids, items)])
+
+        room = MAX_STORED_ERRORS - self.error_count
+        if errors and room > 0:
+            cursor.executemany('INSERT INTO import_errors (job_id, row_num, message) VALUES (?, ?, ?)',
+                               [(self.job_id, row_num, message) for row_num, message in errors[:room]])
+
+        self.rows_processed += rows_in_chunk
+        self.items_added += len(items)
+        self.error_count += len(errors)
+        cursor.execute('''
+            UPDATE import_jobs SET rows_processed = ?, items_added = ?, error_count = ?
+            WHERE id = ?
+        ''', (self.rows_processed, self.items_added, self.error_count, self.job_id))
+        conn.commit()
+
+        if new_ids and self.on_items_added:
+            self.on_items_added(new_ids)
+
+    def _finish(self, conn, status, message):
+        conn.execute('''
+            UPDATE import_jobs SET status = ?, finished_at = ?, message = ?
+            WHERE id = ?
+        ''', (status, time.time(), message, self.job_id))
+        conn.commit()
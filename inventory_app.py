@@ -1,225 +1,555 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash
-import sqlite3
-import qrcode
+from flask import Flask, current_app, render_template, stream_template, request, jsonify, redirect, url_for, flash, stream_with_context, g
 import io
-import base64
 import os
 import csv
+import base64
+import json
+import shutil
+import tempfile
 from datetime import datetime
-import uuid
 from werkzeug.utils import secure_filename
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-change-this'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+import archive
+import backup_scheduler
+import backups
+import data_version
+import database
+import exporter
+import http_cache
+import importer
+import labels
+import metrics
+import migrations
+import result_cache
+import search_index
+import stats
+import stock
+import stock_history
+import write_queue
+from database import connect, get_db, immediate_transaction
+from http_cache import conditional
+from qr_codes import MIMETYPES, QRCache, get_render_pool
 
-# Database setup
-def init_db():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    # Items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS items (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            description TEXT,
-            category TEXT,
-            location TEXT,
-            quantity INTEGER DEFAULT 1,
-            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            qr_code TEXT
+# Views are collected here and registered on each app by create_app()
+ROUTES = []
+
+def route(rule, **options):
+    """Like @app.route, for the app that create_app() will build"""
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+def load_config(app):
+    """Settings with their environment variable overrides"""
+    app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this')
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 256)) * 1024 * 1024
+    app.config['DATABASE'] = os.environ.get('DATABASE_PATH', 'inventory.db')
+    app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    app.config['QR_CACHE_DIR'] = os.environ.get('QR_CACHE_DIR', 'qr_cache')
+    app.config['QR_CACHE_SIZE'] = 512  # rendered images kept in memory per worker
+    app.config['QR_RENDER_WORKERS'] = int(os.environ.get('QR_RENDER_WORKERS', 2))  # 0 disables pre-rendering
+    app.config['ITEMS_PAGE_SIZE'] = 50  # items per page on the dashboard
+    app.config['ITEMS_PAGE_MAX'] = 200  # largest page /api/items will return
+    app.config['HISTORY_PAGE_SIZE'] = 20  # transactions shown on the item page / per API page
+    app.config['HISTORY_PAGE_MAX'] = 200
+    app.config['SEARCH_LIMIT'] = 50  # default results per /search and /api/search call
+    app.config['SEARCH_LIMIT_MAX'] = 200
+    app.config['SEARCH_CACHE_SIZE'] = int(os.environ.get('SEARCH_CACHE_SIZE', 256))  # result sets kept per worker
+    app.config['SEARCH_CACHE_TTL'] = int(os.environ.get('SEARCH_CACHE_TTL', 60))  # seconds
+    app.config['IMPORT_CHUNK_SIZE'] = 1000  # rows per executemany/commit in bulk imports
+    app.config['SCAN_BATCH_MAX'] = 500  # events accepted per /api/scan_batch request
+    app.config['SCANNER_URL'] = os.environ.get('SCANNER_URL', '')  # scanner_asgi origin the scan page calls ('' = this app)
+    app.config['LABEL_GRID'] = (3, 8)  # default label sheet columns x rows
+    app.config['LABEL_BATCH_MAX'] = 5000  # labels per /print/labels request
+    app.config['WRITE_BEHIND'] = os.environ.get('WRITE_BEHIND', '0') == '1'  # group-commit writer thread
+    app.config['WRITE_BATCH_MAX'] = int(os.environ.get('WRITE_BATCH_MAX', 100))  # operations per group commit
+    app.config['WRITE_BATCH_DELAY_MS'] = float(os.environ.get('WRITE_BATCH_DELAY_MS', 2))  # wait for more work
+    app.config['WRITE_TIMEOUT'] = 30  # seconds a request waits for its group to commit
+    app.config['ETAG_SALT'] = http_cache.release_tag(__file__, os.path.join(app.root_path, 'templates'))
+    app.config['BACKUP_PAGES_PER_STEP'] = 1024  # pages copied per sqlite3 backup step
+    app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR', 'archive')  # monthly transaction partitions
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))  # age at which history is archived
+    app.config['SNAPSHOT_INTERVAL_DAYS'] = int(os.environ.get('SNAPSHOT_INTERVAL_DAYS', 7))  # stock_history.py build
+    app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', 'automated_backups')
+    app.config['BACKUP_SCHEDULER'] = os.environ.get('BACKUP_SCHEDULER', '0') == '1'  # run backups in-process
+    app.config['BACKUP_INTERVAL'] = int(os.environ.get('BACKUP_INTERVAL_MINUTES', 60)) * 60  # seconds
+    app.config['BACKUP_FULL_EVERY'] = int(os.environ.get('BACKUP_FULL_EVERY_HOURS', 24)) * 3600  # seconds
+    app.config['BACKUP_RETENTION'] = {
+        'hourly': int(os.environ.get('BACKUP_KEEP_HOURLY', 24)),
+        'daily': int(os.environ.get('BACKUP_KEEP_DAILY', 7)),
+        'weekly': int(os.environ.get('BACKUP_KEEP_WEEKLY', 4)),
+    }
+    app.config['METRICS'] = os.environ.get('METRICS', '1') == '1'  # request/SQL timing and /metrics
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')  # shared by gunicorn workers so /metrics sums them
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))  # 0 disables the slow request log
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))  # 0 disables the slow query log
+
+def create_app(config=None):
+    """Build the application.
+    
+    Settings come from the environment (load_config), overridden by
+    ``config``.  The schema is checked once here; under gunicorn --preload
+    that happens once in the master, and the connection pool, writer thread
+    and render pool are all created lazily in each worker after the fork.
+    """
+    app = Flask(__name__)
+    load_config(app)
+    app.config.update(config or {})
+    
+    if app.config['METRICS']:
+        app.config['SQLITE_FACTORY'] = metrics.InstrumentedConnection
+        metrics.init_app(app)
+    database.init_app(app)
+    init_db(app)
+    
+    app.extensions['qr_cache'] = QRCache(
+        app.config['QR_CACHE_DIR'], max_entries=app.config['QR_CACHE_SIZE'],
+        on_render=metrics.observe_qr_render if app.config['METRICS'] else None,
+    )
+    app.extensions['search_cache'] = result_cache.ResultCache(app.config['SEARCH_CACHE_SIZE'],
+                                                              app.config['SEARCH_CACHE_TTL'])
+    app.extensions['write_queue'] = None
+    if app.config['WRITE_BEHIND']:
+        app.extensions['write_queue'] = write_queue.WriteQueue(
+            app.config['DATABASE'],
+            max_batch=app.config['WRITE_BATCH_MAX'],
+            max_delay=app.config['WRITE_BATCH_DELAY_MS'] / 1000,
+            pragmas=app.config['SQLITE_PRAGMAS'],
+            factory=app.config['SQLITE_FACTORY'],
         )
-    ''')
     
-    # Transactions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            item_id TEXT,
-            action TEXT,
-            quantity INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            location TEXT,
-            notes TEXT,
-            FOREIGN KEY (item_id) REFERENCES items (id)
-        )
-    ''')
+    app.extensions['backup_scheduler'] = backup_scheduler.BackupScheduler(
+        app.config['DATABASE'],
+        app.config['BACKUP_DIR'],
+        interval=app.config['BACKUP_INTERVAL'],
+        full_every=app.config['BACKUP_FULL_EVERY'],
+        retention=app.config['BACKUP_RETENTION'],
+        pages_per_step=app.config['BACKUP_PAGES_PER_STEP'],
+    )
+    if app.config['BACKUP_SCHEDULER']:
+        app.extensions['backup_scheduler'].start()
     
-    # Counter table for sequential IDs
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS id_counter (
-            counter INTEGER DEFAULT 0
-        )
-    ''')
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
+def __getattr__(name):
+    # ``inventory_app:app`` (gunicorn, python inventory_app.py) builds the
+    # default app on first use, so importing the module stays cheap
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+# Database setup
+def init_db(app):
+    """Bring the schema up to date (safe to run from every worker at startup)"""
+    conn = connect(app.config['DATABASE'])
+    try:
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+
+def run_write(operation, *args):
+    """Run ``operation(cursor, *args)`` in a write transaction and return its result.
+    
+    With WRITE_BEHIND on it is handed to the group-commit writer, and this
+    returns once the group it was committed in is durable.
+    """
+    writer = current_app.extensions['write_queue']
+    if writer is not None:
+        return writer.submit(operation, *args).result(timeout=current_app.config['WRITE_TIMEOUT'])
+    
+    conn = get_db()
+    with immediate_transaction(conn):
+        return operation(conn.cursor(), *args)
+
+# ETag inputs for @conditional routes (see http_cache.py)
+def items_version(conn, **view_args):
+    # Looked up once per request; the search cache checks it as well
+    if 'items_version' not in g:
+        versions = data_version.table_versions(conn)
+        g.items_version = versions['epoch'], versions['items']
+    return g.items_version
+
+def item_history_version(conn, item_id, **view_args):
+    return data_version.table_versions(conn)['epoch'], data_version.item_version(conn, item_id)
+
+def stats_version(conn, **view_args):
+    versions = data_version.table_versions(conn)
+    db_path = current_app.config['DATABASE']
+    db_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+    return versions['epoch'], versions['items'], versions['transactions'], round(db_size / (1024 * 1024), 2)
+
+def stock_version(conn, **view_args):
+    # Past levels change only with the log (or an item deleted along with its
+    # history); the snapshot and replayed count reported also with the checkpoints
+    versions = data_version.table_versions(conn)
+    return versions['epoch'], versions['items'], versions['transactions'], versions['stock_snapshots']
+
+def export_version(conn, **view_args):
+    versions = data_version.table_versions(conn)
+    parts = [versions['epoch'], versions['items']]
+    if request.args.get('include') == 'transactions':
+        parts.append(versions['transactions'])
+    if export_gzipped():
+        parts.append('gz')  # a strong ETag must differ per content encoding
+    return parts
+
+def encode_cursor(key, row_id):
+    """Opaque keyset cursor for a (sort key, id) order such as (name, id)"""
+    return base64.urlsafe_b64encode(json.dumps([key, row_id]).encode()).decode()
+
+def decode_cursor(token):
+    key, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return key, row_id
+
+def parse_timestamp_arg(value, end_of_day=False):
+    """Normalise YYYY-MM-DD[ HH:MM:SS] to the CURRENT_TIMESTAMP format stored
+    in the database; a bare date means its last second when ``end_of_day``.
+    Raises ValueError on anything else.
+    """
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def fetch_items_page(cursor, limit, after=None, query='', location='', category=''):
+    """One page of items ordered by (name, id), starting after the ``after`` key.
     
-    # Initialize counter if empty
-    cursor.execute('SELECT COUNT(*) FROM id_counter')
-    if cursor.fetchone()[0] == 0:
-        cursor.execute('INSERT INTO id_counter (counter) VALUES (0)')
+    Keyset pagination keeps every page an index range scan however deep the
+    user scrolls, unlike OFFSET which re-reads all the skipped rows.
+    """
+    sql = 'SELECT id, name, description, category, location, quantity, date_added FROM items WHERE 1=1'
+    params = []
     
-    conn.commit()
-    conn.close()
-
-def generate_item_id():
-    """Generate sequential ID in format P0000001, P0000002, etc."""
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
+    if after:
+        sql += ' AND (name, id) > (?, ?)'
+        params.extend(after)
     
-    # Get and increment counter
-    cursor.execute('SELECT counter FROM id_counter')
-    current_counter = cursor.fetchone()[0]
-    new_counter = current_counter + 1
+    if query:
+        clause, clause_params = search_index.filter_clause(cursor.connection, query)
+        sql += ' AND ' + clause
+        params.extend(clause_params)
     
-    cursor.execute('UPDATE id_counter SET counter = ?', (new_counter,))
-    conn.commit()
-    conn.close()
+    if location:
+        sql += ' AND location = ?'
+        params.append(location)
+    
+    if category:
+        sql += ' AND category = ?'
+        params.append(category)
     
-    # Format as P + 7 digits with leading zeros
-    return f"P{new_counter:07d}"
-def generate_qr_code(item_id):
-    """Generate QR code for item ID"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(item_id)
-    qr.make(fit=True)
+    # Fetch one extra row to know whether another page exists
+    sql += ' ORDER BY name, id LIMIT ?'
+    params.append(limit + 1)
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    cursor.execute(sql, params)
+    items = cursor.fetchall()
     
-    # Convert to base64 string
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1][1], items[-1][0])
     
-    return f"data:image/png;base64,{img_str}"
+    return items, next_cursor
 
-@app.route('/')
+def fetch_transactions_page(cursor, item_id, limit, before=None, action='', since=None, until=None,
+                            archive_dir=None):
+    """One page of an item's history, newest first, ordered by (timestamp, id).
+    
+    Rows are (action, quantity, timestamp, location, notes, id).  The
+    (item_id, timestamp) index returns them already sorted, so each page
+    reads only ``limit`` rows however long the history is.  Once the live
+    table runs out, the page continues into the archive partitions that
+    hold this item's older history (with ``archive_dir``).
+    """
+    filters = ''
+    params = []
+    
+    if action:
+        filters += ' AND action = ?'
+        params.append(action)
+    
+    if since:
+        filters += ' AND timestamp >= ?'
+        params.append(since)
+    
+    if until:
+        filters += ' AND timestamp <= ?'
+        params.append(until)
+    
+    def page(table, before, count):
+        sql = f'SELECT action, quantity, timestamp, location, notes, id FROM {table} WHERE item_id = ?'
+        key = []
+        if before:
+            sql += ' AND (timestamp, id) < (?, ?)'
+            key = list(before)
+        # Fetch one extra row to know whether another page exists
+        cursor.execute(sql + filters + ' ORDER BY timestamp DESC, id DESC LIMIT ?',
+                       [item_id] + key + params + [count])
+        return cursor.fetchall()
+    
+    transactions = page('main.transactions', before, limit + 1)
+    
+    if len(transactions) <= limit and archive_dir:
+        older = (transactions[-1][2], transactions[-1][5]) if transactions else before
+        months = archive.item_months(cursor.connection, item_id, older and older[0], since, until)
+        for _ in archive.each_partition(cursor.connection, archive_dir, months):
+            rows = page('archive.transactions', older, limit + 1 - len(transactions))
+            transactions.extend(rows)
+            if len(transactions) > limit:
+                break
+            if rows:
+                older = rows[-1][2], rows[-1][5]
+    
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1][2], transactions[-1][5])
+    
+    return transactions, next_cursor
+
+@route('/')
+@conditional(items_version)
 def index():
-    conn = sqlite3.connect('inventory.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get all items
-    cursor.execute('''
-        SELECT id, name, description, category, location, quantity, date_added
-        FROM items ORDER BY name
-    ''')
-    items = cursor.fetchall()
-    
-    # Get unique locations and categories for filters
-    cursor.execute('SELECT DISTINCT location FROM items WHERE location IS NOT NULL')
-    locations = [row[0] for row in cursor.fetchall()]
+    # First page only - the rest is loaded from /api/items as the user scrolls
+    items, next_cursor = fetch_items_page(cursor, current_app.config['ITEMS_PAGE_SIZE'])
     
-    cursor.execute('SELECT DISTINCT category FROM items WHERE category IS NOT NULL')
-    categories = [row[0] for row in cursor.fetchall()]
+    # Filter choices from the trigger-maintained count tables, not a scan of items
+    locations, categories = stats.filter_values(conn)
     
-    conn.close()
+    return render_template('index.html', items=items, next_cursor=next_cursor,
+                           locations=locations, categories=categories)
+
+@route('/api/items')
+@conditional(items_version, policy='api')
+def api_items():
+    """Paginated item listing with server-side filters"""
+    limit = request.args.get('limit', current_app.config['ITEMS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['ITEMS_PAGE_MAX']))
+    
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    items, next_cursor = fetch_items_page(
+        get_db().cursor(), limit, after,
+        query=request.args.get('q', '').strip(),
+        location=request.args.get('location', ''),
+        category=request.args.get('category', ''),
+    )
     
-    return render_template('index.html', items=items, locations=locations, categories=categories)
+    return jsonify({
+        'items': [{
+            'id': item[0],
+            'name': item[1],
+            'description': item[2] or '',
+            'category': item[3] or '',
+            'location': item[4] or '',
+            'quantity': item[5],
+            'date_added': item[6]
+        } for item in items],
+        'next_cursor': next_cursor
+    })
 
-@app.route('/add_item', methods=['GET', 'POST'])
+@route('/add_item', methods=['GET', 'POST'])
 def add_item():
     if request.method == 'POST':
-        item_id = generate_item_id()  # Generate sequential ID
         name = request.form['name']
         description = request.form.get('description', '')
         category = request.form.get('category', '')
         location = request.form.get('location', '')
         quantity = int(request.form.get('quantity', 1))
         
-        # Generate QR code
-        qr_code = generate_qr_code(item_id)
-        
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO items (id, name, description, category, location, quantity, qr_code)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (item_id, name, description, category, location, quantity, qr_code))
-        
-        # Log transaction
-        cursor.execute('''
-            INSERT INTO transactions (item_id, action, quantity, location, notes)
-            VALUES (?, 'added', ?, ?, 'Item added to inventory')
-        ''', (item_id, quantity, location))
-        
-        conn.commit()
-        conn.close()
+        # The sequential ID is reserved in the same transaction as the insert
+        item_id = run_write(stock.add_item, name, description, category, location, quantity)
         
         flash(f'Item "{name}" added successfully with ID: {item_id}')
         return redirect(url_for('index'))
     
     return render_template('add_item.html')
 
-@app.route('/item/<item_id>')
+@route('/item/<item_id>')
+@conditional(item_history_version)
 def item_detail(item_id):
-    conn = sqlite3.connect('inventory.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get item details
-    cursor.execute('SELECT * FROM items WHERE id = ?', (item_id,))
+    cursor.execute('''
+        SELECT id, name, description, category, location, quantity, date_added, last_updated
+        FROM items WHERE id = ?
+    ''', (item_id,))
     item = cursor.fetchone()
     
     if not item:
         flash('Item not found')
         return redirect(url_for('index'))
     
-    # Get transaction history
-    cursor.execute('''
-        SELECT action, quantity, timestamp, location, notes
-        FROM transactions WHERE item_id = ?
-        ORDER BY timestamp DESC
-    ''', (item_id,))
-    transactions = cursor.fetchall()
-    
-    conn.close()
+    # Most recent transactions only - older ones come from /api/item/<id>/transactions
+    transactions, next_cursor = fetch_transactions_page(cursor, item_id, current_app.config['HISTORY_PAGE_SIZE'],
+                                                        archive_dir=current_app.config['ARCHIVE_DIR'])
     
-    return render_template('item_detail.html', item=item, transactions=transactions)
+    return render_template('item_detail.html', item=item, transactions=transactions,
+                           next_cursor=next_cursor)
 
-@app.route('/check_in_out/<item_id>', methods=['POST'])
-def check_in_out(item_id):
-    action = request.form['action']  # 'check_in' or 'check_out'
-    quantity = int(request.form.get('quantity', 1))
-    location = request.form.get('location', '')
-    notes = request.form.get('notes', '')
-    
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    # Get current item
-    cursor.execute('SELECT quantity, location FROM items WHERE id = ?', (item_id,))
-    current = cursor.fetchone()
+@route('/api/item/<item_id>/transactions')
+@conditional(item_history_version, policy='api')
+def api_item_transactions(item_id):
+    """Paginated transaction history for one item, newest first.
+    
+    Query parameters: limit, cursor (from the previous page), action,
+    since and until (YYYY-MM-DD[ HH:MM:SS], inclusive).
+    """
+    limit = request.args.get('limit', current_app.config['HISTORY_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['HISTORY_PAGE_MAX']))
+    
+    before = None
+    if request.args.get('cursor'):
+        try:
+            before = decode_cursor(request.args['cursor'])
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
     
-    if not current:
+    try:
+        since = request.args.get('since', '').strip()
+        since = parse_timestamp_arg(since) if since else None
+        until = request.args.get('until', '').strip()
+        until = parse_timestamp_arg(until, end_of_day=True) if until else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'}), 400
+    
+    cursor = get_db().cursor()
+    cursor.execute('SELECT 1 FROM items WHERE id = ?', (item_id,))
+    if not cursor.fetchone():
         return jsonify({'error': 'Item not found'}), 404
     
-    current_qty, current_location = current
+    transactions, next_cursor = fetch_transactions_page(
+        cursor, item_id, limit, before,
+        action=request.args.get('action', ''),
+        since=since,
+        until=until,
+        archive_dir=current_app.config['ARCHIVE_DIR'],
+    )
     
-    # Update quantity and location
-    if action == 'check_in':
-        new_qty = current_qty + quantity
-    else:  # check_out
-        new_qty = max(0, current_qty - quantity)
+    return jsonify({
+        'transactions': [{
+            'id': transaction[5],
+            'action': transaction[0],
+            'quantity': transaction[1],
+            'timestamp': transaction[2],
+            'location': transaction[3] or '',
+            'notes': transaction[4] or ''
+        } for transaction in transactions],
+        'next_cursor': next_cursor
+    })
+
+@route('/api/item/<item_id>/daily')
+@conditional(item_history_version, policy='api')
+def api_item_daily(item_id):
+    """Transactions and units moved per day and action, archived days included.
     
-    new_location = location if location else current_location
+    Query parameters: since and until (YYYY-MM-DD, inclusive).
+    """
+    try:
+        since = request.args.get('since', '').strip()
+        since = parse_timestamp_arg(since)[:10] if since else None
+        until = request.args.get('until', '').strip()
+        until = parse_timestamp_arg(until)[:10] if until else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    
+    conn = get_db()
+    if not conn.execute('SELECT 1 FROM items WHERE id = ?', (item_id,)).fetchone():
+        return jsonify({'error': 'Item not found'}), 404
     
-    cursor.execute('''
-        UPDATE items SET quantity = ?, location = ?, last_updated = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (new_qty, new_location, item_id))
+    return jsonify({'days': [
+        {'day': day, 'action': action, 'transactions': count, 'quantity': quantity}
+        for day, action, count, quantity in archive.daily_activity(conn, item_id, since, until)
+    ]})
+
+@route('/api/stock')
+@conditional(stock_version, policy='api')
+def api_stock():
+    """Stock levels as of a past time, for one item or one location.
+    
+    Query parameters: at (YYYY-MM-DD[ HH:MM:SS] UTC; a bare date means the
+    end of that day) and either item_id or location.  Answered from the
+    nearest snapshot (stock_history.py) plus the transactions after it.
+    """
+    try:
+        at = parse_timestamp_arg(request.args.get('at', '').strip(), end_of_day=True)
+    except ValueError:
+        return jsonify({'error': 'at must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'}), 400
+    item_id = request.args.get('item_id', '').strip()
+    location = request.args.get('location')
+    if bool(item_id) == (location is not None):
+        return jsonify({'error': 'Give either item_id or location'}), 400
+    
+    conn = get_db()
+    if item_id and not conn.execute('SELECT 1 FROM items WHERE id = ?', (item_id,)).fetchone():
+        return jsonify({'error': 'Item not found'}), 404
     
-    # Log transaction
-    cursor.execute('''
-        INSERT INTO transactions (item_id, action, quantity, location, notes)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (item_id, action, quantity, new_location, notes))
+    snapshot, replayed, levels = stock_history.stock_at(conn, at, item_id=item_id or None,
+                                                        location=(location or '').strip(),
+                                                        archive_dir=current_app.config['ARCHIVE_DIR'])
+    items = [{'item_id': key, 'quantity': quantity, 'location': where}
+             for key, (quantity, where) in sorted(levels.items())]
+    return jsonify({
+        'at': at,
+        'snapshot': snapshot,
+        'replayed': replayed,
+        'items': items,
+        'total_quantity': sum(item['quantity'] for item in items)
+    })
+
+@route('/check_in_out/<item_id>', methods=['POST'])
+def check_in_out(item_id):
+    try:
+        action, quantity = stock.parse_event(request.form.get('action'), request.form.get('quantity', 1))
+    except stock.ScanError as e:
+        return jsonify({'error': str(e)}), 400
+    location = request.form.get('location', '')
+    notes = request.form.get('notes', '')
     
-    conn.commit()
-    conn.close()
+    # Quantity is read and written by one UPDATE under the write lock
+    new_qty = run_write(stock.apply_movement, item_id, action, quantity, location, notes)
+    
+    if new_qty is None:
+        return jsonify({'error': 'Item not found'}), 404
     
     return jsonify({'success': True, 'new_quantity': new_qty})
 
-@app.route('/bulk_upload', methods=['GET', 'POST'])
+@route('/api/scan_batch', methods=['POST'])
+def scan_batch():
+    """Apply a batch of queued scans in one transaction.
+    
+    Body: {"events": [{"item_id": ..., "action": "check_in"|"check_out",
+    "quantity": 1, "location": "", "notes": ""}, ...]}.  Events are applied
+    in order; a bad event is reported in its result and skipped without
+    failing the others.
+    """
+    payload = request.get_json(silent=True)
+    events = payload.get('events') if isinstance(payload, dict) else payload
+    if not isinstance(events, list):
+        return jsonify({'error': 'Expected a JSON body with an "events" list'}), 400
+    if len(events) > current_app.config['SCAN_BATCH_MAX']:
+        return jsonify({'error': f'At most {current_app.config["SCAN_BATCH_MAX"]} events per batch'}), 413
+    
+    results = run_write(stock.apply_events, events)
+    
+    applied = sum(result['success'] for result in results)
+    return jsonify({'applied': applied, 'failed': len(results) - applied, 'results': results})
+
+@route('/bulk_upload', methods=['GET', 'POST'])
 def bulk_upload():
     if request.method == 'POST':
         if 'file' not in request.files:
@@ -233,76 +563,26 @@ def bulk_upload():
         
         if file and file.filename.lower().endswith('.csv'):
             try:
-                # Read CSV file
-                csv_content = file.read().decode('utf-8')
-                csv_reader = csv.DictReader(io.StringIO(csv_content))
-                
-                # Validate required columns
-                required_columns = ['name']
-                if not all(col in csv_reader.fieldnames for col in required_columns):
+                # Validate required columns before queueing the import
+                header = importer.read_header(file.stream)
+                if not all(col in header for col in importer.REQUIRED_COLUMNS):
                     flash('CSV must have at least a "name" column. Optional columns: description, category, location, quantity')
                     return redirect(request.url)
                 
-                conn = sqlite3.connect('inventory.db')
-                cursor = conn.cursor()
-                
-                items_added = 0
-                errors = []
-                
-                for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 (header is row 1)
-                    try:
-                        # Required field
-                        name = row.get('name', '').strip()
-                        if not name:
-                            errors.append(f"Row {row_num}: Name is required")
-                            continue
-                        
-                        # Optional fields
-                        description = row.get('description', '').strip()
-                        category = row.get('category', '').strip()
-                        location = row.get('location', '').strip()
-                        
-                        # Handle quantity
-                        quantity_str = row.get('quantity', '1').strip()
-                        try:
-                            quantity = int(quantity_str) if quantity_str else 1
-                            if quantity < 1:
-                                quantity = 1
-                        except ValueError:
-                            quantity = 1
-                        
-                        # Generate unique ID and QR code
-                        item_id = generate_item_id()  # Use sequential ID generator
-                        qr_code = generate_qr_code(item_id)
-                        
-                        # Insert item
-                        cursor.execute('''
-                            INSERT INTO items (id, name, description, category, location, quantity, qr_code)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (item_id, name, description, category, location, quantity, qr_code))
-                        
-                        # Log transaction
-                        cursor.execute('''
-                            INSERT INTO transactions (item_id, action, quantity, location, notes)
-                            VALUES (?, 'added', ?, ?, 'Bulk upload from CSV')
-                        ''', (item_id, quantity, location))
-                        
-                        items_added += 1
-                        
-                    except Exception as e:
-                        errors.append(f"Row {row_num}: {str(e)}")
+                # The upload only lives as long as this request, so keep a copy for the job
+                fd, upload_path = tempfile.mkstemp(prefix='import_', suffix='.csv')
+                with os.fdopen(fd, 'wb') as f:
+                    shutil.copyfileobj(file.stream, f)
                 
-                conn.commit()
-                conn.close()
+                job_id = importer.create_job(get_db(), secure_filename(file.filename))
+                importer.CSVImport(
+                    current_app.extensions['sqlite_pool'], job_id, upload_path,
+                    chunk_size=current_app.config['IMPORT_CHUNK_SIZE'],
+                    on_items_added=qr_prerenderer(),
+                ).start()
                 
-                # Show results
-                if items_added > 0:
-                    flash(f'Successfully added {items_added} items!')
-                
-                if errors:
-                    flash(f'Errors encountered: {"; ".join(errors[:5])}{"..." if len(errors) > 5 else ""}')
-                
-                return redirect(url_for('index'))
+                flash('Import started - progress is shown below')
+                return redirect(url_for('bulk_upload', job=job_id))
                 
             except Exception as e:
                 flash(f'Error processing CSV file: {str(e)}')
@@ -311,9 +591,30 @@ def bulk_upload():
             flash('Please upload a CSV file')
             return redirect(request.url)
     
-    return render_template('bulk_upload.html')
+    return render_template('bulk_upload.html', job_id=request.args.get('job'))
+
+@route('/bulk_upload/<job_id>')
+def bulk_upload_status(job_id):
+    """Progress of a background CSV import"""
+    error_limit = min(request.args.get('errors', 100, type=int), importer.MAX_STORED_ERRORS)
+    job = importer.get_job(get_db(), job_id, error_limit=error_limit)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify(job)
 
-@app.route('/download_template')
+def qr_prerenderer():
+    """Callback that warms the QR cache for newly imported items without
+    blocking the importer.  It runs on the importer's thread, outside any app
+    context, so it holds on to this app's cache and settings."""
+    qr_cache = current_app.extensions['qr_cache']
+    workers = current_app.config['QR_RENDER_WORKERS']
+    
+    def prerender(item_ids):
+        if workers > 0:
+            qr_cache.prerender(item_ids, executor=get_render_pool(workers))
+    return prerender
+
+@route('/download_template')
 def download_template():
     """Download CSV template file"""
     template_data = [
@@ -328,193 +629,203 @@ def download_template():
     writer = csv.writer(output)
     writer.writerows(template_data)
     
-    response = app.response_class(
+    response = current_app.response_class(
         output.getvalue(),
         mimetype='text/csv',
         headers={'Content-Disposition': 'attachment; filename=inventory_template.csv'}
     )
     return response
 
-@app.route('/export_inventory')
+def export_gzipped():
+    """Whether this export request will be gzip-compressed"""
+    return request.args.get('gzip') != '0' and 'gzip' in request.accept_encodings
+
+@route('/export_inventory')
+@conditional(export_version, policy='export')
 def export_inventory():
-    """Export current inventory to CSV"""
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, name, description, category, location, quantity, date_added, last_updated
-        FROM items ORDER BY name
-    ''')
-    items = cursor.fetchall()
-    conn.close()
+    """Stream the inventory as CSV or NDJSON, optionally gzip-compressed.
+    
+    Query parameters: format (csv|ndjson), include=transactions, location,
+    category, updated_since (YYYY-MM-DD[ HH:MM:SS]) and gzip=0 to disable
+    compression for clients that accept it.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exporter.FORMATS:
+        return jsonify({'error': 'Unsupported format'}), 400
+    
+    updated_since = request.args.get('updated_since', '').strip()
+    if updated_since:
+        try:
+            updated_since = parse_timestamp_arg(updated_since)
+        except ValueError:
+            return jsonify({'error': 'updated_since must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'}), 400
+    
+    chunks = exporter.iter_export(
+        get_db(), fmt,
+        include_transactions=request.args.get('include') == 'transactions',
+        archive_dir=current_app.config['ARCHIVE_DIR'],
+        location=request.args.get('location', ''),
+        category=request.args.get('category', ''),
+        updated_since=updated_since or None,
+    )
     
-    output = io.StringIO()
-    writer = csv.writer(output)
+    mimetype, extension = exporter.FORMATS[fmt]
+    headers = {
+        'Content-Disposition': f'attachment; filename=inventory_export.{extension}',
+        'Vary': 'Accept-Encoding',
+    }
     
-    # Write header
-    writer.writerow(['id', 'name', 'description', 'category', 'location', 'quantity', 'date_added', 'last_updated'])
+    if export_gzipped():
+        chunks = exporter.gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
     
-    # Write data
-    writer.writerows(items)
+    # Keep the request (and its pooled connection) alive while the body streams
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+@route('/qr/<item_id>.<fmt>')
+def qr_image(item_id, fmt):
+    """Render an item's QR code on demand (PNG or SVG)"""
+    if fmt not in MIMETYPES:
+        return jsonify({'error': 'Unsupported format'}), 404
+    
+    # The image depends only on the ID, so revalidation needs no DB or rendering work
+    qr_cache = current_app.extensions['qr_cache']
+    etag = qr_cache.key(item_id, fmt)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        cursor = get_db().cursor()
+        cursor.execute('SELECT 1 FROM items WHERE id = ?', (item_id,))
+        if cursor.fetchone() is None:
+            return jsonify({'error': 'Item not found'}), 404
+        
+        etag, image = qr_cache.get(item_id, fmt)
+        response = current_app.response_class(image, mimetype=MIMETYPES[fmt])
     
-    response = app.response_class(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=inventory_export.csv'}
-    )
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
     return response
 
-@app.route('/scan')
+@route('/scan')
 def scan():
-    return render_template('scan.html')
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM items WHERE id = ?', (item_id,))
-    item = cursor.fetchone()
-    
-    conn.close()
-    
-    if not item:
+    return render_template('scan.html', scanner_url=current_app.config['SCANNER_URL'])
+
+@route('/api/item/<item_id>')
+@conditional(item_history_version, policy='api')
+def api_item(item_id):
+    """Scanner lookup (also served by scanner_asgi)"""
+    item = stock.find_item(get_db().cursor(), item_id)
+    if item is None:
         return jsonify({'error': 'Item not found'}), 404
-    
-    return jsonify({
-        'id': item[0],
-        'name': item[1],
-        'description': item[2],
-        'category': item[3],
-        'location': item[4],
-        'quantity': item[5],
-        'date_added': item[6],
-        'qr_code': item[8]
-    })
+    return jsonify(item)
+
+def search_page_args():
+    """limit/offset query parameters for the search routes, clamped to sane values"""
+    limit = request.args.get('limit', current_app.config['SEARCH_LIMIT'], type=int)
+    offset = request.args.get('offset', 0, type=int)
+    return max(1, min(limit, current_app.config['SEARCH_LIMIT_MAX'])), max(0, offset)
 
-@app.route('/search')
+def cached_search_response(key, build):
+    """JSON response for a search, served from search_cache while the items
+    it was computed from are unchanged; ``build()`` returns the results"""
+    search_cache = current_app.extensions['search_cache']
+    version = items_version(get_db())
+    payload = search_cache.get(key, version)
+    if payload is None:
+        payload = jsonify(build()).get_data()
+        search_cache.put(key, version, payload)
+    return current_app.response_class(payload, mimetype=current_app.json.mimetype)
+
+@route('/search')
+@conditional(items_version, policy='api')
 def search():
-    query = request.args.get('q', '')
+    query = request.args.get('q', '').strip()
     location = request.args.get('location', '')
     category = request.args.get('category', '')
+    limit, offset = search_page_args()
     
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    sql = 'SELECT * FROM items WHERE 1=1'
-    params = []
-    
-    if query:
-        sql += ' AND (name LIKE ? OR description LIKE ?)'
-        params.extend([f'%{query}%', f'%{query}%'])
-    
-    if location:
-        sql += ' AND location = ?'
-        params.append(location)
-    
-    if category:
-        sql += ' AND category = ?'
-        params.append(category)
-    
-    cursor.execute(sql, params)
-    items = cursor.fetchall()
-    
-    conn.close()
+    def build():
+        items = search_index.search(get_db(), query, location, category, limit, offset)
+        return [{
+            'id': item[0],
+            'name': item[1],
+            'description': item[2],
+            'category': item[3],
+            'location': item[4],
+            'quantity': item[5]
+        } for item in items]
     
-    return jsonify([{
-        'id': item[0],
-        'name': item[1],
-        'description': item[2],
-        'category': item[3],
-        'location': item[4],
-        'quantity': item[5]
-    } for item in items])
+    return cached_search_response(('search', query, location, category, limit, offset), build)
 
-if __name__ == '__main__':
-    init_db()
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
 # ==============================================
 # 1. FLASK BACKEND UPDATES 
 # ==============================================
 
 #  route for DELETE functionality
-@app.route('/delete_item/<item_id>', methods=['POST'])
+@route('/delete_item/<item_id>', methods=['POST'])
 def delete_item(item_id):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    # Check if item exists
-    cursor.execute('SELECT name FROM items WHERE id = ?', (item_id,))
-    item = cursor.fetchone()
-    
-    if not item:
-        flash('Item not found')
-        return redirect(url_for('index'))
-    
     try:
-        # Delete from transactions first (foreign key constraint)
-        cursor.execute('DELETE FROM transactions WHERE item_id = ?', (item_id,))
-        
-        # Delete the item
-        cursor.execute('DELETE FROM items WHERE id = ?', (item_id,))
-        
-        conn.commit()
-        flash(f'Item "{item[0]}" deleted successfully!')
-        
+        name = run_write(stock.delete_item, item_id)
     except Exception as e:
-        conn.rollback()
         flash(f'Error deleting item: {str(e)}')
+        return redirect(url_for('index'))
     
-    finally:
-        conn.close()
+    if name is None:
+        flash('Item not found')
+    else:
+        flash(f'Item "{name}" deleted successfully!')
     
     return redirect(url_for('index'))
 
 # route for SEARCH functionality (fix the existing search)
-@app.route('/api/search')
+@route('/api/search')
+@conditional(items_version, policy='api')
 def api_search():
     query = request.args.get('q', '').strip()
     
     if not query:
         return jsonify({'error': 'Query parameter required'}), 400
     
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
+    limit, offset = search_page_args()
     
-    # Search by exact ID or partial name/description match
-    cursor.execute('''
-        SELECT id, name, description, category, location, quantity, qr_code
-        FROM items 
-        WHERE id = ? OR name LIKE ? OR description LIKE ?
-        ORDER BY 
-            CASE WHEN id = ? THEN 0 ELSE 1 END,
-            name
-    ''', (query, f'%{query}%', f'%{query}%', query))
-    
-    items = cursor.fetchall()
-    conn.close()
-    
-    results = []
-    for item in items:
-        results.append({
-            'id': item[0],
-            'name': item[1],
-            'description': item[2] or '',
-            'category': item[3] or '',
-            'location': item[4] or '',
-            'quantity': item[5],
-            'qr_code': item[6] or ''
-        })
-    
-    return jsonify(results)
+    def build():
+        # Exact ID first, then ID-prefix/name/description matches by relevance
+        items = search_index.search(get_db(), query, limit=limit, offset=offset)
+        
+        results = []
+        for item in items:
+            results.append({
+                'id': item[0],
+                'name': item[1],
+                'description': item[2] or '',
+                'category': item[3] or '',
+                'location': item[4] or '',
+                'quantity': item[5],
+                'qr_code': url_for('qr_image', item_id=item[0], fmt='png')
+            })
+        return results
+    
+    return cached_search_response(('api_search', query, limit, offset), build)
+
+@route('/api/search/cache')
+def api_search_cache():
+    """Search result cache counters for this worker"""
+    return jsonify(current_app.extensions['search_cache'].metrics())
 
 # route for PRINT functionality
-@app.route('/print/<print_type>/<item_id>')
+@route('/print/<print_type>/<item_id>')
+@conditional(item_history_version)
 def print_item(print_type, item_id):
-    conn = sqlite3.connect('inventory.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM items WHERE id = ?', (item_id,))
+    cursor.execute('''
+        SELECT id, name, description, category, location, quantity, date_added, last_updated
+        FROM items WHERE id = ?
+    ''', (item_id,))
     item = cursor.fetchone()
-    conn.close()
     
     if not item:
         flash('Item not found')
@@ -528,108 +839,98 @@ def print_item(print_type, item_id):
         flash('Invalid print type')
         return redirect(url_for('item_detail', item_id=item_id))
 
+@route('/print/labels', methods=['GET', 'POST'])
+def print_labels():
+    """Batch label sheets for a list of IDs, an ID range or a filter.
+
+    format=html streams printable sheets, pdf one page per sheet and zip one
+    PNG per item.  cols/rows set the sheet grid.
+    """
+    params = request.values
+    fmt = params.get('format', 'html')
+    if fmt not in labels.FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(labels.FORMATS)}'}), 400
+    
+    default_columns, default_rows = current_app.config['LABEL_GRID']
+    columns = max(1, min(params.get('cols', default_columns, type=int), 10))
+    rows = max(1, min(params.get('rows', default_rows, type=int), 20))
+    show_info = params.get('info', '1') == '1'
+    
+    try:
+        id_range = labels.parse_range(params['range']) if params.get('range') else None
+        items = labels.select_items(
+            get_db(),
+            ids=labels.parse_ids(params.get('ids')),
+            id_range=id_range,
+            location=params.get('location', ''),
+            category=params.get('category', ''),
+            query=params.get('q', '').strip(),
+            limit=current_app.config['LABEL_BATCH_MAX'],
+        )
+    except labels.LabelError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Render missing QR codes across the pool up front; the response then
+    # only reads them back from the cache
+    qr_cache = current_app.extensions['qr_cache']
+    if current_app.config['QR_RENDER_WORKERS'] > 0:
+        item_ids = [item[0] for item in items]
+        futures = qr_cache.prerender(item_ids, 'svg' if fmt == 'html' else 'png',
+                                     executor=get_render_pool(current_app.config['QR_RENDER_WORKERS']))
+        for future in futures:
+            future.result()
+    
+    if fmt == 'html':
+        return stream_template('print_labels.html', sheets=labels.sheets(items, columns, rows),
+                               total=len(items), columns=columns, rows=rows, show_info=show_info)
+    
+    if fmt == 'zip':
+        body = labels.iter_png_zip(items, qr_cache)
+    else:
+        body = labels.iter_pdf(items, qr_cache, columns, rows, show_info)
+    filename = f'labels_{items[0][0]}-{items[-1][0]}.{fmt}'
+    return current_app.response_class(body, mimetype=labels.FORMATS[fmt],
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 # ==============================================
 # DATABASE BACKUP SOLUTION
 # ==============================================
 
-import shutil
-import zipfile
-from datetime import datetime
-import os
-
-@app.route('/backup_database')
+@route('/backup_database')
 def backup_database():
-    """Create and download database backup"""
+    """Stream a consistent backup ZIP of the live database.
+    
+    ?archives_since=<created time from an earlier backup's manifest> leaves
+    out the archive partitions that have not changed since that backup.
+    """
+    archives_since = request.args.get('archives_since', '').strip()
+    try:
+        archives_since = parse_timestamp_arg(archives_since) if archives_since else None
+    except ValueError:
+        flash('archives_since must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+        return redirect(url_for('database_info'))
+    
     try:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_filename = f'inventory_backup_{timestamp}.zip'
         
-        # Create temporary backup directory
-        backup_dir = 'temp_backup'
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        # Copy database file
-        if os.path.exists('inventory.db'):
-            shutil.copy2('inventory.db', os.path.join(backup_dir, 'inventory.db'))
-        
-        # Export data to CSV as well
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        
-        # Export items
-        cursor.execute('SELECT * FROM items ORDER BY date_added')
-        items = cursor.fetchall()
-        
-        # Export transactions
-        cursor.execute('SELECT * FROM transactions ORDER BY timestamp')
-        transactions = cursor.fetchall()
-        
-        conn.close()
-        
-        # Write items CSV
-        with open(os.path.join(backup_dir, 'items_backup.csv'), 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['id', 'name', 'description', 'category', 'location', 'quantity', 'date_added', 'last_updated', 'qr_code'])
-            writer.writerows(items)
-        
-        # Write transactions CSV
-        with open(os.path.join(backup_dir, 'transactions_backup.csv'), 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['id', 'item_id', 'action', 'quantity', 'timestamp', 'location', 'notes'])
-            writer.writerows(transactions)
-        
-        # Create README file
-        readme_content = f"""INVENTORY DATABASE BACKUP
-Created: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-FILES INCLUDED:
-- inventory.db: SQLite database file (can be used to restore full database)
-- items_backup.csv: All inventory items in CSV format
-- transactions_backup.csv: All transaction history in CSV format
-
-RESTORE INSTRUCTIONS:
-1. Replace your current inventory.db with the backed up inventory.db file
-2. Or use the CSV files to import data into a new database
-
-BACKUP STATISTICS:
-- Total Items: {len(items)}
-- Total Transactions: {len(transactions)}
-"""
-        
-        with open(os.path.join(backup_dir, 'README.txt'), 'w') as f:
-            f.write(readme_content)
-        
-        # Create ZIP file
-        zip_path = os.path.join('temp', backup_filename)
-        if not os.path.exists('temp'):
-            os.makedirs('temp')
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(backup_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, backup_dir)
-                    zipf.write(file_path, arcname)
-        
-        # Clean up temporary directory
-        shutil.rmtree(backup_dir)
-        
-        # Send file
-        def remove_file(response):
-            try:
-                os.remove(zip_path)
-            except Exception:
-                pass
-            return response
-        
-        return send_from_directory('temp', backup_filename, as_attachment=True)
+        # Take the snapshot up front so failures can still be reported to the user
+        snapshot_path = backups.snapshot(current_app.config['DATABASE'], current_app.config['BACKUP_PAGES_PER_STEP'])
         
     except Exception as e:
         flash(f'Error creating backup: {str(e)}')
         return redirect(url_for('index'))
+    
+    response = current_app.response_class(
+        backups.stream_backup(snapshot_path, current_app.config['ARCHIVE_DIR'], archives_since),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={backup_filename}'}
+    )
+    # The body generator cleans up only if it runs; HEAD and early disconnects never start it
+    response.call_on_close(lambda: backups.discard(snapshot_path))
+    return response
 
-@app.route('/restore_database', methods=['GET', 'POST'])
+@route('/restore_database', methods=['GET', 'POST'])
 def restore_database():
     """Restore database from backup file"""
     if request.method == 'POST':
@@ -643,45 +944,23 @@ def restore_database():
             return redirect(request.url)
         
         if file and file.filename.lower().endswith('.zip'):
+            source = 'csv' if request.form.get('source') == 'csv' else 'database'
+            db_path = current_app.config['DATABASE']
             try:
-                # Create temporary directory for extraction
-                extract_dir = 'temp_restore'
-                if os.path.exists(extract_dir):
-                    shutil.rmtree(extract_dir)
-                os.makedirs(extract_dir)
-                
-                # Save uploaded file
-                zip_path = os.path.join(extract_dir, 'backup.zip')
-                file.save(zip_path)
-                
-                # Extract ZIP file
-                with zipfile.ZipFile(zip_path, 'r') as zipf:
-                    zipf.extractall(extract_dir)
-                
-                # Check if database file exists in backup
-                db_backup_path = os.path.join(extract_dir, 'inventory.db')
-                if os.path.exists(db_backup_path):
-                    # Backup current database
-                    if os.path.exists('inventory.db'):
-                        backup_current = f'inventory_backup_before_restore_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-                        shutil.copy2('inventory.db', backup_current)
-                        flash(f'Current database backed up as: {backup_current}')
-                    
-                    # Restore database
-                    shutil.copy2(db_backup_path, 'inventory.db')
-                    flash('Database restored successfully!')
-                else:
-                    flash('No database file found in backup')
-                
-                # Clean up
-                shutil.rmtree(extract_dir)
+                # Backup current database
+                backup_current = backups.save_current(db_path, current_app.config['BACKUP_PAGES_PER_STEP'])
+                flash(f'Current database backed up as: {backup_current}')
                 
+                # Restored in place: every worker keeps its connections and
+                # simply sees the new data
+                totals = backups.restore_archive(db_path, file.stream, source=source,
+                                                 archive_dir=current_app.config['ARCHIVE_DIR'])
+                flash(f'Database restored successfully! {totals["total_items"]} items, '
+                      f'{totals["total_transactions"]} transactions')
                 return redirect(url_for('index'))
                 
             except Exception as e:
                 flash(f'Error restoring database: {str(e)}')
-                if os.path.exists('temp_restore'):
-                    shutil.rmtree('temp_restore')
                 return redirect(request.url)
         else:
             flash('Please upload a ZIP file')
@@ -689,31 +968,26 @@ def restore_database():
     
     return render_template('restore_database.html')
 
-@app.route('/database_info')
+@route('/database_info')
+@conditional(stats_version)
 def database_info():
     """Show database statistics and information"""
-    conn = sqlite3.connect('inventory.db')
+    return render_template('database_info.html', stats=collect_stats())
+
+
+def collect_stats():
+    """Counters from the stats tables plus file size and recent activity"""
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get database statistics
-    cursor.execute('SELECT COUNT(*) FROM items')
-    total_items = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM transactions')
-    total_transactions = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT SUM(quantity) FROM items')
-    total_quantity = cursor.fetchone()[0] or 0
-    
-    cursor.execute('SELECT COUNT(DISTINCT location) FROM items WHERE location IS NOT NULL')
-    unique_locations = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(DISTINCT category) FROM items WHERE category IS NOT NULL')
-    unique_categories = cursor.fetchone()[0]
+    # Get database statistics (kept up to date by triggers)
+    result = stats.get_stats(conn)
+    result.update(archive.totals(conn))
     
     # Get database file size
-    db_size = os.path.getsize('inventory.db') if os.path.exists('inventory.db') else 0
-    db_size_mb = round(db_size / (1024 * 1024), 2)
+    db_path = current_app.config['DATABASE']
+    db_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+    result['db_size_mb'] = round(db_size / (1024 * 1024), 2)
     
     # Get recent activity
     cursor.execute('''
@@ -723,54 +997,69 @@ def database_info():
         ORDER BY t.timestamp DESC 
         LIMIT 10
     ''')
-    recent_activity = cursor.fetchall()
-    
-    conn.close()
-    
-    stats = {
-        'total_items': total_items,
-        'total_transactions': total_transactions,
-        'total_quantity': total_quantity,
-        'unique_locations': unique_locations,
-        'unique_categories': unique_categories,
-        'db_size_mb': db_size_mb,
-        'recent_activity': recent_activity
-    }
+    result['recent_activity'] = cursor.fetchall()
     
-    return render_template('database_info.html', stats=stats)
+    return result
 
-# ==============================================
-# SCHEDULED BACKUP (Optional - for automatic backups)
-# ==============================================
 
-def create_automated_backup():
-    """Create automated backup - can be called by a scheduler"""
+@route('/api/stats')
+@conditional(stats_version, policy='api')
+def api_stats():
+    """Database statistics as JSON"""
+    result = collect_stats()
+    result['recent_activity'] = [
+        {'name': name, 'action': action, 'quantity': quantity, 'timestamp': timestamp}
+        for name, action, quantity, timestamp in result['recent_activity']
+    ]
+    return jsonify(result)
+
+
+@route('/api/write_queue')
+def api_write_queue():
+    """Group-commit batch size and commit latency metrics for this worker"""
+    writer = current_app.extensions['write_queue']
+    if writer is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(writer.metrics(), enabled=True))
+
+
+@route('/metrics')
+def prometheus_metrics():
+    """Request, SQL and QR render metrics in Prometheus text format"""
+    if not current_app.config['METRICS']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@route('/database_info/recompute', methods=['POST'])
+def recompute_stats():
+    """Rebuild the statistics from scratch and report any drift"""
+    # Counts and rewrite under one write lock, or a write in between is lost from the stats
+    with immediate_transaction(get_db()) as conn:
+        drift = stats.recompute(conn)
+    
+    if drift:
+        details = ', '.join(f'{name}: {stored} → {actual}' for name, (stored, actual) in drift.items())
+        flash(f'Statistics corrected ({details})')
+    else:
+        flash('Statistics verified - no drift found')
+    return redirect(url_for('database_info'))
+
+@route('/database_info/archive', methods=['POST'])
+def archive_transactions():
+    """Move transactions older than ARCHIVE_AFTER_DAYS into the monthly archive"""
+    days = current_app.config['ARCHIVE_AFTER_DAYS']
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_dir = 'automated_backups'
-        
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        # Keep only last 30 backups
-        existing_backups = [f for f in os.listdir(backup_dir) if f.startswith('auto_backup_')]
-        existing_backups.sort(reverse=True)
-        
-        # Remove old backups (keep last 30)
-        for old_backup in existing_backups[30:]:
-            try:
-                os.remove(os.path.join(backup_dir, old_backup))
-            except:
-                pass
-        
-        # Create new backup
-        backup_filename = f'auto_backup_{timestamp}.db'
-        shutil.copy2('inventory.db', os.path.join(backup_dir, backup_filename))
-        
-        return True
+        moved = archive.archive_transactions(current_app.config['DATABASE'], current_app.config['ARCHIVE_DIR'], days)
     except Exception as e:
-        print(f"Automated backup failed: {e}")
-        return False
+        flash(f'Error archiving transactions: {str(e)}')
+        return redirect(url_for('database_info'))
+    
+    if moved:
+        flash(f'Archived {sum(moved.values())} transactions older than {days} days '
+              f'({", ".join(sorted(moved))})')
+    else:
+        flash(f'No transactions older than {days} days to archive')
+    return redirect(url_for('database_info'))
 
 # ==============================================
 # DATABASE STORAGE RECOMMENDATIONS
@@ -814,3 +1103,7 @@ RECOMMENDATION:
 Keep SQLite! It's perfect for personal inventory tracking.
 Add regular backups using the backup routes above.
 """
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    create_app().run(host='0.0.0.0', port=port, debug=True)
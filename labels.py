@@ -0,0 +1,179 @@
+"""Batch label sheets.
+
+Items are picked by a list of IDs, an ID range (P0001000-P0002000) or the
+dashboard filters, laid out on sheets of ``columns`` x ``rows`` labels and
+rendered as HTML (QR images served by the cached /qr route), a ZIP of PNGs
+or a PDF.  QR codes come from qr_codes.QRCache, so callers pre-render the
+whole batch on the process pool before streaming it.  Pillow is imported
+only when a PDF is rendered.
+"""
+import io
+import os
+import re
+import tempfile
+import zipfile
+
+import search_index
+from backups import COPY_BLOCK_SIZE, ChunkBuffer
+
+FORMATS = {
+    'html': 'text/html',
+    'pdf': 'application/pdf',
+    'zip': 'application/zip',
+}
+
+ID_SEPARATORS = re.compile(r'[\s,;]+')
+RANGE_PATTERN = re.compile(r'^\s*(\S+?)\s*(?:-|–|—|\.\.)\s*(\S+)\s*$')
+IDS_PER_QUERY = 500
+
+# PDF pages: US Letter at 150 DPI, 1-bit, with half-inch margins
+PDF_DPI = 150
+PDF_PAGE_SIZE = (int(8.5 * PDF_DPI), int(11 * PDF_DPI))
+PDF_MARGIN = PDF_DPI // 2
+
+
+class LabelError(ValueError):
+    """The label request cannot be served as asked"""
+
+
+def parse_ids(text):
+    """Item IDs from a comma/space/newline separated list"""
+    return [item_id for item_id in ID_SEPARATORS.split(text or '') if item_id]
+
+
+def parse_range(text):
+    """(first, last) from "P0001000-P0002000" (also – or ..)"""
+    match = RANGE_PATTERN.match(text or '')
+    if not match:
+        raise LabelError('range must look like P0001000-P0002000')
+    first, last = match.groups()
+    return (first, last) if first <= last else (last, first)
+
+
+def select_items(conn, ids=None, id_range=None, location='', category='', query='', limit=5000):
+    """(id, name, location, category) rows for the labels, in ID order.
+
+    Raises LabelError when nothing is selected or more than ``limit`` items
+    would be printed.
+    """
+    columns = 'SELECT id, name, location, category FROM items'
+    if ids:
+        if len(ids) > limit:
+            raise LabelError(f'At most {limit} labels per batch')
+        rows = []
+        for i in range(0, len(ids), IDS_PER_QUERY):
+            chunk = ids[i:i + IDS_PER_QUERY]
+            rows.extend(conn.execute(f'{columns} WHERE id IN ({", ".join("?" * len(chunk))})', chunk))
+        rows.sort()
+    else:
+        sql = f'{columns} WHERE 1=1'
+        params = []
+        if id_range:
+            sql += ' AND id BETWEEN ? AND ?'
+            params.extend(id_range)
+        if query:
+            clause, clause_params = search_index.filter_clause(conn, query)
+            sql += ' AND ' + clause
+            params.extend(clause_params)
+        if location:
+            sql += ' AND location = ?'
+            params.append(location)
+        if category:
+            sql += ' AND category = ?'
+            params.append(category)
+        if not params:
+            raise LabelError('Choose items by ids, range or a filter')
+        rows = conn.execute(sql + ' ORDER BY id LIMIT ?', params + [limit + 1]).fetchall()
+        if len(rows) > limit:
+            raise LabelError(f'At most {limit} labels per batch; narrow the selection')
+
+    if not rows:
+        raise LabelError('No matching items')
+    return rows
+
+
+def sheets(items, columns, rows):
+    """Split items into pages of columns x rows labels"""
+    per_sheet = columns * rows
+    return [items[i:i + per_sheet] for i in range(0, len(items), per_sheet)]
+
+
+def iter_png_zip(items, qr_cache):
+    """Yield a ZIP archive of one <id>.png QR code per item"""
+    buffer = ChunkBuffer()
+    # PNGs are already compressed, so store them as they are
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for item in items:
+            zf.writestr(f'{item[0]}.png', qr_cache.get(item[0], 'png')[1])
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
+
+
+def _font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype('DejaVuSans.ttf', size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _fit(draw, text, font, width):
+    """Trim ``text`` with an ellipsis until it fits in ``width`` pixels"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def _render_page(page_items, qr_cache, columns, rows, show_info):
+    # Pillow is only loaded once someone asks for a PDF
+    from PIL import Image, ImageDraw
+
+    page = Image.new('1', PDF_PAGE_SIZE, 1)
+    draw = ImageDraw.Draw(page)
+    cell_w = (PDF_PAGE_SIZE[0] - 2 * PDF_MARGIN) // columns
+    cell_h = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // rows
+    font_size = max(10, min(cell_h // 10, 22))
+    font = _font(font_size)
+    text_lines = 2 if show_info else 1
+    text_h = text_lines * (font_size + 4)
+    qr_size = max(16, min(cell_w, cell_h - text_h) - 8)
+
+    for index, item in enumerate(page_items):
+        x = PDF_MARGIN + (index % columns) * cell_w
+        y = PDF_MARGIN + (index // columns) * cell_h
+        with Image.open(io.BytesIO(qr_cache.get(item[0], 'png')[1])) as qr:
+            qr_image = qr.convert('1').resize((qr_size, qr_size), Image.NEAREST)
+        page.paste(qr_image, (x + (cell_w - qr_size) // 2, y + 4))
+
+        lines = [item[0]]
+        if show_info:
+            lines.append(' · '.join(part for part in (item[1], item[2]) if part))
+        text_y = y + 4 + qr_size + 2
+        for line in lines:
+            line = _fit(draw, line, font, cell_w - 8)
+            draw.text((x + (cell_w - draw.textlength(line, font=font)) / 2, text_y), line, font=font, fill=0)
+            text_y += font_size + 4
+    return page
+
+
+def iter_pdf(items, qr_cache, columns, rows, show_info=True):
+    """Yield a PDF with one label sheet per page.
+
+    Pages are appended to a private temp file one at a time, so memory
+    stays at one page whatever the batch size.
+    """
+    fd, pdf_path = tempfile.mkstemp(prefix='labels_', suffix='.pdf')
+    os.close(fd)
+    try:
+        for number, page_items in enumerate(sheets(items, columns, rows)):
+            page = _render_page(page_items, qr_cache, columns, rows, show_info)
+            page.save(pdf_path, 'PDF', resolution=PDF_DPI, append=number > 0)
+        with open(pdf_path, 'rb') as f:
+            yield from iter(lambda: f.read(COPY_BLOCK_SIZE), b'')
+    finally:
+        os.remove(pdf_path)
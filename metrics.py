@@ -0,0 +1,371 @@
+"""Request, SQL and QR render metrics, exposed in Prometheus text format.
+
+init_app() times every request per endpoint (including the streamed body)
+and counts response bytes.  Connections opened with InstrumentedConnection
+count and time every SQL statement, both overall and per request; the
+statement text is normalised so literal-free SQL with different numbers of
+IN (?, ...) placeholders shares one series.
+
+Counters live in the worker process.  With METRICS_DIR set, each worker
+also writes a snapshot there (at most once a second and at exit) and
+/metrics sums every snapshot, so a scrape sees the whole gunicorn server
+whichever worker answers it.
+
+Opt-in slow logs go to the ``inventory.slow`` logger: SLOW_REQUEST_MS logs
+requests over the threshold with their statement breakdown, SLOW_QUERY_MS
+logs each statement over it together with its EXPLAIN QUERY PLAN.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_app_context, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+MAX_STATEMENTS = 500  # distinct statement series before the rest share "other"
+SNAPSHOT_INTERVAL = 1.0  # seconds between METRICS_DIR writes per worker
+
+DESCRIPTIONS = {
+    'http_requests_total': ('counter', 'Requests handled by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Request time including the streamed body'),
+    'http_response_bytes_total': ('counter', 'Response body bytes sent'),
+    'http_request_sql_statements': ('histogram', 'SQL statements run per request'),
+    'http_request_sql_seconds': ('histogram', 'Time spent in SQL per request'),
+    'sql_statements_total': ('counter', 'SQL statements executed, by normalised statement'),
+    'sql_statement_seconds_total': ('counter', 'Time spent executing and fetching, by statement'),
+    'sql_slow_statements_total': ('counter', 'Statements slower than SLOW_QUERY_MS'),
+    'qr_render_duration_seconds': ('histogram', 'Time to render a QR code on a cache miss'),
+}
+
+slow_log = logging.getLogger('inventory.slow')
+
+WHITESPACE = re.compile(r'\s+')
+PLACEHOLDER_LIST = re.compile(r'\bIN \(\?(?:\s*,\s*\?)*\)', re.IGNORECASE)
+
+# Statement thresholds are read by cursors in any thread, so they are module
+# settings rather than app config
+slow_query_seconds = 0
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                    'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        """JSON-friendly copy of every series"""
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self.histograms.items()],
+            }
+
+
+registry = Registry()
+_statement_keys = {}
+_snapshot_state = {'dir': None, 'last': 0.0}
+
+
+def statement_key(sql):
+    """Normalised statement text used as the ``statement`` label"""
+    key = _statement_keys.get(sql)
+    if key is None:
+        key = PLACEHOLDER_LIST.sub('IN (?, ...)', WHITESPACE.sub(' ', sql).strip())[:200]
+        if len(_statement_keys) >= MAX_STATEMENTS:
+            return 'other'
+        _statement_keys[sql] = key
+    return key
+
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN rows for a statement, as text lines"""
+    try:
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f'(no plan: {e})']
+    return [row[-1] for row in rows]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute and fetch calls per statement"""
+
+    _statement = None
+    _elapsed = 0.0
+    _parameters = ()
+    _reported = False
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, None, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def _begin(self, sql, parameters, seconds):
+        self._statement = statement_key(sql)
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+        self._reported = False
+        registry.inc('sql_statements_total', statement=self._statement)
+        if has_app_context() and '_sql' in g:
+            g._sql[self._statement][0] += 1
+        self._add(seconds)
+
+    def _add(self, seconds):
+        if self._statement is None:
+            return
+        self._elapsed += seconds
+        registry.inc('sql_statement_seconds_total', seconds, statement=self._statement)
+        if has_app_context() and '_sql' in g:
+            g._sql[self._statement][1] += seconds
+        if slow_query_seconds and not self._reported and self._elapsed >= slow_query_seconds:
+            self._reported = True
+            self._report_slow()
+
+    def _report_slow(self):
+        registry.inc('sql_slow_statements_total', statement=self._statement)
+        # executemany has no single parameter set to plan with
+        plan = explain(self.connection, self._sql, self._parameters) if self._parameters is not None else []
+        slow_log.warning('slow query %.1fms: %s params=%r\n  plan: %s', self._elapsed * 1000,
+                         self._statement, self._parameters, '\n        '.join(plan) or '-')
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors are InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute would otherwise use a plain cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def observe_qr_render(fmt, seconds):
+    registry.observe('qr_render_duration_seconds', seconds, fmt=fmt)
+
+
+def _counting(body, endpoint):
+    """Pass a streamed body through, counting its bytes"""
+    sent = 0
+    try:
+        for chunk in body:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        registry.inc('http_response_bytes_total', sent, endpoint=endpoint)
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def _start_request():
+    g._request_start = time.perf_counter()
+    g._sql = defaultdict(lambda: [0, 0.0])
+
+
+def _finish_request(response, app):
+    start = g.get('_request_start')
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'none'
+    method = request.method
+    status = str(response.status_code)
+    sql = g._sql
+    slow_request_seconds = app.config['SLOW_REQUEST_MS'] / 1000
+
+    if response.is_streamed and response.content_length is None:
+        response.response = _counting(response.response, endpoint)
+    else:
+        registry.inc('http_response_bytes_total', response.content_length or 0, endpoint=endpoint)
+
+    def finished():
+        # Runs once the body has been sent, so streamed responses are timed in full
+        seconds = time.perf_counter() - start
+        statements = sum(count for count, _ in sql.values())
+        sql_seconds = sum(elapsed for _, elapsed in sql.values())
+        registry.inc('http_requests_total', endpoint=endpoint, method=method, status=status)
+        registry.observe('http_request_duration_seconds', seconds, endpoint=endpoint)
+        registry.observe('http_request_sql_statements', statements, COUNT_BUCKETS, endpoint=endpoint)
+        registry.observe('http_request_sql_seconds', sql_seconds, endpoint=endpoint)
+        if slow_request_seconds and seconds >= slow_request_seconds:
+            top = sorted(sql.items(), key=lambda item: item[1][1], reverse=True)[:5]
+            slow_log.warning('slow request %.1fms: %s %s -> %s, %d statements in %.1fms%s',
+                             seconds * 1000, method, request_path, status, statements, sql_seconds * 1000,
+                             ''.join(f'\n  {elapsed * 1000:8.1f}ms x{count:<4} {statement}'
+                                     for statement, (count, elapsed) in top))
+        maybe_write_snapshot()
+
+    request_path = request.full_path.rstrip('?')
+    response.call_on_close(finished)
+    return response
+
+
+def init_app(app):
+    """Instrument every request of ``app`` (see the module docstring)"""
+    global slow_query_seconds
+    app.config.setdefault('SLOW_REQUEST_MS', 0)
+    app.config.setdefault('SLOW_QUERY_MS', 0)
+    app.config.setdefault('METRICS_DIR', None)
+    slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+    _snapshot_state['dir'] = app.config['METRICS_DIR']
+    if _snapshot_state['dir']:
+        os.makedirs(_snapshot_state['dir'], exist_ok=True)
+        atexit.register(write_snapshot)
+
+    app.before_request(_start_request)
+    app.after_request(lambda response: _finish_request(response, app))
+
+
+def write_snapshot():
+    """Write this worker's series to METRICS_DIR/<pid>.json"""
+    directory = _snapshot_state['dir']
+    if not directory:
+        return
+    _snapshot_state['last'] = time.monotonic()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def maybe_write_snapshot():
+    if _snapshot_state['dir'] and time.monotonic() - _snapshot_state['last'] >= SNAPSHOT_INTERVAL:
+        write_snapshot()
+
+
+def _snapshots():
+    """Every worker's snapshot (this worker's taken live)"""
+    directory = _snapshot_state['dir']
+    if not directory:
+        return [registry.snapshot()]
+
+    write_snapshot()
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # a worker replacing its file right now
+    return snapshots
+
+
+def _labels(labels, extra=()):
+    pairs = sorted(labels.items()) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """Prometheus text exposition of every series, summed across workers"""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in _snapshots():
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(sorted(labels.items())))] += value
+        for name, labels, histogram in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = dict(histogram, counts=list(histogram['counts']))
+            else:
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+                merged['sum'] += histogram['sum']
+                merged['count'] += histogram['count']
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((dict(labels), value))
+    for (name, labels), histogram in histograms.items():
+        by_name[name].append((dict(labels), histogram))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = DESCRIPTIONS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name], key=lambda series: sorted(series[0].items())):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {value:g}')
+                continue
+            cumulative = 0
+            for bound, count in zip(value['buckets'], value['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", f"{bound:g}")])} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {value["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {value["sum"]:g}')
+            lines.append(f'{name}_count{_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,315 @@
+"""Versioned schema migrations keyed on PRAGMA user_version.
+
+Each migration runs once, in order, in the same transaction that bumps
+user_version, so a worker that crashes half way leaves nothing half applied.
+The runner takes the write lock up front (BEGIN IMMEDIATE) and re-reads the
+version under it, which makes it safe for every gunicorn worker to call at
+startup.
+
+Check that the hot queries use their indexes with:
+
+    python migrations.py --check-plans [path/to/inventory.db]
+"""
+import sqlite3
+import sys
+
+import archive
+import data_version
+import search_index
+import stats
+import stock_history
+
+
+def _base_schema(cursor):
+    # Items table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS items (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            category TEXT,
+            location TEXT,
+            quantity INTEGER DEFAULT 1,
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            qr_code TEXT
+        )
+    ''')
+
+    # Transactions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id TEXT,
+            action TEXT,
+            quantity INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            location TEXT,
+            notes TEXT,
+            FOREIGN KEY (item_id) REFERENCES items (id)
+        )
+    ''')
+
+    # Counter table for sequential IDs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS id_counter (
+            counter INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Initialize counter if empty
+    cursor.execute('SELECT COUNT(*) FROM id_counter')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('INSERT INTO id_counter (counter) VALUES (0)')
+
+
+def _import_jobs(cursor):
+    # Background CSV import progress (shared by all workers)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT,
+            status TEXT,
+            rows_processed INTEGER DEFAULT 0,
+            items_added INTEGER DEFAULT 0,
+            error_count INTEGER DEFAULT 0,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            message TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_errors (
+            job_id TEXT,
+            row_num INTEGER,
+            message TEXT
+        )
+    ''')
+
+
+def _drop_qr_blobs(cursor):
+    # QR images used to be stored inline as base64 data URLs; they are now
+    # rendered on demand by /qr/<item_id>.png
+    cursor.execute('UPDATE items SET qr_code = NULL WHERE qr_code IS NOT NULL')
+    return cursor.rowcount > 0  # worth a VACUUM to give the space back
+
+
+def _hot_query_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_name ON items (name, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_location ON items (location)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_category ON items (category)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_item_time ON transactions (item_id, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_errors_job ON import_errors (job_id, row_num)')
+
+
+def _full_text_search(cursor):
+    search_index.install(cursor.connection)
+
+
+def _export_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_last_updated ON items (last_updated)')
+
+
+def _change_log(cursor):
+    # Keys of rows written since the last automated backup; incremental
+    # backups copy just those rows (see backup_scheduler.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key
+        )
+    ''')
+    for table in ('items', 'transactions'):
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    INSERT INTO change_log (table_name, row_key) VALUES ('{table}', {row}.id);
+                END
+            ''')
+
+
+def _change_log_on_demand(cursor):
+    # Logging now starts with the first automated full backup
+    # (backup_scheduler.log_changes); until then writes pay for no trigger
+    for table in ('items', 'transactions'):
+        for event in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_change_log_{event}')
+    cursor.execute('DELETE FROM change_log')
+
+
+def _materialized_stats(cursor):
+    stats.install(cursor.connection)
+
+
+def _data_versions(cursor):
+    data_version.install(cursor.connection)
+
+
+def _transaction_archive(cursor):
+    archive.install(cursor.connection)
+
+
+def _stock_snapshots(cursor):
+    stock_history.install(cursor.connection)
+
+
+def _stock_snapshot_versions(cursor):
+    stock_history.install_versions(cursor.connection)
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, 'base schema', _base_schema),
+    (2, 'import job tables', _import_jobs),
+    (3, 'drop stored QR code blobs', _drop_qr_blobs),
+    (4, 'indexes for hot queries', _hot_query_indexes),
+    (5, 'FTS5 search index', _full_text_search),
+    (6, 'index for incremental exports', _export_indexes),
+    (7, 'change log for incremental backups', _change_log),
+    (8, 'trigger-maintained statistics', _materialized_stats),
+    (9, 'data versions for HTTP caching', _data_versions),
+    (10, 'transaction archive catalog and daily rollups', _transaction_archive),
+    (11, 'stock level snapshots', _stock_snapshots),
+    (12, 'change log only while incremental backups run', _change_log_on_demand),
+    (13, 'data version for stock snapshots', _stock_snapshot_versions),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations and return the list of versions applied"""
+    if current_version(conn) >= SCHEMA_VERSION:
+        return []
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # we issue BEGIN/COMMIT ourselves
+    applied = []
+    vacuum = False
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have migrated while we waited for the lock
+            version = current_version(conn)
+            for number, description, migration in MIGRATIONS:
+                if number <= version:
+                    continue
+                vacuum = migration(cursor) or vacuum
+                cursor.execute(f'PRAGMA user_version = {number}')
+                applied.append(number)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+
+        if vacuum:
+            cursor.execute('VACUUM')
+            # VACUUM may renumber rowids, which the FTS index is keyed on
+            if search_index.is_installed(conn):
+                search_index.rebuild(conn)
+    finally:
+        conn.isolation_level = isolation_level
+
+    return applied
+
+
+# Queries that must be served by an index, with the index expected in their plan
+HOT_QUERIES = [
+    ('item_detail history', 'idx_transactions_item_time', '''
+        SELECT action, quantity, timestamp, location, notes, id
+        FROM transactions WHERE item_id = 'P0000001'
+        ORDER BY timestamp DESC, id DESC LIMIT 21
+    '''),
+    ('item history next page', 'idx_transactions_item_time', '''
+        SELECT action, quantity, timestamp, location, notes, id
+        FROM transactions WHERE item_id = 'P0000001'
+        AND (timestamp, id) < ('2024-01-01 00:00:00', 100) AND action = 'check_out'
+        ORDER BY timestamp DESC, id DESC LIMIT 21
+    '''),
+    ('database_info recent activity', 'idx_transactions_timestamp', '''
+        SELECT i.name, t.action, t.quantity, t.timestamp
+        FROM transactions t
+        JOIN items i ON t.item_id = i.id
+        ORDER BY t.timestamp DESC
+        LIMIT 10
+    '''),
+    ('delete_item transactions', 'idx_transactions_item_time', '''
+        DELETE FROM transactions WHERE item_id = 'P0000001'
+    '''),
+    ('archive candidates', 'idx_transactions_timestamp', '''
+        SELECT MIN(timestamp) FROM transactions WHERE timestamp < '2024-01-01 00:00:00'
+    '''),
+    ('archived months of an item', 'PRIMARY KEY', '''
+        SELECT day FROM transaction_rollups
+        WHERE item_id = 'P0000001' AND day <= '2024-01-01' ORDER BY day DESC
+    '''),
+    ('nearest stock snapshot', 'sqlite_autoindex_stock_snapshots_1', '''
+        SELECT id, taken_at FROM stock_snapshots WHERE taken_at <= '2024-01-01 00:00:00'
+        ORDER BY taken_at DESC LIMIT 1
+    '''),
+    ('stock snapshot by location', 'idx_snapshot_items_location', '''
+        SELECT item_id, quantity, location FROM stock_snapshot_items
+        WHERE snapshot_id = 1 AND location = 'Garage'
+    '''),
+    ('stock replay window', 'idx_transactions_timestamp', '''
+        SELECT id, timestamp, item_id, action, quantity, location FROM main.transactions
+        WHERE timestamp <= '2024-01-08 00:00:00' AND timestamp > '2024-01-01 00:00:00'
+    '''),
+    ('stock replay window for an item', 'idx_transactions_item_time', '''
+        SELECT id, timestamp, item_id, action, quantity, location FROM main.transactions
+        WHERE timestamp <= '2024-01-08 00:00:00' AND timestamp > '2024-01-01 00:00:00' AND item_id = 'P0000001'
+    '''),
+    ('dashboard page', 'idx_items_name', '''
+        SELECT id, name FROM items WHERE (name, id) > ('a', 'P0000001')
+        ORDER BY name, id LIMIT 51
+    '''),
+    ('location filter', 'idx_items_location', '''
+        SELECT id, name FROM items WHERE location = 'Garage'
+    '''),
+    ('category filter', 'idx_items_category', '''
+        SELECT id, name FROM items WHERE category = 'Tools'
+    '''),
+    ('location list', 'idx_items_location', '''
+        SELECT DISTINCT location FROM items WHERE location IS NOT NULL
+    '''),
+    ('category list', 'idx_items_category', '''
+        SELECT DISTINCT category FROM items WHERE category IS NOT NULL
+    '''),
+    ('export updated_since', 'idx_items_last_updated', '''
+        SELECT id, name FROM items WHERE last_updated >= '2024-01-01 00:00:00'
+    '''),
+]
+
+
+def check_query_plans(conn):
+    """EXPLAIN QUERY PLAN each hot query; returns [(name, ok, plan_text)]"""
+    results = []
+    for name, index, sql in HOT_QUERIES:
+        plan = ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql))
+        ok = index in plan and 'TEMP B-TREE' not in plan
+        results.append((name, ok, plan))
+    return results
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    conn = sqlite3.connect(args[0] if args else ':memory:')
+    applied = migrate(conn)
+    print(f'Schema version {current_version(conn)} (applied: {applied or "none"})')
+
+    if '--check-plans' in sys.argv:
+        failures = 0
+        for name, ok, plan in check_query_plans(conn):
+            print(f'{"OK  " if ok else "FAIL"} {name}: {plan}')
+            failures += not ok
+        sys.exit(1 if failures else 0)
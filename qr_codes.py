@@ -0,0 +1,164 @@
+"""QR code rendering with a content-addressed memory + disk cache.
+
+QR images depend only on the encoded data and the render settings, so they are
+keyed by a hash of both.  That hash doubles as a strong ETag and never needs
+invalidating: a given item ID always renders to the same bytes.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def render_qr(data, fmt='png', box_size=10, border=5):
+    """Render ``data`` as a QR code and return the encoded image bytes"""
+    # qrcode and Pillow are imported on the first render, not at worker
+    # startup: most requests (and cache hits) never need them
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    if fmt == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+
+    buffered = io.BytesIO()
+    img.save(buffered)
+    return buffered.getvalue()
+
+
+class QRCache:
+    """Bounded in-memory LRU in front of an optional on-disk cache.
+
+    Disk entries are written to a temp file and renamed into place, so several
+    gunicorn workers can share one cache directory safely.
+    """
+
+    def __init__(self, directory=None, max_entries=512, box_size=10, border=5, on_render=None):
+        self.directory = directory
+        self.on_render = on_render  # called with (fmt, seconds) after each in-process render
+        self.max_entries = max_entries
+        self.box_size = box_size
+        self.border = border
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, data, fmt='png'):
+        """Content hash for ``data`` rendered as ``fmt`` (also used as the ETag)"""
+        raw = f'{fmt}:{self.box_size}:{self.border}:{data}'.encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def _disk_path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}')
+
+    def _remember(self, key, image):
+        with self._lock:
+            self._memory[key] = image
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, data, fmt='png'):
+        """Return ``(key, image_bytes)``, rendering only on a full cache miss"""
+        key = self.key(data, fmt)
+
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                return key, image
+
+        path = self._disk_path(key, fmt) if self.directory else None
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                image = f.read()
+        else:
+            start = time.perf_counter()
+            image = render_qr(data, fmt, self.box_size, self.border)
+            if self.on_render is not None:
+                self.on_render(fmt, time.perf_counter() - start)
+            if path:
+                self._write(path, image)
+
+        self._remember(key, image)
+        return key, image
+
+    def prerender(self, data_items, fmt='png', executor=None, chunk_size=250):
+        """Render any missing images into the disk cache using a process pool.
+
+        Rendering is pure CPU work that holds the GIL, so chunks are fanned out to
+        ``executor`` (see ``get_render_pool``) and written straight to disk by the
+        workers; nothing but a count travels back.  Returns the chunk futures.
+        """
+        if not self.directory:
+            return []
+        executor = executor or get_render_pool()
+        data_items = list(data_items)
+        return [
+            executor.submit(_render_chunk, self.directory, self.box_size, self.border,
+                            fmt, data_items[i:i + chunk_size])
+            for i in range(0, len(data_items), chunk_size)
+        ]
+
+    def _write(self, path, image):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def _render_chunk(directory, box_size, border, fmt, data_items):
+    """Process pool task: render one chunk into the disk cache"""
+    cache = QRCache(directory, max_entries=0, box_size=box_size, border=border)
+    rendered = 0
+    for data in data_items:
+        path = cache._disk_path(cache.key(data, fmt), fmt)
+        if not os.path.exists(path):
+            cache._write(path, render_qr(data, fmt, box_size, border))
+            rendered += 1
+    return rendered
+
+
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool(workers=None):
+    """Process pool shared by this worker process, created on first use.
+
+    Uses the spawn start method so children never inherit the parent's SQLite
+    handles or threads, and is recreated if the process has forked since.
+    """
+    global _render_pool, _render_pool_pid
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            _render_pool = ProcessPoolExecutor(
+                max_workers=workers or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _render_pool_pid = os.getpid()
+        return _render_pool
@@ -0,0 +1,69 @@
+"""In-process LRU cache of serialized query results.
+
+Entries are stored with the data version they were computed at and are
+only served while that version is still current, so a write in any worker
+(which bumps the version in the database) invalidates them everywhere on
+the next lookup.  Size and TTL bound memory and staleness of anything the
+version does not capture.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0      # dropped to stay within max_entries
+        self.expirations = 0    # older than ttl
+        self.invalidations = 0  # data changed since they were computed
+
+    def get(self, key, version):
+        """Cached payload for ``key`` at ``version``, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires, payload = entry
+                if entry_version != version:
+                    self.invalidations += 1
+                elif expires < time.monotonic():
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, payload):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,232 @@
+"""Async scanner API for handheld clients, served over ASGI.
+
+    uvicorn scanner_asgi:app --host 0.0.0.0 --port 8001 --workers 2
+
+Serves the scanner endpoints of inventory_app - GET /api/item/<id>,
+POST /check_in_out/<id> and POST /api/scan_batch - with the same requests
+and JSON, but a waiting scanner costs a coroutine instead of a worker
+thread.  Reads run on a bounded thread pool, one pooled connection per
+thread (database.ConnectionPool); every write goes to a single serialized
+writer per process (write_queue.WriteQueue), which also group-commits
+concurrent scans.
+
+It runs side by side with the Flask app on the same database file: data
+versions and stats are kept by triggers, so each sees the other's writes.
+Point the scan page at it with SCANNER_URL, and allow that page's origin
+here with SCANNER_ALLOW_ORIGIN.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header
+
+import database
+import migrations
+import stock
+import write_queue
+
+MAX_BODY = 1024 * 1024  # scanner requests are small; anything bigger is refused
+
+
+def load_config():
+    """Settings with their environment variable overrides (names as in inventory_app)"""
+    return {
+        'DATABASE': os.environ.get('DATABASE_PATH', 'inventory.db'),
+        'DATABASE_POOL_SIZE': int(os.environ.get('DATABASE_POOL_SIZE', 5)),  # also the number of read threads
+        'SQLITE_PRAGMAS': {},
+        'WRITE_BATCH_MAX': int(os.environ.get('WRITE_BATCH_MAX', 100)),
+        'WRITE_BATCH_DELAY_MS': float(os.environ.get('WRITE_BATCH_DELAY_MS', 2)),
+        'WRITE_TIMEOUT': 30,  # seconds a request waits for its group to commit
+        'SCAN_BATCH_MAX': 500,
+        'SCANNER_ALLOW_ORIGIN': os.environ.get('SCANNER_ALLOW_ORIGIN', ''),  # CORS origin of the scan page
+    }
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ScannerApp:
+    """ASGI application; build it with create_app()"""
+
+    def __init__(self, config):
+        self.config = config
+        self.pool = database.ConnectionPool(config['DATABASE'], size=config['DATABASE_POOL_SIZE'],
+                                            pragmas=config['SQLITE_PRAGMAS'])
+        self.readers = ThreadPoolExecutor(config['DATABASE_POOL_SIZE'], thread_name_prefix='scanner-read')
+        self.writer = write_queue.WriteQueue(
+            config['DATABASE'],
+            max_batch=config['WRITE_BATCH_MAX'],
+            max_delay=config['WRITE_BATCH_DELAY_MS'] / 1000,
+            pragmas=config['SQLITE_PRAGMAS'],
+        )
+        self.routes = [
+            ('GET', re.compile(r'/api/item/([^/]+)'), self.item),
+            ('POST', re.compile(r'/check_in_out/([^/]+)'), self.check_in_out),
+            ('POST', re.compile(r'/api/scan_batch'), self.scan_batch),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        """Flush queued writes and close every connection"""
+        self.writer.close()
+        self.readers.shutdown()
+        self.pool.close_all()
+
+    async def handle(self, scope, receive, send):
+        if scope['method'] == 'OPTIONS':
+            # CORS preflight (the JSON scan_batch POST needs one)
+            await self.respond(send, 204, None, [(b'access-control-allow-methods', b'GET, POST'),
+                                                 (b'access-control-allow-headers', b'content-type')])
+            return
+
+        methods = []
+        for method, pattern, view in self.routes:
+            match = pattern.fullmatch(scope['path'])
+            if match is None:
+                continue
+            methods.append(method)
+            if method == scope['method']:
+                break
+        else:
+            status, error = (405, 'Method not allowed') if methods else (404, 'Not found')
+            await self.respond(send, status, {'error': error})
+            return
+
+        try:
+            body = await self.read_body(scope, receive) if method == 'POST' else b''
+            status, payload = await view(scope, body, *match.groups())
+        except HTTPError as e:
+            status, payload = e.status, {'error': str(e)}
+        except asyncio.TimeoutError:
+            status, payload = 503, {'error': 'Timed out waiting for the write to commit'}
+        await self.respond(send, status, payload)
+
+    async def read_body(self, scope, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, 'Client disconnected')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY:
+                raise HTTPError(413, 'Request body too large')
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def respond(self, send, status, payload, headers=()):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        response_headers = [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode()), *headers]
+        if self.config['SCANNER_ALLOW_ORIGIN']:
+            response_headers.append((b'access-control-allow-origin', self.config['SCANNER_ALLOW_ORIGIN'].encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _with_connection(self, operation, args):
+        conn = self.pool.acquire()
+        try:
+            return operation(conn.cursor(), *args)
+        finally:
+            self.pool.release(conn)
+
+    async def read(self, operation, *args):
+        """Run ``operation(cursor, *args)`` on a read thread"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.readers, self._with_connection, operation, args)
+
+    async def write(self, operation, *args):
+        """Run ``operation(cursor, *args)`` on the writer; returns once committed.
+
+        A request that times out while its operation is still queued has it
+        cancelled, so the scan is never applied behind the client's back.
+        """
+        future = self.writer.submit(operation, *args)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.config['WRITE_TIMEOUT'])
+
+    async def item(self, scope, body, item_id):
+        item = await self.read(stock.find_item, item_id)
+        if item is None:
+            return 404, {'error': 'Item not found'}
+        return 200, item
+
+    async def check_in_out(self, scope, body, item_id):
+        form = parse_form(scope, body)
+        try:
+            action, quantity = stock.parse_event(form.get('action'), form.get('quantity', 1))
+        except stock.ScanError as e:
+            return 400, {'error': str(e)}
+
+        new_qty = await self.write(stock.apply_movement, item_id, action, quantity,
+                                   form.get('location', ''), form.get('notes', ''))
+        if new_qty is None:
+            return 404, {'error': 'Item not found'}
+        return 200, {'success': True, 'new_quantity': new_qty}
+
+    async def scan_batch(self, scope, body, *groups):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        events = payload.get('events') if isinstance(payload, dict) else payload
+        if not isinstance(events, list):
+            return 400, {'error': 'Expected a JSON body with an "events" list'}
+        if len(events) > self.config['SCAN_BATCH_MAX']:
+            return 413, {'error': f'At most {self.config["SCAN_BATCH_MAX"]} events per batch'}
+
+        results = await self.write(stock.apply_events, events)
+        applied = sum(result['success'] for result in results)
+        return 200, {'applied': applied, 'failed': len(results) - applied, 'results': results}
+
+
+def parse_form(scope, body):
+    """Form fields of a urlencoded or multipart (FormData) body"""
+    content_type = dict(scope['headers']).get(b'content-type', b'').decode('latin-1')
+    mimetype, options = parse_options_header(content_type)
+    _, form, _ = FormDataParser().parse(io.BytesIO(body), mimetype, len(body), options)
+    return form
+
+
+def create_app(config=None):
+    """Build the scanner app; the schema is checked once per process, here"""
+    settings = load_config()
+    settings.update(config or {})
+    conn = database.connect(settings['DATABASE'])
+    try:
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+    return ScannerApp(settings)
+
+
+def __getattr__(name):
+    # ``scanner_asgi:app`` builds the default app when the server first asks for it
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
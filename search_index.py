@@ -0,0 +1,131 @@
+"""FTS5 full-text index over items.id, name and description.
+
+items_fts is an external-content FTS5 table keyed on items.rowid and kept in
+sync by triggers, so it costs only the index itself.  The trigram tokenizer
+makes MATCH a substring search, which covers both "part of a name" and
+"first few characters of an ID".  When the SQLite build has no FTS5/trigram
+support every helper falls back to the old LIKE scan.
+"""
+import sqlite3
+
+MIN_TRIGRAM_LENGTH = 3  # trigram MATCH needs at least one full trigram
+
+# bm25 column weights: an ID hit beats a name hit beats a description hit
+RANK = 'bm25(items_fts, 10.0, 5.0, 1.0)'
+
+TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts (rowid, id, name, description)
+        VALUES (new.rowid, new.id, new.name, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, id, name, description)
+        VALUES ('delete', old.rowid, old.id, old.name, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF id, name, description ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, id, name, description)
+        VALUES ('delete', old.rowid, old.id, old.name, old.description);
+        INSERT INTO items_fts (rowid, id, name, description)
+        VALUES (new.rowid, new.id, new.name, new.description);
+    END
+    ''',
+]
+
+
+def fts_supported(conn):
+    """True if this SQLite build has FTS5 with the trigram tokenizer (3.34+)"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+        conn.execute('DROP TABLE temp.fts_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def is_installed(conn):
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'")
+    return cursor.fetchone() is not None
+
+
+def install(conn):
+    """Create items_fts and its triggers, backfilling existing items once.
+
+    Returns False (and changes nothing) when FTS5 is unavailable.
+    """
+    if not fts_supported(conn):
+        return False
+
+    created = not is_installed(conn)
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+            id, name, description,
+            content='items', content_rowid='rowid', tokenize='trigram'
+        )
+    ''')
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+
+    if created:
+        rebuild(conn)
+    return True
+
+
+def rebuild(conn):
+    """Re-index every item (needed after VACUUM, which may renumber rowids)"""
+    conn.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+
+
+def match_expression(query):
+    """Quote user input as a single FTS5 phrase so operators are taken literally"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def filter_clause(conn, query):
+    """SQL fragment and params restricting ``items`` to rows matching ``query``"""
+    if len(query) >= MIN_TRIGRAM_LENGTH and is_installed(conn):
+        return ('items.rowid IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)',
+                [match_expression(query)])
+    return '(items.name LIKE ? OR items.description LIKE ?)', [f'%{query}%', f'%{query}%']
+
+
+def search(conn, query, location='', category='', limit=50, offset=0):
+    """Items matching ``query``, exact ID first and then by relevance.
+
+    Returns rows of (id, name, description, category, location, quantity).
+    """
+    params = []
+    if query and len(query) >= MIN_TRIGRAM_LENGTH and is_installed(conn):
+        sql = '''
+            SELECT items.id, items.name, items.description, items.category, items.location, items.quantity
+            FROM items_fts JOIN items ON items.rowid = items_fts.rowid
+            WHERE items_fts MATCH ?
+        '''
+        params.append(match_expression(query))
+        order = f'CASE WHEN items.id = ? THEN 0 ELSE 1 END, {RANK}'
+    else:
+        sql = '''
+            SELECT items.id, items.name, items.description, items.category, items.location, items.quantity
+            FROM items WHERE 1=1
+        '''
+        if query:
+            sql += ' AND (items.id = ? OR items.name LIKE ? OR items.description LIKE ?)'
+            params.extend([query, f'%{query}%', f'%{query}%'])
+        order = 'CASE WHEN items.id = ? THEN 0 ELSE 1 END, items.name'
+
+    if location:
+        sql += ' AND items.location = ?'
+        params.append(location)
+
+    if category:
+        sql += ' AND items.category = ?'
+        params.append(category)
+
+    sql += f' ORDER BY {order} LIMIT ? OFFSET ?'
+    params.extend([query, limit, offset])
+
+    return conn.execute(sql, params).fetchall()
@@ -0,0 +1,138 @@
+"""Trigger-maintained inventory statistics.
+
+Every write to items or transactions adjusts a handful of counters in the
+same transaction, so the database info page and /api/stats read a few tiny
+tables instead of aggregating the big ones.  recompute() rebuilds them from
+scratch and reports any drift it corrected.
+"""
+COUNTERS = ['total_items', 'total_transactions', 'total_quantity']
+
+TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_items_insert AFTER INSERT ON items BEGIN
+        UPDATE stats SET value = value + 1 WHERE name = 'total_items';
+        UPDATE stats SET value = value + COALESCE(new.quantity, 0) WHERE name = 'total_quantity';
+        INSERT INTO location_counts (location, items) SELECT new.location, 1 WHERE new.location IS NOT NULL
+            ON CONFLICT (location) DO UPDATE SET items = items + 1;
+        INSERT INTO category_counts (category, items) SELECT new.category, 1 WHERE new.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET items = items + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_items_delete AFTER DELETE ON items BEGIN
+        UPDATE stats SET value = value - 1 WHERE name = 'total_items';
+        UPDATE stats SET value = value - COALESCE(old.quantity, 0) WHERE name = 'total_quantity';
+        UPDATE location_counts SET items = items - 1 WHERE location = old.location;
+        DELETE FROM location_counts WHERE location = old.location AND items <= 0;
+        UPDATE category_counts SET items = items - 1 WHERE category = old.category;
+        DELETE FROM category_counts WHERE category = old.category AND items <= 0;
+    END
+    ''',
+    # Split by column so a check in/out (quantity only) touches one counter
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_items_quantity AFTER UPDATE OF quantity ON items
+    WHEN old.quantity IS NOT new.quantity BEGIN
+        UPDATE stats SET value = value - COALESCE(old.quantity, 0) + COALESCE(new.quantity, 0)
+        WHERE name = 'total_quantity';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_items_location AFTER UPDATE OF location ON items
+    WHEN old.location IS NOT new.location BEGIN
+        UPDATE location_counts SET items = items - 1 WHERE location = old.location;
+        DELETE FROM location_counts WHERE location = old.location AND items <= 0;
+        INSERT INTO location_counts (location, items) SELECT new.location, 1 WHERE new.location IS NOT NULL
+            ON CONFLICT (location) DO UPDATE SET items = items + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_items_category AFTER UPDATE OF category ON items
+    WHEN old.category IS NOT new.category BEGIN
+        UPDATE category_counts SET items = items - 1 WHERE category = old.category;
+        DELETE FROM category_counts WHERE category = old.category AND items <= 0;
+        INSERT INTO category_counts (category, items) SELECT new.category, 1 WHERE new.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET items = items + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_transactions_insert AFTER INSERT ON transactions BEGIN
+        UPDATE stats SET value = value + 1 WHERE name = 'total_transactions';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS stats_transactions_delete AFTER DELETE ON transactions BEGIN
+        UPDATE stats SET value = value - 1 WHERE name = 'total_transactions';
+    END
+    ''',
+]
+
+
+def install(conn):
+    """Create the summary tables and triggers and fill them in"""
+    conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)')
+    conn.execute('CREATE TABLE IF NOT EXISTS location_counts (location TEXT PRIMARY KEY, items INTEGER NOT NULL)')
+    conn.execute('CREATE TABLE IF NOT EXISTS category_counts (category TEXT PRIMARY KEY, items INTEGER NOT NULL)')
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+    recompute(conn)
+
+
+def _actual(conn):
+    """The counters computed the slow way"""
+    return {
+        'total_items': conn.execute('SELECT COUNT(*) FROM items').fetchone()[0],
+        'total_transactions': conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0],
+        'total_quantity': conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM items').fetchone()[0],
+        'unique_locations': conn.execute(
+            'SELECT COUNT(DISTINCT location) FROM items WHERE location IS NOT NULL').fetchone()[0],
+        'unique_categories': conn.execute(
+            'SELECT COUNT(DISTINCT category) FROM items WHERE category IS NOT NULL').fetchone()[0],
+    }
+
+
+def recompute(conn):
+    """Rebuild every counter from the base tables.
+
+    Returns {name: (stored, actual)} for each counter that had drifted.
+    Runs in the caller's transaction, which must hold the write lock from
+    the start (BEGIN IMMEDIATE) so no write lands between the counts and
+    the rewrite; commit afterwards.
+    """
+    before = get_stats(conn) if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats'").fetchone() else {}
+    actual = _actual(conn)
+
+    conn.execute('DELETE FROM stats')
+    conn.executemany('INSERT INTO stats (name, value) VALUES (?, ?)',
+                     [(name, actual[name]) for name in COUNTERS])
+    conn.execute('DELETE FROM location_counts')
+    conn.execute('''
+        INSERT INTO location_counts (location, items)
+        SELECT location, COUNT(*) FROM items WHERE location IS NOT NULL GROUP BY location
+    ''')
+    conn.execute('DELETE FROM category_counts')
+    conn.execute('''
+        INSERT INTO category_counts (category, items)
+        SELECT category, COUNT(*) FROM items WHERE category IS NOT NULL GROUP BY category
+    ''')
+
+    return {name: (before.get(name), value) for name, value in actual.items()
+            if before.get(name) != value}
+
+
+def get_stats(conn):
+    """Current counters: total_items, total_transactions, total_quantity,
+    unique_locations and unique_categories"""
+    result = dict.fromkeys(COUNTERS, 0)
+    result.update(conn.execute('SELECT name, value FROM stats').fetchall())
+    result['unique_locations'] = conn.execute('SELECT COUNT(*) FROM location_counts').fetchone()[0]
+    result['unique_categories'] = conn.execute('SELECT COUNT(*) FROM category_counts').fetchone()[0]
+    return result
+
+
+def filter_values(conn):
+    """(locations, categories) in use, sorted; read from the count tables
+    instead of a DISTINCT scan of items"""
+    locations = [row[0] for row in conn.execute('SELECT location FROM location_counts ORDER BY location')]
+    categories = [row[0] for row in conn.execute('SELECT category FROM category_counts ORDER BY category')]
+    return locations, categories
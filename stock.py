@@ -0,0 +1,131 @@
+"""Inventory write operations, and the item lookup scanners use.
+
+Each operation takes a cursor and runs inside the caller's transaction -
+database.immediate_transaction() or a write_queue.WriteQueue group - so the
+same code serves both write modes.  Check in / check out is a single atomic
+statement: the new quantity is computed by SQLite in the UPDATE itself and
+read back with RETURNING (SQLite 3.35+), so concurrent scans of the same
+item can no longer read the same starting quantity and overwrite each other.
+"""
+from database import ItemIdAllocator
+
+ACTIONS = ('check_in', 'check_out')
+# Far below SQLite's 64-bit limit, so quantity + movement can never overflow it
+MAX_QUANTITY = 10 ** 9
+
+
+class ScanError(ValueError):
+    """A scan event that cannot be applied"""
+
+
+def parse_event(action, quantity=1):
+    """Validate an action/quantity pair; returns (action, int quantity)"""
+    if action not in ACTIONS:
+        raise ScanError(f'action must be one of {", ".join(ACTIONS)}')
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError, OverflowError):  # OverflowError: a JSON 1e400 is infinity
+        raise ScanError('quantity must be a whole number')
+    if quantity < 1:
+        raise ScanError('quantity must be at least 1')
+    if quantity > MAX_QUANTITY:
+        raise ScanError(f'quantity must be at most {MAX_QUANTITY}')
+    return action, quantity
+
+
+def apply_movement(cursor, item_id, action, quantity, location='', notes=''):
+    """Move stock in or out and log the transaction.
+
+    Check-outs stop at zero.  A blank ``location`` keeps the item where it
+    is.  Returns the new quantity, or None if the item does not exist.
+    """
+    cursor.execute('''
+        UPDATE items SET
+            quantity = CASE WHEN ? = 'check_in' THEN quantity + ? ELSE MAX(0, quantity - ?) END,
+            location = COALESCE(NULLIF(?, ''), location),
+            last_updated = CURRENT_TIMESTAMP
+        WHERE id = ?
+        RETURNING quantity, location
+    ''', (action, quantity, quantity, location, item_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    new_quantity, new_location = row
+    cursor.execute('''
+        INSERT INTO transactions (item_id, action, quantity, location, notes)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (item_id, action, quantity, new_location, notes))
+    return new_quantity
+
+
+def find_item(cursor, item_id):
+    """The item as a scanner shows it (a dict), or None if it does not exist"""
+    cursor.execute('SELECT id, name, description, category, location, quantity FROM items WHERE id = ?',
+                   (item_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return {
+        'id': row[0],
+        'name': row[1],
+        'description': row[2] or '',
+        'category': row[3] or '',
+        'location': row[4] or '',
+        'quantity': row[5],
+    }
+
+
+def apply_events(cursor, events):
+    """Apply a list of scan event dicts in order; returns one result per
+    event.  Bad events are reported in their result and skipped."""
+    results = []
+    for index, event in enumerate(events):
+        result = {'index': index}
+        try:
+            if not isinstance(event, dict) or not event.get('item_id'):
+                raise ScanError('item_id is required')
+            item_id = str(event['item_id']).strip()
+            result['item_id'] = item_id
+            action, quantity = parse_event(event.get('action'), event.get('quantity', 1))
+            new_quantity = apply_movement(cursor, item_id, action, quantity,
+                                          str(event.get('location') or ''), str(event.get('notes') or ''))
+            if new_quantity is None:
+                raise ScanError('Item not found')
+            result.update(success=True, new_quantity=new_quantity)
+        except ScanError as e:
+            result.update(success=False, error=str(e))
+        results.append(result)
+    return results
+
+
+def add_item(cursor, name, description='', category='', location='', quantity=1):
+    """Create an item with the next sequential ID and log it; returns the ID"""
+    item_id = ItemIdAllocator(cursor).reserve(1)[0]
+
+    cursor.execute('''
+        INSERT INTO items (id, name, description, category, location, quantity)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (item_id, name, description, category, location, quantity))
+
+    cursor.execute('''
+        INSERT INTO transactions (item_id, action, quantity, location, notes)
+        VALUES (?, 'added', ?, ?, 'Item added to inventory')
+    ''', (item_id, quantity, location))
+    return item_id
+
+
+def delete_item(cursor, item_id):
+    """Delete an item and its history; returns its name, or None if missing"""
+    cursor.execute('SELECT name FROM items WHERE id = ?', (item_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    # Delete from transactions first (foreign key constraint); archived
+    # history stays in its monthly partition, only the rollups go
+    cursor.execute('DELETE FROM transactions WHERE item_id = ?', (item_id,))
+    cursor.execute('DELETE FROM transaction_rollups WHERE item_id = ?', (item_id,))
+    cursor.execute('DELETE FROM stock_snapshot_items WHERE item_id = ?', (item_id,))
+    cursor.execute('DELETE FROM items WHERE id = ?', (item_id,))
+    return row[0]
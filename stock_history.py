@@ -0,0 +1,300 @@
+"""Point-in-time stock levels from periodic snapshots plus log replay.
+
+Only the current quantity is stored on an item; what was on hand at an
+earlier time is rebuilt by replaying the transactions log: "added" sets
+the quantity, check_in adds, check_out subtracts and stops at zero (as
+stock.apply_movement does), and each row records where the item was
+afterwards.  Timestamps are UTC, as written by CURRENT_TIMESTAMP.
+
+To keep that replay short, the snapshot builder checkpoints every item's
+quantity and location at fixed boundaries (every SNAPSHOT_INTERVAL_DAYS,
+at midnight UTC).  A checkpoint holds the state after every transaction
+stamped at or before its ``taken_at``; a query loads the nearest one at or
+before the requested time and replays only the transactions after it,
+reading archive partitions (archive.py) for any that have been archived.
+
+    python stock_history.py build [--db PATH] [--days N]
+    python stock_history.py list
+    python stock_history.py check [--samples N]   # snapshots vs full replay
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+import archive
+
+# Boundaries are counted from a Monday, so weekly checkpoints fall on Mondays
+ANCHOR = datetime(2000, 1, 3)
+# Writes commit within moments of their CURRENT_TIMESTAMP; stay clear of in-flight ones
+SETTLE = timedelta(minutes=5)
+IN_CHUNK = 500
+FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def install(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            id INTEGER PRIMARY KEY,
+            taken_at TEXT NOT NULL UNIQUE,
+            items INTEGER NOT NULL,
+            replayed INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_snapshot_items (
+            snapshot_id INTEGER NOT NULL REFERENCES stock_snapshots (id),
+            item_id TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            location TEXT NOT NULL,
+            PRIMARY KEY (snapshot_id, item_id)
+        ) WITHOUT ROWID
+    ''')
+    # Covering (item_id rides along as part of the key), so a location lookup never touches the table
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_items_location '
+                 'ON stock_snapshot_items (snapshot_id, location, quantity)')
+
+
+def install_versions(conn):
+    """Count checkpoint writes in data_versions, so /api/stock ETags (which
+    carry the snapshot used) change when checkpoints are built or dropped"""
+    conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('stock_snapshots', 0)")
+    for event in ('INSERT', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS versions_stock_snapshots_{event.lower()}
+            AFTER {event} ON stock_snapshots BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'stock_snapshots';
+            END
+        ''')
+
+
+def clear(conn):
+    """Drop every checkpoint (after the log was replaced wholesale)"""
+    conn.execute('DELETE FROM stock_snapshot_items')
+    conn.execute('DELETE FROM stock_snapshots')
+
+
+def forget_deleted(conn):
+    """Drop checkpointed rows of items that no longer exist (as delete_item does)"""
+    conn.execute('DELETE FROM stock_snapshot_items WHERE item_id NOT IN (SELECT id FROM items)')
+
+
+def apply(state, item_id, action, quantity, location):
+    """Replay one transaction onto ``state`` ({item_id: (quantity, location)})"""
+    current = state.get(item_id, (0, ''))[0]
+    quantity = quantity or 0
+    if action == 'added':
+        current = quantity
+    elif action == 'check_in':
+        current += quantity
+    elif action == 'check_out':
+        current = max(0, current - quantity)
+    state[item_id] = (current, location or '')
+
+
+def transactions(conn, after, until, item_id=None, archive_dir=None):
+    """(item_id, action, quantity, location) of every transaction stamped in
+    (``after``, ``until``] (``after`` None: from the start), in replay order,
+    from the archive partitions and the live table"""
+    where = 'timestamp <= ?'
+    params = [until]
+    if after:
+        where += ' AND timestamp > ?'
+        params.append(after)
+    if item_id:
+        where += ' AND item_id = ?'
+        params.append(item_id)
+    sql = f'SELECT id, timestamp, item_id, action, quantity, location FROM {{table}} WHERE {where}'
+
+    rows = {}
+    if archive_dir:
+        if item_id:
+            months = archive.item_months(conn, item_id, until, since=after)
+        else:
+            months = [month for month, _, _ in archive.partitions(conn)
+                      if month <= until[:7] and (after is None or month >= after[:7])]
+        # delete_item removes live history only; skip what its partitions still hold
+        archived = sql.format(table='archive.transactions') + ' AND item_id IN (SELECT id FROM main.items)'
+        for _ in archive.each_partition(conn, archive_dir, months):
+            rows.update((row[0], row) for row in conn.execute(archived, params))
+    # A row caught between its copy and its delete by archival is in both; keyed by id it counts once
+    rows.update((row[0], row) for row in conn.execute(sql.format(table='main.transactions'), params))
+    return [row[2:] for row in sorted(rows.values(), key=lambda row: (row[1], row[0]))]
+
+
+def nearest_snapshot(conn, at):
+    """(id, taken_at) of the latest checkpoint at or before ``at``, or None"""
+    return conn.execute('SELECT id, taken_at FROM stock_snapshots WHERE taken_at <= ? '
+                        'ORDER BY taken_at DESC LIMIT 1', (at,)).fetchone()
+
+
+def _snapshot_rows(conn, snapshot_id, item_ids):
+    item_ids = list(item_ids)
+    for start in range(0, len(item_ids), IN_CHUNK):
+        chunk = item_ids[start:start + IN_CHUNK]
+        yield from conn.execute(f'''
+            SELECT item_id, quantity, location FROM stock_snapshot_items
+            WHERE snapshot_id = ? AND item_id IN ({", ".join("?" * len(chunk))})
+        ''', [snapshot_id] + chunk)
+
+
+def stock_at(conn, at, item_id=None, location=None, archive_dir=None):
+    """Stock levels as of ``at`` for one item, or for every item that was at
+    ``location``.
+
+    Returns (snapshot taken_at or None, transactions replayed,
+    {item_id: (quantity, location)}).  Items without any history by ``at``
+    are left out.
+    """
+    snapshot = nearest_snapshot(conn, at)
+    after = snapshot[1] if snapshot else None
+    rows = transactions(conn, after, at, item_id=item_id, archive_dir=archive_dir)
+
+    state = {}
+    if snapshot:
+        if item_id:
+            state.update((row[0], row[1:]) for row in _snapshot_rows(conn, snapshot[0], [item_id]))
+        else:
+            state.update((row[0], row[1:]) for row in conn.execute(
+                'SELECT item_id, quantity, location FROM stock_snapshot_items '
+                'WHERE snapshot_id = ? AND location = ?', (snapshot[0], location or '')))
+            # Items that moved in or out of the location since the checkpoint
+            touched = {row[0] for row in rows} - set(state)
+            state.update((row[0], row[1:]) for row in _snapshot_rows(conn, snapshot[0], touched))
+
+    for row in rows:
+        apply(state, *row)
+
+    if not item_id:
+        state = {key: value for key, value in state.items() if value[1] == (location or '')}
+    return after, len(rows), state
+
+
+def full_replay(conn, at, archive_dir=None):
+    """Every item's state as of ``at`` from the whole log, ignoring checkpoints"""
+    state = {}
+    for row in transactions(conn, None, at, archive_dir=archive_dir):
+        apply(state, *row)
+    return state
+
+
+def boundaries(start, end, interval_days):
+    """Checkpoint times after ``start`` up to ``end`` (datetimes), in order"""
+    step = timedelta(days=interval_days)
+    boundary = ANCHOR + ((start - ANCHOR) // step + 1) * step
+    while boundary <= end:
+        yield boundary
+        boundary += step
+
+
+def build_snapshots(db_path, interval_days=7, archive_dir=None, now=None):
+    """Add the checkpoints missing between the latest one and now; returns
+    [(taken_at, items, replayed)] for each one written.
+
+    Each is built from the previous checkpoint plus the transactions in
+    between, so a run only replays what happened since the last one.
+    Boundaries with no transactions since the previous checkpoint are
+    skipped: the earlier checkpoint already answers for them.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None) - SETTLE
+    conn = sqlite3.connect(db_path, timeout=30)
+    written = []
+    try:
+        latest = conn.execute('SELECT id, taken_at FROM stock_snapshots ORDER BY taken_at DESC LIMIT 1').fetchone()
+        state = {}
+        if latest:
+            state.update((row[0], row[1:]) for row in conn.execute(
+                'SELECT item_id, quantity, location FROM stock_snapshot_items WHERE snapshot_id = ?', (latest[0],)))
+            start = datetime.strptime(latest[1], FORMAT)
+        else:
+            first = [conn.execute('SELECT MIN(timestamp) FROM transactions').fetchone()[0]]
+            first += [f'{month}-01 00:00:00' for month, _, _ in archive.partitions(conn)[:1]]
+            first = [value for value in first if value]
+            if not first:
+                return written
+            start = datetime.strptime(min(first)[:19], FORMAT) - timedelta(seconds=1)
+
+        after = latest[1] if latest else None
+        for boundary in boundaries(start, now, interval_days):
+            taken_at = boundary.strftime(FORMAT)
+            rows = transactions(conn, after, taken_at, archive_dir=archive_dir)
+            if not rows:
+                continue
+            for row in rows:
+                apply(state, *row)
+
+            cursor = conn.execute('INSERT INTO stock_snapshots (taken_at, items, replayed) VALUES (?, ?, ?)',
+                                  (taken_at, len(state), len(rows)))
+            conn.executemany('INSERT INTO stock_snapshot_items (snapshot_id, item_id, quantity, location) '
+                             'VALUES (?, ?, ?, ?)',
+                             [(cursor.lastrowid, key, quantity, location)
+                              for key, (quantity, location) in state.items()])
+            conn.commit()
+            written.append((taken_at, len(state), len(rows)))
+            after = taken_at
+    finally:
+        conn.close()
+    return written
+
+
+def check(conn, samples=20, archive_dir=None, seed=0):
+    """Compare snapshot-backed answers with a full replay at ``samples``
+    random times; returns a list of mismatch descriptions (empty if none)"""
+    span = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM transactions').fetchone()
+    months = archive.partitions(conn)
+    if months:
+        span = (f'{months[0][0]}-01 00:00:00', span[1] or f'{months[-1][0]}-28 23:59:59')
+    if not span[0]:
+        return []
+
+    rng = random.Random(seed)
+    start = datetime.strptime(span[0][:19], FORMAT)
+    seconds = int((datetime.strptime(span[1][:19], FORMAT) - start).total_seconds()) + 1
+    problems = []
+    for _ in range(samples):
+        at = (start + timedelta(seconds=rng.randrange(seconds))).strftime(FORMAT)
+        expected = full_replay(conn, at, archive_dir)
+        for item_id in rng.sample(sorted(expected), min(5, len(expected))):
+            _, _, got = stock_at(conn, at, item_id=item_id, archive_dir=archive_dir)
+            if got.get(item_id) != expected[item_id]:
+                problems.append(f'{at} item {item_id}: {got.get(item_id)} != {expected[item_id]}')
+        for location in {value[1] for value in expected.values()}:
+            _, _, got = stock_at(conn, at, location=location, archive_dir=archive_dir)
+            want = {key: value for key, value in expected.items() if value[1] == location}
+            if got != want:
+                problems.append(f'{at} location {location!r}: {len(got)} items != {len(want)}')
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Point-in-time stock snapshots')
+    parser.add_argument('command', choices=['build', 'list', 'check'])
+    parser.add_argument('--db', default=os.environ.get('DATABASE_PATH', 'inventory.db'))
+    parser.add_argument('--archive-dir', default=os.environ.get('ARCHIVE_DIR', 'archive'))
+    parser.add_argument('--days', type=int, default=int(os.environ.get('SNAPSHOT_INTERVAL_DAYS', 7)),
+                        help='build: days between checkpoints')
+    parser.add_argument('--samples', type=int, default=20, help='check: random times to compare')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        written = build_snapshots(args.db, args.days, args.archive_dir)
+        for taken_at, items, replayed in written:
+            print(f'{taken_at}  {items:>8} items  {replayed:>8} transactions replayed')
+        if not written:
+            print('Snapshots are up to date')
+    elif args.command == 'list':
+        conn = sqlite3.connect(args.db)
+        for taken_at, items, replayed in conn.execute(
+                'SELECT taken_at, items, replayed FROM stock_snapshots ORDER BY taken_at'):
+            print(f'{taken_at}  {items:>8} items  {replayed:>8} transactions replayed')
+        conn.close()
+    else:
+        conn = sqlite3.connect(args.db)
+        problems = check(conn, args.samples, args.archive_dir)
+        conn.close()
+        for problem in problems:
+            print(problem)
+        print(f'{len(problems)} mismatches against a full replay')
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated, empty inventory database"""
+    path = str(tmp_path / 'inventory.db')
+    conn = database.connect(path)
+    migrations.migrate(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def client(db_path, tmp_path):
+    import inventory_app
+    app = inventory_app.create_app({
+        'DATABASE': db_path,
+        'TESTING': True,
+        'BACKUP_SCHEDULER': False,
+        'BACKUP_DIR': str(tmp_path / 'backups'),
+        'ARCHIVE_DIR': str(tmp_path / 'archive'),
+        'QR_CACHE_DIR': str(tmp_path / 'qr_cache'),
+    })
+    return app.test_client()
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import zipfile
+
+import backup_scheduler
+import backups
+import database
+import stock
+
+
+def _write(db_path, operation, *args):
+    conn = database.connect(db_path)
+    try:
+        with database.immediate_transaction(conn):
+            return operation(conn.cursor(), *args)
+    finally:
+        conn.close()
+
+
+def _quantities(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute('SELECT id, quantity FROM items ORDER BY id').fetchall())
+    finally:
+        conn.close()
+
+
+def _zip_backup(db_path, zip_path):
+    snapshot_path = backups.snapshot(db_path)
+    with zipfile.ZipFile(zip_path, 'w') as zf:
+        zf.write(snapshot_path, 'inventory.db')
+    os.remove(snapshot_path)
+
+
+def test_incremental_after_restore_starts_a_new_chain(db_path, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    os.makedirs(backup_dir)
+    item_id = _write(db_path, stock.add_item, 'Drill', '', '', '', 5)
+    backup_scheduler.take_full(db_path, backup_dir)
+    _zip_backup(db_path, str(tmp_path / 'manual.zip'))
+
+    for _ in range(10):
+        _write(db_path, stock.apply_movement, item_id, 'check_in', 1)
+    assert backup_scheduler.take_incremental(db_path, backup_dir)['kind'] == 'incremental'
+
+    backups.restore_archive(db_path, str(tmp_path / 'manual.zip'))
+    # Enough writes to carry the restored log past the chain's last seq
+    for _ in range(12):
+        _write(db_path, stock.apply_movement, item_id, 'check_in', 1)
+    _write(db_path, stock.add_item, 'Saw', '', '', '', 3)
+
+    entry = backup_scheduler.take_incremental(db_path, backup_dir)
+    assert entry['kind'] == 'full'
+
+    target = str(tmp_path / 'rebuilt.db')
+    backup_scheduler.restore_chain(backup_dir, target)
+    assert _quantities(target) == _quantities(db_path)
+
+    _write(db_path, stock.apply_movement, item_id, 'check_out', 4)
+    assert backup_scheduler.take_incremental(db_path, backup_dir)['kind'] == 'incremental'
+    backup_scheduler.restore_chain(backup_dir, target)
+    assert _quantities(target) == _quantities(db_path)
+
+
+def _change_log_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_change_log_stays_empty_without_a_backup_chain(db_path):
+    item_id = _write(db_path, stock.add_item, 'Drill', '', '', '', 5)
+    for _ in range(50):
+        _write(db_path, stock.apply_movement, item_id, 'check_in', 1)
+    assert _change_log_rows(db_path) == 0
+
+
+def test_change_log_is_trimmed_by_each_backup(db_path, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    os.makedirs(backup_dir)
+    item_id = _write(db_path, stock.add_item, 'Drill', '', '', '', 5)
+    backup_scheduler.take_full(db_path, backup_dir)
+
+    for round_number in range(3):
+        for _ in range(20):
+            _write(db_path, stock.apply_movement, item_id, 'check_in', 1)
+        assert _change_log_rows(db_path) == 40  # one items and one transactions row per scan
+        assert backup_scheduler.take_incremental(db_path, backup_dir)['kind'] == 'incremental'
+        assert _change_log_rows(db_path) == 0
+
+
+def test_missing_change_log_triggers_start_a_new_chain(db_path, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    os.makedirs(backup_dir)
+    item_id = _write(db_path, stock.add_item, 'Drill', '', '', '', 5)
+    backup_scheduler.take_full(db_path, backup_dir)
+
+    conn = sqlite3.connect(db_path)
+    for name in backup_scheduler.CHANGE_LOG_TRIGGERS:
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.commit()
+    conn.close()
+    _write(db_path, stock.apply_movement, item_id, 'check_in', 3)
+
+    assert backup_scheduler.take_incremental(db_path, backup_dir)['kind'] == 'full'
+    target = str(tmp_path / 'rebuilt.db')
+    backup_scheduler.restore_chain(backup_dir, target)
+    assert _quantities(target) == _quantities(db_path)
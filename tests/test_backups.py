@@ -0,0 +1,33 @@
+import glob
+import io
+import os
+import tempfile
+import zipfile
+
+
+def _snapshots():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), 'inventory_snapshot_*.db')))
+
+
+def test_backup_snapshot_removed_when_body_never_sent(client):
+    client.post('/add_item', data={'name': 'Drill', 'quantity': '5'})
+    before = _snapshots()
+
+    response = client.head('/backup_database')
+    assert response.status_code == 200
+    response.close()
+    response = client.get('/backup_database', buffered=False)
+    response.close()  # client gone before the first chunk
+
+    assert _snapshots() == before
+
+
+def test_backup_download_contains_database(client):
+    client.post('/add_item', data={'name': 'Drill', 'quantity': '5'})
+    before = _snapshots()
+
+    response = client.get('/backup_database')
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert {'inventory.db', 'items_backup.csv', 'manifest.json'} <= set(zf.namelist())
+
+    assert _snapshots() == before
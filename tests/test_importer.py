@@ -0,0 +1,30 @@
+import sqlite3
+
+import pytest
+
+import database
+import importer
+
+
+def test_parse_row_rejects_out_of_range_quantity():
+    with pytest.raises(importer.RowError):
+        importer.parse_row({'name': 'Drill', 'quantity': '99999999999999999999'})
+    assert importer.parse_row({'name': 'Drill', 'quantity': 'lots'})[4] == 1
+
+
+def test_import_skips_only_the_out_of_range_row(db_path, tmp_path):
+    path = tmp_path / 'upload.csv'
+    path.write_text('name,quantity\nDrill,3\nSaw,99999999999999999999\nHammer,2\n')
+    conn = sqlite3.connect(db_path)
+    job_id = importer.create_job(conn, 'upload.csv')
+
+    pool = database.ConnectionPool(db_path, size=1)
+    importer.CSVImport(pool, job_id, str(path), chunk_size=10).run()
+    pool.close_all()
+
+    job = importer.get_job(conn, job_id)
+    assert job['status'] == 'done'
+    assert job['items_added'] == 2
+    assert [error['row'] for error in job['errors']] == [3]
+    assert dict(conn.execute('SELECT name, quantity FROM items').fetchall()) == {'Drill': 3, 'Hammer': 2}
+    conn.close()
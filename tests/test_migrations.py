@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+
+@pytest.fixture(scope='module')
+def plans(tmp_path_factory):
+    conn = sqlite3.connect(str(tmp_path_factory.mktemp('plans') / 'inventory.db'))
+    migrations.migrate(conn)
+    results = {name: (ok, plan) for name, ok, plan in migrations.check_query_plans(conn)}
+    conn.close()
+    return results
+
+
+def test_migrate_reaches_schema_version(db_path):
+    conn = sqlite3.connect(db_path)
+    assert migrations.current_version(conn) == migrations.SCHEMA_VERSION
+    assert migrations.migrate(conn) == []
+    conn.close()
+
+
+@pytest.mark.parametrize('name, index', [(name, index) for name, index, _ in migrations.HOT_QUERIES])
+def test_hot_query_uses_its_index(plans, name, index):
+    ok, plan = plans[name]
+    assert ok, f'{name} should use {index}: {plan}'
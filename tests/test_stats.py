@@ -0,0 +1,25 @@
+import database
+import stats
+import stock
+
+
+def _distinct(conn, column):
+    return sorted(row[0] for row in conn.execute(f'SELECT DISTINCT {column} FROM items WHERE {column} IS NOT NULL'))
+
+
+def test_filter_values_follow_item_writes(db_path):
+    conn = database.connect(db_path)
+    with database.immediate_transaction(conn):
+        cursor = conn.cursor()
+        drill = stock.add_item(cursor, 'Drill', category='Tools', location='Garage')
+        stock.add_item(cursor, 'Saw', category='Tools', location='Shed')
+        stock.add_item(cursor, 'Paint', category='Supplies', location='Garage')
+    assert stats.filter_values(conn) == (['Garage', 'Shed'], ['Supplies', 'Tools'])
+
+    with database.immediate_transaction(conn):
+        stock.apply_movement(conn.cursor(), drill, 'check_in', 1, 'Attic')
+        stock.delete_item(conn.cursor(), drill)
+    locations, categories = stats.filter_values(conn)
+    assert locations == _distinct(conn, 'location') == ['Garage', 'Shed']
+    assert categories == _distinct(conn, 'category') == ['Supplies', 'Tools']
+    conn.close()
@@ -0,0 +1,45 @@
+import pytest
+
+import database
+import stock
+
+
+def test_parse_event_rejects_out_of_range_quantity():
+    with pytest.raises(stock.ScanError):
+        stock.parse_event('check_in', 10 ** 20)
+    with pytest.raises(stock.ScanError):
+        stock.parse_event('check_in', float('inf'))
+    assert stock.parse_event('check_in', stock.MAX_QUANTITY) == ('check_in', stock.MAX_QUANTITY)
+
+
+def test_batch_skips_out_of_range_quantity(db_path):
+    conn = database.connect(db_path)
+    with database.immediate_transaction(conn):
+        item_id = stock.add_item(conn.cursor(), 'Drill', quantity=5)
+
+    with database.immediate_transaction(conn):
+        results = stock.apply_events(conn.cursor(), [
+            {'item_id': item_id, 'action': 'check_in', 'quantity': 2},
+            {'item_id': item_id, 'action': 'check_in', 'quantity': 10 ** 20},
+            {'item_id': item_id, 'action': 'check_out', 'quantity': 1},
+        ])
+
+    assert [result['success'] for result in results] == [True, False, True]
+    assert 'at most' in results[1]['error']
+    assert conn.execute('SELECT quantity FROM items WHERE id = ?', (item_id,)).fetchone()[0] == 6
+    conn.close()
+
+
+def test_scan_batch_route_reports_out_of_range_quantity(client):
+    client.post('/add_item', data={'name': 'Drill', 'quantity': '5'})
+    response = client.post('/api/scan_batch', json={'events': [
+        {'item_id': 'P0000001', 'action': 'check_in', 'quantity': 10 ** 20},
+        {'item_id': 'P0000001', 'action': 'check_in', 'quantity': 3},
+    ]})
+    assert response.status_code == 200
+    assert response.json['applied'] == 1
+    assert response.json['failed'] == 1
+    assert response.json['results'][1]['new_quantity'] == 8
+
+    response = client.post('/check_in_out/P0000001', data={'action': 'check_out', 'quantity': str(10 ** 20)})
+    assert response.status_code == 400
@@ -0,0 +1,132 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive
+import stock_history
+
+ITEMS = [f'P{number:07d}' for number in range(1, 9)]
+LOCATIONS = ['Garage', 'Shed', '']
+START = datetime(2024, 1, 1, 9, 0, 0)
+
+
+def _seed(db_path):
+    """Items with half a year of history at known times"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO items (id, name, quantity) VALUES (?, ?, 0)',
+                     [(item_id, f'item {item_id}') for item_id in ITEMS])
+    rows = []
+    at = START
+    for item_id in ITEMS[:-1]:  # the last item only appears in June
+        rows.append((item_id, 'added', rng.randint(0, 5), rng.choice(LOCATIONS), at))
+        at += timedelta(hours=5)
+    while at < datetime(2024, 6, 30):
+        rows.append((rng.choice(ITEMS[:-1]), rng.choice(['check_in', 'check_out']), rng.randint(1, 4),
+                     rng.choice(LOCATIONS), at))
+        at += timedelta(hours=rng.randint(1, 30))
+    rows.append((ITEMS[-1], 'added', 9, 'Shed', datetime(2024, 6, 12, 8, 0, 0)))
+    conn.executemany('INSERT INTO transactions (item_id, action, quantity, location, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     [row[:4] + (row[4].strftime(stock_history.FORMAT),) for row in rows])
+    conn.commit()
+    conn.close()
+
+
+def _times(conn):
+    """Before the first checkpoint, exactly at checkpoints, between them and after the last"""
+    taken = [row[0] for row in conn.execute('SELECT taken_at FROM stock_snapshots ORDER BY taken_at')]
+    first = datetime.strptime(taken[0], stock_history.FORMAT)
+    times = [(START + timedelta(hours=3)).strftime(stock_history.FORMAT),
+             (first - timedelta(hours=1)).strftime(stock_history.FORMAT)]
+    for taken_at in (taken[0], taken[len(taken) // 2], taken[-1]):
+        moment = datetime.strptime(taken_at, stock_history.FORMAT)
+        times += [taken_at, (moment + timedelta(days=3, hours=7)).strftime(stock_history.FORMAT)]
+    times.append('2024-06-12 08:00:00')  # the same second as the last item's first row
+    return times
+
+
+@pytest.fixture(params=['live', 'archived before build', 'archived after build'])
+def history(request, db_path, tmp_path):
+    """(connection, archive dir, {time: full replay of the untouched log})"""
+    _seed(db_path)
+    archive_dir = str(tmp_path / 'archive')
+    conn = sqlite3.connect(db_path)
+    # Expected answers come from the log before anything is archived or checkpointed
+    probe = sqlite3.connect(db_path)
+    stock_history.build_snapshots(db_path, 7, now=datetime(2024, 7, 1))
+    times = _times(probe)
+    stock_history.clear(probe)
+    probe.commit()
+    expected = {at: stock_history.full_replay(probe, at) for at in times}
+    probe.close()
+
+    def archive_old():
+        moved = archive.archive_transactions(db_path, archive_dir, 60, now=datetime(2024, 6, 30))
+        assert moved
+
+    if request.param == 'archived before build':
+        archive_old()
+    stock_history.build_snapshots(db_path, 7, archive_dir, now=datetime(2024, 7, 1))
+    if request.param == 'archived after build':
+        archive_old()
+    yield conn, archive_dir, expected
+    conn.close()
+
+
+def test_apply_follows_apply_movement():
+    state = {}
+    stock_history.apply(state, 'P1', 'added', 3, 'Shed')
+    stock_history.apply(state, 'P1', 'check_out', 5, 'Shed')
+    assert state['P1'] == (0, 'Shed')
+    stock_history.apply(state, 'P1', 'check_in', 2, None)
+    assert state['P1'] == (2, '')
+
+
+def test_item_queries_match_full_replay(history):
+    conn, archive_dir, expected = history
+    for at, state in expected.items():
+        for item_id in ITEMS:
+            _, _, got = stock_history.stock_at(conn, at, item_id=item_id, archive_dir=archive_dir)
+            want = {item_id: state[item_id]} if item_id in state else {}
+            assert got == want, (at, item_id)
+
+
+def test_location_queries_match_full_replay(history):
+    conn, archive_dir, expected = history
+    for at, state in expected.items():
+        for location in LOCATIONS:
+            _, _, got = stock_history.stock_at(conn, at, location=location, archive_dir=archive_dir)
+            assert got == {key: value for key, value in state.items() if value[1] == location}, (at, location)
+
+
+def test_queries_start_from_the_nearest_checkpoint(history):
+    conn, archive_dir, _ = history
+    taken = [row[0] for row in conn.execute('SELECT taken_at FROM stock_snapshots ORDER BY taken_at')]
+    assert len(taken) > 10
+
+    snapshot, replayed, _ = stock_history.stock_at(conn, taken[5], location='Shed', archive_dir=archive_dir)
+    assert (snapshot, replayed) == (taken[5], 0)
+    snapshot, _, _ = stock_history.stock_at(conn, '2024-01-01 10:00:00', location='Shed', archive_dir=archive_dir)
+    assert snapshot is None
+
+
+def test_check_finds_no_mismatch(history):
+    conn, archive_dir, _ = history
+    assert stock_history.check(conn, samples=10, archive_dir=archive_dir) == []
+
+
+def test_api_stock_etag_changes_with_checkpoints(client, db_path):
+    _seed(db_path)
+    url = '/api/stock?at=2024-03-20&location=Shed'
+    first = client.get(url)
+    assert first.status_code == 200 and first.json['snapshot'] is None
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    stock_history.build_snapshots(db_path, 7, now=datetime(2024, 7, 1))
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.json['snapshot'] == '2024-03-18 00:00:00'
+    assert second.json['items'] == first.json['items']
@@ -0,0 +1,189 @@
+"""Group commit: one writer thread commits many requests' writes per fsync.
+
+Request threads submit an operation - a function taking a cursor - and get
+a Future back.  The writer drains whatever is queued (waiting at most
+``max_delay`` for more), runs each operation in its own SAVEPOINT inside
+one BEGIN IMMEDIATE transaction, commits once with synchronous=FULL and
+only then resolves the futures.  Under load many scans share one disk
+sync; a failing operation is rolled back to its savepoint without taking
+the rest of its group with it.
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from database import connect
+
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+# Group commits are only worth it if each commit is actually durable
+WRITER_PRAGMAS = {'synchronous': 'FULL'}
+
+
+class WriteQueue:
+    """Dedicated writer thread for one database file (started lazily)"""
+
+    def __init__(self, path, max_batch=100, max_delay=0.002, pragmas=None, factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pragmas = dict(pragmas or {}, **WRITER_PRAGMAS)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._metrics_lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._batches = 0
+        self._operations = 0
+        self._failed = 0
+        self._commit_seconds = 0.0
+        self._max_commit_seconds = 0.0
+        self._latencies = deque(maxlen=1000)  # recent commit latencies
+        self._batch_sizes = dict.fromkeys(BATCH_SIZE_BUCKETS + ['+Inf'], 0)
+
+    def _ensure_started(self):
+        # A thread does not survive fork(), so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+                atexit.register(self.close)
+
+    def submit(self, operation, *args):
+        """Queue ``operation(cursor, *args)``; the Future resolves to its
+        return value once the group it ran in has been committed"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, operation, args))
+        return future
+
+    def close(self, timeout=10):
+        """Flush everything already queued and stop the writer"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _next_batch(self, first):
+        """``first`` plus whatever else arrives within max_delay, up to
+        max_batch; the second value is True once close() was requested"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = connect(self.path, self.pragmas, factory=self.factory)
+        conn.isolation_level = None  # BEGIN/SAVEPOINT/COMMIT issued by hand
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stopping = self._next_batch(first)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        started = time.monotonic()
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, operation, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    outcomes.append(None)
+                    continue
+                conn.execute('SAVEPOINT operation')
+                try:
+                    result = operation(conn.cursor(), *args)
+                    conn.execute('RELEASE operation')
+                    outcomes.append((True, result))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO operation')
+                    conn.execute('RELEASE operation')
+                    outcomes.append((False, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            # The whole group is lost: fail every operation that was waiting on it
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for future, operation, args in batch:
+                if not future.done():
+                    future.set_exception(e)
+            self._record(len(batch), len(batch), time.monotonic() - started)
+            return
+
+        elapsed = time.monotonic() - started
+        failed = 0
+        for (future, operation, args), outcome in zip(batch, outcomes):
+            if outcome is None:
+                continue
+            ok, value = outcome
+            if ok:
+                future.set_result(value)
+            else:
+                failed += 1
+                future.set_exception(value)
+        self._record(len(batch), failed, elapsed)
+
+    def _record(self, size, failed, seconds):
+        with self._metrics_lock:
+            self._batches += 1
+            self._operations += size
+            self._failed += failed
+            self._commit_seconds += seconds
+            self._max_commit_seconds = max(self._max_commit_seconds, seconds)
+            self._latencies.append(seconds)
+            bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), '+Inf')
+            self._batch_sizes[bucket] += 1
+
+    def metrics(self):
+        """Batch size and commit latency figures for this worker process"""
+        with self._metrics_lock:
+            latencies = sorted(self._latencies)
+            batches = self._batches
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+            return {
+                'batches': batches,
+                'operations': self._operations,
+                'failed_operations': self._failed,
+                'queued': self._queue.qsize() if self._thread else 0,
+                'avg_batch_size': round(self._operations / batches, 2) if batches else 0.0,
+                'batch_size_histogram': {str(bucket): count for bucket, count in self._batch_sizes.items()},
+                'avg_commit_ms': round(self._commit_seconds / batches * 1000, 3) if batches else 0.0,
+                'max_commit_ms': round(self._max_commit_seconds * 1000, 3),
+                'p50_commit_ms': percentile(0.50),
+                'p95_commit_ms': percentile(0.95),
+                'p99_commit_ms': percentile(0.99),
+            }